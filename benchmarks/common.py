@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+"""
+Helpers shared by the benchmarks: a workload of idle processes and
+threads, and a syswit collect run measured from the outside.
+
+syswit is imported and run from PYTHONPATH, so the same benchmark runs
+against any checkout of the tree (see README.md).
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import resource
+import subprocess
+
+workload_code = """
+import os, sys, time, threading
+processes, threads = int(sys.argv[1]), int(sys.argv[2])
+r, w = os.pipe()
+for _ in range(processes):
+    if os.fork() == 0:
+        for _ in range(threads):
+            threading.Thread(target=time.sleep, args=(3600,), daemon=True).start()
+        os.write(w, b"x")
+        time.sleep(3600)
+        os._exit(0)
+for _ in range(processes):
+    os.read(r, 1)
+print("ready", flush=True)
+time.sleep(3600)
+"""
+
+
+class workload:
+    """
+    Root process with processes children of threads threads each, all
+    sleeping, so collection cost only depends on the files to read.
+    """
+
+    def __init__(self, processes, threads=0):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-c", workload_code, str(processes), str(threads)],
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.proc.stdout.readline()
+        self.pid = self.proc.pid
+
+    def close(self):
+        os.killpg(self.pid, signal.SIGKILL)
+        self.proc.wait()
+
+
+def collect(pid, log_dir, samples, period, *args):
+    """
+    @params pid: int
+        pid collected
+    @params log_dir: str
+        -l of collect, results are loaded from its run directory
+    @params args: str
+        other collect options
+
+    @return (dict, float, float)
+        results, wall and cpu seconds of the run (collector and the
+        processes it forked and waited for)
+    """
+    cmd = [sys.executable, "-m", "syswit.main", "collect"]
+    cmd += ["-p", str(pid), "-n", str(samples), "-s", str(period), "-l", log_dir]
+    # the workload is reused by the next run
+    cmd += ["--keep-workload-alive"]
+    cmd += list(args)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.monotonic()
+    # run from log_dir, so syswit comes from PYTHONPATH and not the cwd
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, cwd=log_dir, check=True)
+    wall = time.monotonic() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+    files = glob.glob(os.path.join(log_dir, "*", "results.json"))
+    if not files:
+        raise RuntimeError(f"no results.json under {log_dir}")
+    with open(files[0]) as f:
+        return json.load(f), wall, cpu
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+"""
+Throughput of the collection engines.
+
+Collects a workload of processes x threads with every engine given and
+prints wall and collector cpu time of the run (startup and aggregation
+included). For the process engine, files/sec of every worker and of all
+workers (files over busy time of the slowest worker) come from
+engine_stats: with workers on cpus of their own, the rate per worker
+should stay close to that of a single worker.
+
+    python benchmarks/engine_bench.py --engines thread,process:1,process:4
+"""
+
+import argparse
+import tempfile
+from common import workload, collect
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--period", type=float, default=0.2)
+    parser.add_argument(
+        "--engines",
+        default="thread,process:1,process:2,process:4",
+        help="comma separated engine[:workers], thread only for trees without -E",
+    )
+    args = parser.parse_args()
+
+    work = workload(args.processes, args.threads)
+    try:
+        print("engine        wall s    cpu s  files/sec all  files/sec per worker")
+        for engine in args.engines.split(","):
+            name, _, workers = engine.partition(":")
+            options = []
+            if name != "thread" or workers:
+                options = ["-E", name, "-W", workers or "0"]
+            with tempfile.TemporaryDirectory() as log_dir:
+                res, wall, cpu = collect(
+                    work.pid, log_dir, args.samples, args.period, *options
+                )
+            workers = [i for i in res.get("engine_stats", []) if "files/sec" in i]
+            rates = " ".join(f"{i['files/sec']:.0f}" for i in workers)
+            total = ""
+            if workers:
+                busy = max(i["busy time"] for i in workers)
+                total = f"{sum(i['files'] for i in workers) / busy:.0f}"
+            print(f"{engine:<11} {wall:8.1f} {cpu:8.1f} {total:>14}  {rates}")
+    finally:
+        work.close()
+
+
+if __name__ == "__main__":
+    main()
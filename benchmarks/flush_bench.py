@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+"""
+Cost of the flush size check per sample.
+
+Collects a workload of idle processes for growing sample counts and
+prints collector cpu time, and cpu time per sample added since the
+previous count (startup cost cancels out). A check costing O(buffer)
+per sample (pickling the segment) makes it grow with the samples held
+in a flush window, a check kept incrementally keeps it flat.
+
+    python benchmarks/flush_bench.py --samples 100,400,1600
+"""
+
+import argparse
+import tempfile
+from common import workload, collect
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--processes", type=int, default=50)
+    parser.add_argument("--samples", default="100,400")
+    parser.add_argument("--period", type=float, default=0.01)
+    parser.add_argument(
+        "--flush-limits",
+        default="13545880",
+        help="comma separated -f of collect, bytes",
+    )
+    args = parser.parse_args()
+
+    work = workload(args.processes)
+    try:
+        print("flush limit   samples    wall s    cpu s   cpu ms/added sample")
+        for limit in args.flush_limits.split(","):
+            last = None
+            for samples in map(int, args.samples.split(",")):
+                with tempfile.TemporaryDirectory() as log_dir:
+                    _, wall, cpu = collect(
+                        work.pid, log_dir, samples, args.period, "-f", limit
+                    )
+                added = ""
+                if last is not None:
+                    added = f"{(cpu - last[1]) / (samples - last[0]) * 1e3:.2f}"
+                print(f"{limit:>11} {samples:>9} {wall:9.1f} {cpu:8.2f} {added:>21}")
+                last = (samples, cpu)
+    finally:
+        work.close()
+
+
+if __name__ == "__main__":
+    main()
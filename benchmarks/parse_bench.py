@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+"""
+Time per parse of every collected file.
+
+Runs collect (default input config, this process as -p) with its
+sampling loop replaced: once the collector is set up, the parse plans of
+global files and of the pid files are timed on a snapshot of their file
+taken once, so only parsing is measured, not procfs. Best of repeat
+runs, in us.
+
+    python benchmarks/parse_bench.py
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import traceback
+import syswit.collector as collector
+from syswit.collector_helper import collector_helper
+
+
+class snapshot_reader:
+    """
+    procfs_reader serving files read once
+    """
+
+    def __init__(self, files):
+        self.files = files
+
+    def readinto(self, path, pid=None):
+        return memoryview(self.files[path])
+
+    def read(self, path, pid=None):
+        return str(self.files[path], "utf-8", "replace")
+
+    def close_pid(self, pid):
+        pass
+
+    def close_all(self):
+        pass
+
+
+def time_parse(plan, repeat):
+    """
+    @return float
+        best time of a parse of plan in seconds
+    """
+    plan.parser(plan)
+    number, elapsed = 1, 0.0
+    while elapsed < 0.02:
+        number *= 2
+        start = time.perf_counter()
+        for _ in range(number):
+            plan.parser(plan)
+        elapsed = time.perf_counter() - start
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            plan.parser(plan)
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def run(helper, repeat):
+    """
+    @return list
+        lines of the results table
+    """
+    plans = list(helper.parse_plans.values()) + helper.compile_pid_plans(helper.pid)
+    plans = [plan for plan in plans if plan.parser is not None]
+    files = {}
+    for plan in plans:
+        with open(plan.path, "rb") as f:
+            files[plan.path] = f.read()
+    helper.reader = snapshot_reader(files)
+    lines = [f"{'source':<28} {'bytes':>8} {'us/parse':>10}"]
+    for plan in sorted(plans, key=lambda plan: plan.source):
+        us = time_parse(plan, repeat) * 1e6
+        lines.append(f"{plan.source:<28} {len(files[plan.path]):>8} {us:>10.1f}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    lines = []
+
+    def collect(helper):
+        try:
+            lines.extend(run(helper, args.repeat))
+        except Exception:
+            # collect prints exceptions of collection and exits 0
+            traceback.print_exc()
+            raise SystemExit(1)
+
+    collector_helper.collect = collect
+    with tempfile.TemporaryDirectory() as log_dir:
+        params = collector.collector().add_arguments()
+        params = params.parse_args(
+            ["-p", str(os.getpid()), "-n", "1", "-l", log_dir, "-K"]
+        )
+        collector.collector().main(params)
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,13 @@ class global_vars:
     input_yaml = "input_yaml"
     file_type = "file_type"
     offset_value = "offset_value"
+    sample_times = "sample_times"
+    writer_stats = "writer_stats"
+    tracker_stats = "tracker_stats"
+    engine_stats = "engine_stats"
+    rollup_stats = "rollup_stats"
+    pid_starts = "pid_starts"
+    pid_exits = "pid_exits"
 
 
 class collector_config:
@@ -37,9 +44,62 @@ class collector_config:
     global_data_required = 0
     logs_d = "logs"
     output_file_name = "results"
-    tmpflushdatafilename = "tmpresult_"
+    results_format = "json"
+    compression = "zlib"
+    segmentlogfilename = "segments.log"
+    csvpartfilename = "csv_part_"
+    fsync_segments = 0
+    spillfilename = "spill_"
+    writer_queue_size = 2
+    queue_full_policy = "block"
     workload_given = False
     keep_workload_alive = False
+    align_samples = False
+    tree_scan_every = 1
+    tree_scan_workers = 4
+    tree_scan_history = 1000
+    engine = "thread"
+    engine_workers = 0
+    ring_slots = 4
+    ring_slot_size = 1 << 20
+    async_concurrency = 64
+    sample_deadline = 0
+    rollup = False
+    top_threads = 10
+    # (source key, metric) of start time telling apart processes of a reused pid
+    pid_start_metric = ("p_proc_stat", "start time")
+    # read final rows of tracked processes as they exit, watched with pidfds
+    exit_capture = True
+    # (source key, metric) ranking threads kept raw in rollup mode
+    thread_rank_metric = ("p_proc_sched", "se.sum_exec_runtime")
+    # processes kept per sample, others folded in one row per file, 0 keeps all
+    top_processes = 0
+    rank_by = "cpu"
+    # rank_by -> (source key, metrics summed) ranking processes in top mode
+    process_rank_keys = {
+        "cpu": ("p_proc_stat", ("utime", "stime")),
+        "rss": ("p_proc_statm", ("Resident set size",)),
+        "faults": ("p_proc_stat", ("minor faults", "major faults")),
+        "switches": (
+            "p_proc_status",
+            ("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches"),
+        ),
+    }
+    # prefix of series the tool records about itself, never offset
+    tool_series_prefix = "syswit_"
+    # /proc/stat fields summed as cpu time and idle time for utilization
+    cpu_time_fields = [
+        "user",
+        "nice",
+        "system",
+        "idle",
+        "iowait",
+        "irq",
+        "softirq",
+        "steal",
+    ]
+    cpu_idle_fields = ["idle", "iowait"]
+    overrun_policy = "skip"
     pid = None
     ignore_offset = False
     ignore_workload_logs = False
@@ -48,10 +108,15 @@ class collector_config:
     identifier_proc_files = "proc"
     identifier_sys_numanode_files = "sys"
     identifier_pid_proc_files = "proc"
+    # totals of /proc/<pid>/ files are stored as workload_proc_<file> and,
+    # for processes out of the top processes, other_proc_<file>
+    identifier_workload = "workload"
+    identifier_other = "other"
     timestamps_style = "%Y_%m_%d_%H_%M_%S_%f"
     collector_input_config__path = "collector_configs/input.yaml"
     special_parser_help__path = "tool_configs/special_parser_helper.yaml"
     generic_parser_separators__path = "tool_configs/metric_separator.yaml"
+    metric_schema__path = "tool_configs/metric_schema.yaml"
 
     collector_input_config_path = pkg_resources.resource_filename(
         __name__, collector_input_config__path
@@ -62,6 +127,9 @@ class collector_config:
     generic_parser_separators_path = pkg_resources.resource_filename(
         __name__, generic_parser_separators__path
     )
+    metric_schema_path = pkg_resources.resource_filename(
+        __name__, metric_schema__path
+    )
 
     # Fetching Number of numa nodes in that SUT
     _lscpu = lscpu()
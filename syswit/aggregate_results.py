@@ -8,14 +8,27 @@
 import os
 import json
 import csv
-import jsonmerge
+import bisect
+import numpy as np
+from array import array
+from syswit.segment_log import (
+    read_records,
+    record_source_id,
+    record_pid_source,
+    read_block,
+    block_header,
+    record_header,
+)
+from syswit.results_format import results_writer
+from syswit.metric_schema import metric_schema
 from syswit.utils import (
-    get_first_available_timestamp_forPfiles,
-    get_last_available_timestamp_forPfiles,
+    ns_to_timestamp,
     check_placeholder,
     check_proc_file_tag,
     check_nodex_sys_source_file_tag,
     check_path_pid_proc_file_tag,
+    check_total_proc_file_tag,
+    pid_series_id,
 )
 from syswit import collector_config as config
 from syswit import global_vars
@@ -26,120 +39,73 @@ class AggregateResult:
     This class is for aggregating flushed results
     and offsetting data if required dynamically as per
     metric behavior.
+
+    Segment log is read once, sequentially, to index samples and sources:
+    the offset of every row record is kept per source. Sources are then
+    aggregated in batches which fit in memory_limit, a batch reads only
+    the row records of its sources, nearby records coalesced in one
+    pread, orders them by sample time, gap fills and offsets them, and
+    is written to the results file before the next batch is read. Sources collected as metric_block
+    (per cpu /proc/stat) are read as samples x rows x columns arrays and
+    aligned, offset and flattened as a whole. Rows of /proc/<pid>/ files
+    are logged per file with a pid, every (file, pid) is aggregated as a
+    source of its own named as before ("<pid>_proc_<file>" with
+    "<pid> <metric>" metrics), so results read the same. Rows of a pid
+    reused by new processes during the run are split by incarnation
+    (pid_starts of run info) into "<pid>-<start time>_proc_<file>"
+    sources, so unrelated processes aren't offset as one series.
     """
 
+    # estimated bytes held per aggregated value
+    value_size = 64
+    # row records of a batch closer than read_gap bytes are read in one
+    # pread of at most read_size bytes
+    read_gap = 1 << 16
+    read_size = 1 << 22
+    placeholders = {int: 0, float: 0.0, str: "NA"}
+
     def __init__(self):
         print("\nAggregating Start")
         self.merged_data_raw = {}
+        # source id -> {"tag", "metrics", "rows", "index"}, index holds
+        # payload offset, payload length and log order sample of every row
+        # record. Block sources have "labels" and "blocks" ((offset, length)
+        # of payloads) instead of "index". Sources of /proc/<pid>/ files
+        # are keyed (source id, pid) and have "prefix", "<pid> ", and the
+        # metrics of their file
+        self.sources = {}
+        # source id -> {"tag", "metrics"} of /proc/<pid>/ files
+        self.pid_files = {}
+        # reused pid -> ([first sample ns], [start time]) of incarnations
+        self.incarnations = {}
+        # scheduled ns and timeline index of samples, in log order
+        self.sample_ns = []
+        self.sample_index = None
+        self.offset_primary_value = {}
+        self.default_offset_metrics = {}
         self.path = ""
         self.global_varslist = config.global_varslist
+        self.memory_limit = config.flush_limit
+        self.metric_schema = metric_schema(config.metric_schema_path)
 
-    def reduce_merged_data(self):
-        self.merged_data = {}
-        missing_sample_back_search_count = (
-            len(self.merged_data_raw[global_vars.timestamps]) // 2
-        )
-
-        for file_name, metrics_data in self.merged_data_raw.items():
-            if file_name not in self.global_varslist:
-                if isinstance(metrics_data, list) and isinstance(metrics_data[0], dict):
-                    self.merged_data[file_name] = [{}]
-                    for _metric in list(self.offset_primary_value[file_name].keys()):
-                        self.merged_data[file_name][0][_metric] = []
-                    for counter, cur_timestamp in enumerate(
-                        self.merged_data_raw[global_vars.timestamps]
-                    ):
-                        if cur_timestamp in metrics_data[0].keys():
-                            for metric, value in metrics_data[0][cur_timestamp][
-                                0
-                            ].items():
-                                self.merged_data[file_name][0][metric].append(value)
-                        else:
-                            if (
-                                self.first_timestamps_lists[file_name] <= cur_timestamp
-                                and cur_timestamp
-                                <= self.last_timestamps_lists[file_name]
-                            ):
-                                # Finding placeholder for samples in between collection missing values get prev values
-                                prev_timestamp = self.merged_data_raw[
-                                    global_vars.timestamps
-                                ][counter - 1]
-                                if prev_timestamp in metrics_data[0].keys():
-                                    for metric, value in metrics_data[0][
-                                        prev_timestamp
-                                    ][0].items():
-                                        self.merged_data[file_name][0][metric].append(
-                                            value
-                                        )
-                                else:
-                                    for i in range(2, missing_sample_back_search_count):
-                                        prev_timestamp = self.merged_data_raw[
-                                            global_vars.timestamps
-                                        ][counter - i]
-                                        if prev_timestamp in metrics_data[0].keys():
-                                            for metric, value in metrics_data[0][
-                                                prev_timestamp
-                                            ][0].items():
-                                                self.merged_data[file_name][0][
-                                                    metric
-                                                ].append(value)
-                                            break
-
-                            else:
-                                # Finding placeholder for samples with before and after of real samples collected
-                                for metric in list(
-                                    self.merged_data[file_name][0].keys()
-                                ):
-                                    placeholder = check_placeholder(
-                                        self.offset_primary_value[file_name][metric]
-                                    )
-                                    self.merged_data[file_name][0][metric].append(
-                                        placeholder
-                                    )
-            else:
-                self.merged_data[file_name] = self.merged_data_raw[file_name]
-
-    def get_initial_value_set(self):
-        # Creating list sets of first timestamp available for a metric, first value,
-        # and later creating a list of last timestamp available as well.
-
-        self.offset_primary_value = {}
-        self.first_timestamps_lists = {}
-        self.last_timestamps_lists = {}
-
-        initial_timestamp = self.merged_data_raw[global_vars.timestamps][0]
-        for file_name, metrics in self.merged_data_raw.items():
-            if file_name not in self.global_varslist:
-                if isinstance(metrics, list) and isinstance(metrics[0], dict):
-                    try:
-                        self.offset_primary_value[file_name] = metrics[0][
-                            initial_timestamp
-                        ][0]
-                        self.first_timestamps_lists[file_name] = initial_timestamp
-                        last_timestamp = get_last_available_timestamp_forPfiles(
-                            self.merged_data_raw, file_name
-                        )
-                        self.last_timestamps_lists[file_name] = last_timestamp
-                    except KeyError as e:
-                        tmp_timestamp = get_first_available_timestamp_forPfiles(
-                            self.merged_data_raw, file_name
-                        )
-                        self.offset_primary_value[file_name] = metrics[0][
-                            tmp_timestamp
-                        ][0]
-                        self.first_timestamps_lists[file_name] = tmp_timestamp
-                        last_timestamp = get_last_available_timestamp_forPfiles(
-                            self.merged_data_raw, file_name
-                        )
-                        self.last_timestamps_lists[file_name] = last_timestamp
+    def get_placeholder(self, values):
+        """
+        placeholder as per type of first collected value of a metric
+        """
+        for value in values:
+            if value is not None:
+                return check_placeholder(value)
+        return "NA"
 
     def sort_files(self, heads):
         """
         This function is to sort csv headers in a particular pattern
-        such that [timestamps, ^proc_*, *_sys_*, ^p_*]
+        such that [timestamps, ^proc_*, *_sys_*, totals, ^p_*, ^syswit_*]
         proc_ -> Global data of proc files
         _sys_ -> Global nodex_sys_source_files
+        totals -> workload_ and other_ totals of per process data
         ^p_   -> Per Process data from proc files
+        syswit_ -> Series recorded by the tool about collection
 
         Args:
             heads (str): this is unsorted list of headers for csv
@@ -147,96 +113,615 @@ class AggregateResult:
         """
         list_proc = []
         list_sys = []
+        list_totals = []
         list_p_proc = []
+        list_tool = []
 
         for file in heads:
             if check_proc_file_tag(file):
                 list_proc.append(file)
             elif check_nodex_sys_source_file_tag(file):
                 list_sys.append(file)
+            elif check_total_proc_file_tag(file):
+                list_totals.append(file)
             elif check_path_pid_proc_file_tag(file):
                 list_p_proc.append(file)
+            elif file.startswith(config.tool_series_prefix):
+                list_tool.append(file)
 
-        return list_proc + list_sys + list_p_proc
-
-    def sort_merged_data(self):
-        sorted_merged_data_raw = {}
-        sorted_timestamps = sorted(self.merged_data_raw[global_vars.timestamps])
-        result_elements_tobesorted = (
-            []
-        )  # These are files which got data collected in time-series
-        for i in self.merged_data_raw.keys():
-            if (
-                check_nodex_sys_source_file_tag(i)
-                or check_path_pid_proc_file_tag(i)
-                or check_proc_file_tag(i)
+        return list_proc + list_sys + list_totals + list_p_proc + list_tool
+
+    def merge_info(self, info):
+        for key, value in info.items():
+            if key in (
+                global_vars.all_pids,
+                global_vars.pid_starts,
+                global_vars.pid_exits,
             ):
-                result_elements_tobesorted.append(i)
-            else:
-                sorted_merged_data_raw[i] = self.merged_data_raw[i]
-        sorted_merged_data_raw[global_vars.timestamps] = sorted_timestamps
-
-        result_elements_tobesorted = self.sort_files(result_elements_tobesorted)
-        for file in result_elements_tobesorted:
-            sorted_merged_data_raw[file] = [{}]
-            for _timestamp in sorted(self.merged_data_raw[file][0]):
-                sorted_merged_data_raw[file][0][_timestamp] = self.merged_data_raw[
-                    file
-                ][0][_timestamp]
-        self.merged_data_raw = sorted_merged_data_raw
-
-    def clean_data(self):
-        list_of_pids_files_to_remove = []
-        for i in self.merged_data_raw.keys():
-            if i not in self.global_varslist:
-                try:
-                    if not self.merged_data_raw[i][0]:
-                        list_of_pids_files_to_remove.append(i)
-                except TypeError as e:
-                    print(e, i, self.merged_data_raw[i])
-
-        for i in list_of_pids_files_to_remove:
-            if i in self.merged_data_raw.keys():
-                self.merged_data_raw.pop(i)
-
-    def merge_all_result_files_raw(self, _file):
-        with open(_file, "r") as f:
-            data1 = json.load(f)
-        if not self.merged_data_raw:
-            self.merged_data_raw = jsonmerge.merge(data1, self.merged_data_raw)
+                self.merged_data_raw[key] = self.merged_data_raw.get(key, []) + value
+            elif key not in self.merged_data_raw:
+                self.merged_data_raw[key] = value
+
+    def read_index(self, fd):
+        """
+        single sequential pass over segment log, only sample times, run
+        info and schemas are parsed, rows are indexed by source
+        """
+        sample_times = []
+        for offset, record_type, payload in read_records(fd, buffer_size=1 << 20):
+            if record_type == "R" or record_type == "Q":
+                if not sample_times:
+                    continue
+                if record_type == "R":
+                    source = self.sources[record_source_id(payload)]
+                else:
+                    source = self.pid_source(record_pid_source(payload))
+                self.index_row(
+                    source,
+                    offset + record_header.size,
+                    len(payload),
+                    len(sample_times) - 1,
+                )
+            elif record_type == "T":
+                sample_times.append(json.loads(payload))
+            elif record_type == "S":
+                source_id, tag, metrics = json.loads(payload)
+                if source_id not in self.sources:
+                    self.sources[source_id] = self.new_source(tag)
+                self.sources[source_id]["metrics"] = metrics
+            elif record_type == "P":
+                source_id, tag, metrics = json.loads(payload)
+                if source_id not in self.pid_files:
+                    self.pid_files[source_id] = {"tag": tag, "metrics": []}
+                # shared by sources of all pids of the file
+                self.pid_files[source_id]["metrics"][:] = metrics
+            elif record_type == "K":
+                source_id, tag, rows, columns = json.loads(payload)
+                self.sources[source_id] = {
+                    "tag": tag,
+                    "rows": 0,
+                    "labels": (rows, columns),
+                    "metrics": [
+                        f"{row} {column}" for row in rows for column in columns
+                    ],
+                    "blocks": [],
+                }
+            elif record_type == "M":
+                source_id, samples, _, _ = block_header.unpack_from(payload)
+                source = self.sources[source_id]
+                source["rows"] += samples
+                source["blocks"].append((offset + record_header.size, len(payload)))
+            elif record_type == "I":
+                self.merge_info(json.loads(payload))
+
+        # segments may be logged out of time order (ex: spilled segments)
+        self.sample_ns = [i[0] for i in sample_times]
+        order = np.argsort(np.array(self.sample_ns, dtype=np.int64), kind="stable")
+        self.sample_index = np.empty(len(order), dtype=np.int64)
+        self.sample_index[order] = np.arange(len(order))
+        sample_times = [sample_times[i] for i in order]
+        self.merged_data_raw[global_vars.timestamps] = [
+            ns_to_timestamp(i[0]) for i in sample_times
+        ]
+        self.merged_data_raw[global_vars.sample_times] = sample_times
+        self.timeline = [i[0] for i in sample_times]
+
+    def new_source(self, tag):
+        """
+        @return dict
+            source of tag without rows
+        """
+        return {
+            "tag": tag,
+            "rows": 0,
+            "index": (array("q"), array("I"), array("I")),
+        }
+
+    def index_row(self, source, offset, length, sample):
+        """
+        @params offset, length: int
+            payload of a row record of source in segment log
+        @params sample: int
+            log order of the sample of the row
+        """
+        offsets, lengths, samples = source["index"]
+        offsets.append(offset)
+        lengths.append(length)
+        samples.append(sample)
+        source["rows"] += 1
+
+    def pid_source(self, key):
+        """
+        @params key: tuple
+            (source id of /proc/<pid>/ file, pid), or (source id, pid,
+            start time) for an incarnation of a reused pid
+
+        @return dict
+            source of the pid, created on first use
+        """
+        source = self.sources.get(key)
+        if source is None:
+            series = pid_series_id(*key[1:])
+            pid_file = self.pid_files[key[0]]
+            # "p_proc_stat" -> "12_proc_stat"
+            source = self.sources[key] = self.new_source(
+                f"{series}_{pid_file['tag'][2:]}"
+            )
+            source["prefix"] = f"{series} "
+            source["metrics"] = pid_file["metrics"]
+        return source
+
+    def split_reused_pids(self):
+        """
+        replace the sources of pids having more than one incarnation in
+        pid_starts by a source per incarnation, rows are told apart by
+        sample time
+        """
+        starts = {}
+        for pid, start, sample_ns in self.merged_data_raw.get(
+            global_vars.pid_starts, []
+        ):
+            starts.setdefault(pid, {})[start] = sample_ns
+        for pid, incarnations in starts.items():
+            if len(incarnations) > 1:
+                incarnations = sorted((ns, start) for start, ns in incarnations.items())
+                self.incarnations[pid] = tuple(map(list, zip(*incarnations)))
+        if not self.incarnations:
             return
-        self.merged_data_raw = jsonmerge.merge(data1, self.merged_data_raw)
-        data0_key = self.merged_data_raw.keys()
-        data1_key = data1.keys()
-        common_keys = data1_key & data0_key
-        for i in common_keys:
-            if i == global_vars.timestamps or i == global_vars.all_pids:
-                self.merged_data_raw[i] = self.merged_data_raw[i] + data1[i]
+        for key in list(self.sources):
+            if type(key) is not tuple or key[1] not in self.incarnations:
+                continue
+            offsets, lengths, samples = self.sources.pop(key)["index"]
+            for row, sample in enumerate(samples):
+                self.index_row(
+                    self.pid_source(self.incarnation(key, self.sample_ns[sample])),
+                    offsets[row],
+                    lengths[row],
+                    sample,
+                )
+
+    def incarnation(self, key, sample_ns):
+        """
+        @params key: tuple
+            (source id, pid) of a row of a reused pid
+
+        @return tuple
+            (source id, pid, start time) of the incarnation the row belongs to
+        """
+        times, starts = self.incarnations[key[1]]
+        return key + (starts[max(bisect.bisect_right(times, sample_ns) - 1, 0)],)
+
+    def batches(self):
+        """
+        @return generator
+            lists of source ids, in order of sort_files, each estimated to
+            fit in memory_limit once aggregated
+        """
+        ids = {
+            source["tag"]: source_id
+            for source_id, source in self.sources.items()
+            if source["rows"]
+        }
+        batch, batch_size = [], 0
+        for tag in self.sort_files(list(ids.keys())):
+            source_id = ids[tag]
+            size = (
+                len(self.timeline)
+                * len(self.sources[source_id]["metrics"])
+                * self.value_size
+            )
+            if batch and batch_size + size > self.memory_limit:
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(source_id)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def read_payloads(self, fd, offsets, lengths):
+        """
+        @params offsets, lengths: list
+            payloads of row records, in log order
+
+        @return generator
+            payload bytes, records closer than read_gap read in one pread
+        """
+        row, rows = 0, len(offsets)
+        while row < rows:
+            start = offsets[row]
+            end, last = start + lengths[row], row + 1
+            while (
+                last < rows
+                and offsets[last] - end <= self.read_gap
+                and offsets[last] + lengths[last] - start <= self.read_size
+            ):
+                end = offsets[last] + lengths[last]
+                last += 1
+            data = os.pread(fd, end - start, start)
+            for i in range(row, last):
+                position = offsets[i] - start
+                yield data[position : position + lengths[i]]
+            row = last
+
+    def aggregate_batch(self, fd, batch):
+        """
+        Read row records of batch sources in log order, a single forward
+        pass over the parts of the log holding them
+
+        @return dict
+            source id -> (timeline index of every collected row, rows),
+            in timeline order
+        """
+        indexes = [self.sources[source_id]["index"] for source_id in batch]
+        offsets = np.concatenate([np.frombuffer(i[0], np.int64) for i in indexes])
+        lengths = np.concatenate([np.frombuffer(i[1], np.uint32) for i in indexes])
+        samples = np.concatenate([np.frombuffer(i[2], np.uint32) for i in indexes])
+        owners = np.repeat(np.arange(len(batch)), [len(i[0]) for i in indexes])
+        positions = self.sample_index[samples]
+        # rank of every row once ordered by source, then sample time
+        by_source = np.lexsort((positions, owners))
+        ranks = np.empty(len(offsets), dtype=np.int64)
+        ranks[by_source] = np.arange(len(offsets))
+        order = np.argsort(offsets, kind="stable")
+        rows = [None] * len(offsets)
+        payloads = self.read_payloads(
+            fd, offsets[order].tolist(), lengths[order].tolist()
+        )
+        for rank, payload in zip(ranks[order].tolist(), payloads):
+            # [source id, values] or [source id, pid, values]
+            rows[rank] = json.loads(payload)[-1]
+        positions = positions[by_source]
+        states, first = {}, 0
+        for source_id, index in zip(batch, indexes):
+            last = first + len(index[0])
+            states[source_id] = (positions[first:last].tolist(), rows[first:last])
+            first = last
+        return states
+
+    def read_blocks(self, fd, blocks):
+        """
+        @params blocks: list
+            (offset, length) of M record payloads of a source
+
+        @return (np.ndarray, np.ndarray)
+            timeline index of every collected sample, in timeline order,
+            and samples x rows x columns values
+        """
+        timestamps, values = [], []
+        for offset, length in blocks:
+            _, block_timestamps, block_values = read_block(os.pread(fd, length, offset))
+            timestamps.append(block_timestamps)
+            values.append(block_values)
+        timestamps = np.concatenate(timestamps)
+        order = np.argsort(timestamps, kind="stable")
+        positions = np.searchsorted(self.timeline, timestamps[order])
+        return positions, np.concatenate(values)[order]
+
+    def fill_index(self, positions):
+        """
+        @params positions: list
+            timeline index of every collected row of a source
+
+        @return np.ndarray
+            row to be used for every sample, previous collected row for
+            samples missing in between first and last row, -1 before or
+            after
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        rows = np.full(len(self.timeline), -1, dtype=np.int64)
+        rows[positions] = np.arange(len(positions))
+        rows = np.maximum.accumulate(rows)
+        rows[positions[-1] + 1 :] = -1
+        return rows
+
+    def offsetable_columns(self, matrix):
+        """
+        @params matrix: np.ndarray
+            samples x metrics, numeric columns of a source
+
+        @return np.ndarray
+            bool per column, True if column is not static and is non
+            decreasing from 0 ignoring -1 values
+        """
+        static = (matrix == matrix[0]).all(axis=0)
+        samples = np.arange(matrix.shape[0])[:, None]
+        valid_rows = np.maximum.accumulate(
+            np.where(matrix != -1, samples, -1), axis=0
+        )
+        valid = np.where(
+            valid_rows >= 0,
+            np.take_along_axis(matrix, np.maximum(valid_rows, 0), axis=0),
+            0,
+        )
+        non_decreasing = (np.diff(valid, axis=0, prepend=0) >= 0).all(axis=0)
+        return ~static & non_decreasing
+
+    def declared_offsetable(self, matrix, declarations):
+        """
+        @params matrix: np.ndarray
+            samples x metrics, numeric columns of a source
+        @params declarations: list
+            (kind, type) of every column, None if not declared
+
+        @return np.ndarray
+            bool per column, True for declared counters, offsetable_columns
+            for columns not declared
+        """
+        offsetable = np.array(
+            [
+                declaration is not None
+                and declaration[0] in metric_schema.offset_kinds
+                for declaration in declarations
+            ],
+            dtype=bool,
+        )
+        undeclared = np.array([i is None for i in declarations], dtype=bool)
+        if undeclared.any():
+            offsetable[undeclared] = self.offsetable_columns(matrix[:, undeclared])
+        return offsetable
+
+    def finish_source(self, tag, metrics, positions, rows, offset, prefix=""):
+        """
+        Align collected rows of a source on the merged timestamps, fill
+        placeholders and offset the metrics. Columns of a source with int
+        or float values are gap filled and offset as one matrix each.
+        Metrics are offset and get placeholders as per their declaration
+        in metric_schema.yaml, if any. Metrics never collected for the
+        source (ex: of other pids of a /proc/<pid>/ file) are left out.
+
+        @params prefix: str
+            prepended to metric names in results, "<pid> " for sources of
+            /proc/<pid>/ files
+
+        @return list
+            [{metric: values}] or [{metric: values}, {"offset_value": {...}}]
+        """
+        width = len(metrics)
+        raw = np.empty((len(rows), width), dtype=object)
+        raw[:] = [i if len(i) == width else i + [None] * (width - len(i)) for i in rows]
+        none = np.equal(raw, None)
+        collected = ~none.all(axis=0)
+        if not collected.all():
+            metrics = [metric for metric, kept in zip(metrics, collected) if kept]
+            width = len(metrics)
+            raw, none = raw[:, collected], none[:, collected]
+        declarations = self.metric_schema.declarations(tag, metrics)
+        if prefix:
+            metrics = [prefix + metric for metric in metrics]
+        row_index = self.fill_index(positions)
+        missing = row_index < 0
+
+        columns = {int: [], float: [], object: []}
+        for j in range(width):
+            kinds = set(map(type, raw[:, j][~none[:, j]]))
+            if kinds == {int} or kinds == {float}:
+                columns[kinds.pop()].append(j)
             else:
-                merged_dict = {**self.merged_data_raw[i][0], **data1[i][0]}
-                self.merged_data_raw[i][0] = merged_dict
-
-    def read_data(self):
-        lists_of_files_at_path = [
-            file
-            for file in os.listdir(self.path)
-            if file.startswith(config.tmpflushdatafilename)
-        ]
-        for _file in sorted(lists_of_files_at_path):
-            self.merge_all_result_files_raw(os.path.join(self.path, _file))
-        self.clean_data()
-        self.sort_merged_data()
-        self.get_initial_value_set()
-        self.reduce_merged_data()
-
-    def make_default_offset_metrics_tree(self, data):
-        self.default_offset_metrics = {}
-        for i, j in data.items():
-            tmp = {}
-            if isinstance(j, dict):
-                for k, m in j.items():
-                    tmp[k] = True
-            self.default_offset_metrics[i] = tmp
+                columns[object].append(j)
+
+        values, offsetable = {}, {}
+        for kind, dtype in ((int, np.int64), (float, np.float64)):
+            if not columns[kind]:
+                continue
+            try:
+                matrix = np.where(none[:, columns[kind]], 0, raw[:, columns[kind]])
+                matrix = matrix.astype(dtype)[row_index]
+            except OverflowError:
+                columns[object].extend(columns[kind])
+                continue
+            matrix[missing] = 0
+            if offset:
+                offsetable_matrix = self.declared_offsetable(
+                    matrix, [declarations[j] for j in columns[kind]]
+                )
+                matrix[:, offsetable_matrix] -= matrix[0, offsetable_matrix]
+            for n, j in enumerate(columns[kind]):
+                values[j] = matrix[:, n].tolist()
+                if offset:
+                    offsetable[j] = bool(offsetable_matrix[n])
+
+        primary_values = {}
+        for j in range(width):
+            column = raw[:, j]
+            if declarations[j] is None:
+                placeholder = self.get_placeholder(column)
+            else:
+                placeholder = self.placeholders[declarations[j][1]]
+            primary_value = column[0]
+            if primary_value is None:
+                primary_value = placeholder
+            primary_values[j] = primary_value
+            if j in values:
+                continue
+            column = column[row_index]
+            column[missing | none[row_index, j]] = placeholder
+            values[j] = column.tolist()
+            if offset:
+                if declarations[j] is None:
+                    offsetable[j] = self.check_metric_offsetable(
+                        values[j], primary_value
+                    )
+                else:
+                    # declared counters holding something else than numbers
+                    # can't be offset
+                    kind = declarations[j][0]
+                    offsetable[j] = kind in metric_schema.offset_kinds and all(
+                        type(i) is int or type(i) is float for i in values[j]
+                    )
+                if offsetable[j]:
+                    values[j] = self.offset_list(values[j])
+
+        result = {metric: values[j] for j, metric in enumerate(metrics)}
+        self.offset_primary_value[tag] = {
+            metric: primary_values[j] for j, metric in enumerate(metrics)
+        }
+        if not offset:
+            return [result]
+        self.default_offset_metrics[tag] = {
+            metric: offsetable[j] for j, metric in enumerate(metrics)
+        }
+        offset_value = {
+            metric: primary_values[j]
+            for j, metric in enumerate(metrics)
+            if offsetable[j]
+        }
+        return [result, {global_vars.offset_value: offset_value}]
+
+    def cpu_utilization(self, matrix, columns, missing):
+        """
+        @params matrix: np.ndarray
+            samples x cpus x fields of /proc/stat aligned on the timeline,
+            not offset
+        @params columns: list
+            field names of matrix
+        @params missing: np.ndarray
+            bool per sample, True if not collected
+
+        @return np.ndarray
+            samples x cpus busy percent since previous sample, 0 for first
+            sample and samples without two collected values, None if the
+            fields of cpu time are not all collected
+        """
+        try:
+            time_fields = [columns.index(i) for i in config.cpu_time_fields]
+            idle_fields = [columns.index(i) for i in config.cpu_idle_fields]
+        except ValueError:
+            return None
+        times = matrix[:, :, time_fields]
+        total = times.sum(axis=2)
+        idle = matrix[:, :, idle_fields].sum(axis=2)
+        delta_total = np.diff(total, axis=0, prepend=total[:1])
+        delta_busy = delta_total - np.diff(idle, axis=0, prepend=idle[:1])
+        invalid = (times == -1).any(axis=2) | missing[:, None]
+        invalid[1:] |= invalid[:-1]
+        invalid |= delta_total <= 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            busy = 100.0 * delta_busy / delta_total
+        busy[invalid] = 0.0
+        return busy
+
+    def finish_block(self, tag, labels, positions, values, offset):
+        """
+        Align collected blocks of a source on the merged timestamps and
+        offset them as finish_source does (column labels are the declared
+        metric names), as one samples x metrics matrix. Metrics are
+        "<row label> <column label>", rows never collected (cpus offline
+        for the whole run) are left out. For /proc/stat, "<row label>
+        utilization" is added after the fields of every row.
+
+        @return list
+            [{metric: values}] or [{metric: values}, {"offset_value": {...}}]
+        """
+        present = (values != -1).any(axis=(0, 2))
+        rows = [row for row, kept in zip(labels[0], present) if kept]
+        columns = list(labels[1])
+        row_index = self.fill_index(positions)
+        missing = row_index < 0
+        matrix = values[:, present][row_index]
+        matrix[missing] = 0
+        utilization = self.cpu_utilization(matrix, columns, missing)
+
+        flat = matrix.reshape(len(matrix), -1)
+        primary_values = values[0, present].reshape(-1).tolist()
+        if offset:
+            declarations = self.metric_schema.source_of_tag(tag)[0]
+            offsetable = self.declared_offsetable(
+                flat, [declarations.declaration(i) for i in columns] * len(rows)
+            )
+            flat[:, offsetable] -= flat[0, offsetable]
+        flat = flat.T.tolist()
+
+        result, offsetable_metrics, offset_value, primary = {}, {}, {}, {}
+        for i, row in enumerate(rows):
+            for j, column in enumerate(columns):
+                metric, n = f"{row} {column}", i * len(columns) + j
+                result[metric] = flat[n]
+                primary[metric] = primary_values[n]
+                if offset:
+                    offsetable_metrics[metric] = bool(offsetable[n])
+                    if offsetable[n]:
+                        offset_value[metric] = primary_values[n]
+            if utilization is not None:
+                metric = f"{row} utilization"
+                result[metric] = utilization[:, i].tolist()
+                primary[metric] = result[metric][0]
+                offsetable_metrics[metric] = False
+
+        self.offset_primary_value[tag] = primary
+        if not offset:
+            return [result]
+        self.default_offset_metrics[tag] = offsetable_metrics
+        return [result, {global_vars.offset_value: offset_value}]
+
+    def aggregate(
+        self,
+        file_name,
+        results_format="json",
+        compression="zlib",
+        offset=True,
+        csv_result=False,
+    ):
+        """
+        @params file_name: str
+            path of results file without extension
+        @params offset: bool
+            offset the offsetable metrics
+        @params csv_result: bool
+            write {file_name}.csv as well
+
+        @return str
+            path of results file
+        """
+        fd = os.open(os.path.join(self.path, config.segmentlogfilename), os.O_RDONLY)
+        try:
+            self.read_index(fd)
+            self.split_reused_pids()
+            writer = results_writer(file_name, results_format, compression)
+            for key, value in self.merged_data_raw.items():
+                writer.write(key, value)
+            csv_parts = []
+            for batch in self.batches():
+                res = {}
+                rows = [i for i in batch if "labels" not in self.sources[i]]
+                states = self.aggregate_batch(fd, rows) if rows else {}
+                for source_id in batch:
+                    source = self.sources[source_id]
+                    tag = source["tag"]
+                    source_offset = offset and not tag.startswith(
+                        config.tool_series_prefix
+                    )
+                    if "labels" in source:
+                        res[tag] = self.finish_block(
+                            tag,
+                            source["labels"],
+                            *self.read_blocks(fd, source["blocks"]),
+                            source_offset,
+                        )
+                    else:
+                        res[tag] = self.finish_source(
+                            tag,
+                            source["metrics"],
+                            *states[source_id],
+                            source_offset,
+                            source.get("prefix", ""),
+                        )
+                    writer.write(tag, res[tag])
+                if csv_result:
+                    part = self.write_csv_part(len(csv_parts), res)
+                    if part is not None:
+                        csv_parts.append(part)
+            results_file = writer.close()
+        finally:
+            os.close(fd)
+
+        if offset:
+            with open(os.path.join(self.path, "offset.json"), "w") as f:
+                json.dump(self.default_offset_metrics, f, indent=4)
+            with open(os.path.join(self.path, "offset_primary.json"), "w") as f:
+                json.dump(self.offset_primary_value, f, indent=4)
+        if csv_result:
+            self.merge_csv_parts(file_name, csv_parts)
+        return results_file
 
     def check_metric_offsetable_ifstatic(self, values):
         """
@@ -261,58 +746,57 @@ class AggregateResult:
                     tmp = i
                 return True
 
-    def create_offset_data_file(self):
-        self.make_default_offset_metrics_tree(self.offset_primary_value)
-        for static_metric_key, static_metric_value in self.offset_primary_value.items():
-            for _metric, list_of_values in self.merged_data[static_metric_key][
-                0
-            ].items():
-                self.default_offset_metrics[static_metric_key][
-                    _metric
-                ] = self.check_metric_offsetable(
-                    list_of_values,
-                    self.offset_primary_value[static_metric_key][_metric],
-                )
-
-        file_name = self.path + "/offset.json"
-        with open(file_name, "w") as f:
-            json.dump(self.default_offset_metrics, f, indent=4)
-
     def offset_list(self, list_of_values):
         if not list_of_values:
             return list_of_values
         first_element = list_of_values[0]
         return [element - first_element for element in list_of_values]
 
-    def offset_data(self, offset_metric_file=None):
-        if offset_metric_file is None:
-            self.create_offset_data_file()
-        else:
-            # TODO.....
-            # read_given_file
-            self.create_offset_data_file()
-
-        tmp = self.merged_data
-        final_path = os.path.join(self.path, "offset_primary.json")
-        # self.write_offset_primary_to_file(final_path)
-        with open(final_path, "w") as f:
-            json.dump(self.offset_primary_value, f, indent=4)
-        for static_metric_key, static_metric_value in self.offset_primary_value.items():
-            tmp[static_metric_key].append({})
-            tmp[static_metric_key][1][global_vars.offset_value] = {}
-
-            for _metric, list_of_values in self.merged_data[static_metric_key][
-                0
-            ].items():
-                if self.default_offset_metrics[static_metric_key][_metric]:
-                    tmp[static_metric_key][0][_metric] = self.offset_list(
-                        list_of_values
-                    )
-                    tmp[static_metric_key][1][global_vars.offset_value][
-                        _metric
-                    ] = self.offset_primary_value[static_metric_key][_metric]
+    def write_csv_part(self, part, data):
+        """
+        write columns of a batch of aggregated sources
 
-        self.merged_data = tmp
+        @return str
+            path of the part, None if batch has no metrics
+        """
+        heads, columns = [], []
+        for file, value in data.items():
+            for metric, values in value[0].items():
+                if metric not in self.global_varslist:
+                    heads.append(f"{file} {metric}")
+                    columns.append(values)
+        if not heads:
+            return None
+        path = os.path.join(self.path, f"{config.csvpartfilename}{part}.csv")
+        with open(path, "w", newline="") as f:
+            csv_writer = csv.writer(f)
+            csv_writer.writerow(heads)
+            csv_writer.writerows(zip(*columns))
+        return path
+
+    def merge_csv_parts(self, file_name, parts):
+        """
+        join columns of all parts line by line into {file_name}.csv
+        """
+        files = [open(i, "r", newline="") for i in parts]
+        try:
+            with open(f"{file_name}.csv", "w", newline="") as f:
+                csv_writer = csv.writer(f)
+                readers = [csv.reader(i) for i in files]
+                header = ["timestamps"]
+                for reader in readers:
+                    header.extend(next(reader))
+                csv_writer.writerow(header)
+                timestamps = self.merged_data_raw[global_vars.timestamps]
+                for timestamp, *rows in zip(timestamps, *readers):
+                    row = [timestamp]
+                    for i in rows:
+                        row.extend(i)
+                    csv_writer.writerow(row)
+        finally:
+            for i in files:
+                i.close()
+                os.remove(i.name)
 
     def write_csv_data(self, data, file_name):
         data_file = open(f"{file_name}.csv", "w")
@@ -361,11 +845,7 @@ class AggregateResult:
                 jsondata = json.loads(f.read())
                 self.write_csv_data(data=jsondata, file_name=file_name)
 
-    def write_merged_data_to_file(self, file_name):
-        with open(f"{file_name}.json", "w") as f:
-            json.dump(self.merged_data, f, indent=4)
-
     def remove_all_temp_result_files(self):
-        for file in os.listdir(self.path):
-            if file.startswith(config.tmpflushdatafilename):
-                os.remove(os.path.join(self.path, file))
+        path = os.path.join(self.path, config.segmentlogfilename)
+        if os.path.exists(path):
+            os.remove(path)
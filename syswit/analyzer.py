@@ -39,7 +39,7 @@ class Analyzer:
                 description="E.g., python3 analyzer.py -f '/logs/results.json' ",
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             )
-        parser.add_argument("-f", "--file", type=str, help="Path to results(json) file")
+        parser.add_argument("-f", "--file", type=str, help="Path to results(json/binary) file")
         return parser
 
     def process_arguments(self, params):
@@ -88,9 +88,7 @@ class Analyzer:
         self.tool_details_print[f"{global_vars.sample_period}(s)"] = self.sample_period
 
         if self.data.pids_enable:
-            self.tool_details_print["Parent PID"] = self.data.df[global_vars.all_pids][
-                0
-            ][0]
+            self.tool_details_print["Parent PID"] = self.data.parent_pid
             display_graph_count = display_graph_count + 1
         else:
             try:
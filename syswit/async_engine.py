@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from syswit import collector_config as config
+
+
+class async_engine:
+    """
+    Collection engine running every sample as one group of asyncio tasks,
+    one task per source, with a deadline.
+
+    File reads run on a thread pool, at most concurrency of them at a
+    time (bounded by a semaphore). submit() returns only when every task
+    of the sample completed, failed or was cancelled at the deadline, so
+    no row of a sample lands in the store after the next sample starts.
+    Rows of timed out tasks are dropped even if the read finishes later.
+    A read already running on a thread can't be stopped: it keeps its
+    semaphore slot until it returns, and its pid is passed as busy to
+    pid_registry.sync, so the descriptors it reads aren't closed under it.
+
+    Outcome of every sample is appended to the store as source
+    engine_tag: completed, timed out and failed counts, and the tags of
+    timed out and failed sources.
+    """
+
+    engine_tag = config.tool_series_prefix + "engine"
+
+    def __init__(self, helper, concurrency, deadline):
+        """
+        @params helper: collector_helper
+            with parse plans compiled
+        @params concurrency: int
+            max file reads in flight
+        @params deadline: float
+            seconds a sample may take before its pending reads are cancelled
+        """
+        self.helper = helper
+        self.concurrency = max(concurrency, 1)
+        self.deadline = deadline
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="syswit-async"
+        )
+        # created on the loop, asyncio primitives of python < 3.10 bind to
+        # the loop running when they are created
+        self.semaphore = None
+        # (future, pid) of reads still running past their deadline
+        self.late_reads = []
+        self.plans = [
+            plan for plan in helper.parse_plans.values() if plan.parser is not None
+        ]
+        self.samples = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.late = 0
+        self.sample_time_max = 0.0
+
+    def release_slot(self, future):
+        """
+        done callback of a read, runs on its executor thread
+        """
+        self.loop.call_soon_threadsafe(self.semaphore.release)
+
+    async def run_plan(self, plan, futures):
+        """
+        @params futures: dict
+            plan -> executor future of its read, once started
+        """
+        await self.semaphore.acquire()
+        future = futures[plan] = self.executor.submit(plan.parser, plan)
+        future.add_done_callback(self.release_slot)
+        # cancelling the task can't stop a running read, the slot is
+        # released by the thread when it returns
+        return await asyncio.wrap_future(future, loop=self.loop)
+
+    def busy_pids(self):
+        """
+        @return set
+            pids of reads still running past their deadline
+        """
+        self.late_reads = [i for i in self.late_reads if not i[0].done()]
+        return {pid for _, pid in self.late_reads if pid is not None}
+
+    async def run_sample(self, plans, store, sample):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        futures = {}
+        tasks = {
+            asyncio.ensure_future(self.run_plan(plan, futures)): plan for plan in plans
+        }
+        if not tasks:
+            return [], [], []
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+            plan = tasks[task]
+            future = futures.get(plan)
+            if future is not None and not future.done():
+                self.late_reads.append((future, plan.pid))
+                self.late += 1
+        if pending:
+            await asyncio.wait(pending)
+
+        completed, failed = [], []
+        for task in done:
+            plan = tasks[task]
+            if task.exception() is not None:
+                print(f"\n{plan.source}: {task.exception()}")
+                failed.append(plan.source)
+                continue
+            res = task.result()
+            if res is None:
+                failed.append(plan.source)
+            else:
+                store.append(plan.file, sample, res, plan.pid)
+                completed.append(plan.source)
+        timed_out = [tasks[task].source for task in pending]
+        return completed, timed_out, failed
+
+    def submit(self, store, sample, barrier, snapshot=()):
+        """
+        collect a sample, returns when it is complete or its deadline passed
+
+        @params store: sample_store
+            store of flush segment the sample belongs to
+        @params sample: int
+            index of sample in store
+        @params barrier: sample_barrier
+            completed sources are reported as one task
+        @params snapshot: tuple
+            live pids and tids to collect
+        """
+        start = time.monotonic()
+        barrier.task_started()
+        plans = list(self.plans)
+        if self.helper.pid:
+            registry = self.helper.registry
+            registry.sync(snapshot, self.busy_pids())
+            for batch in registry.batches:
+                plans.extend(batch)
+        try:
+            completed, timed_out, failed = self.loop.run_until_complete(
+                self.run_sample(plans, store, sample)
+            )
+        finally:
+            barrier.task_done(len(plans))
+        store.append(
+            self.engine_tag,
+            sample,
+            {
+                "completed": len(completed),
+                "timed out": len(timed_out),
+                "failed": len(failed),
+                "timed out sources": " ".join(sorted(timed_out)),
+                "failed sources": " ".join(sorted(failed)),
+            },
+        )
+        self.samples += 1
+        self.completed += len(completed)
+        self.timed_out += len(timed_out)
+        self.failed += len(failed)
+        self.sample_time_max = max(self.sample_time_max, time.monotonic() - start)
+
+    def close(self):
+        # late reads finish before their loop goes away
+        self.executor.shutdown()
+        self.loop.close()
+
+    def stats(self):
+        """
+        @return list
+            engine totals, times in seconds
+        """
+        return [
+            {
+                "samples": self.samples,
+                "completed": self.completed,
+                "timed out": self.timed_out,
+                "failed": self.failed,
+                "late reads": self.late,
+                "concurrency": self.concurrency,
+                "deadline": self.deadline,
+                "max sample time": self.sample_time_max,
+            }
+        ]
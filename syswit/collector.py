@@ -143,6 +143,122 @@ class collector:
             action="store_true",
             help=f"Don't offset the metric values, Default: {config.ignore_offset}",
         )
+        parser.add_argument(
+            "-A",
+            "--align-samples",
+            action="store_true",
+            help="Align samples to wall clock multiples of SAMPLE_PERIOD",
+        )
+        parser.add_argument(
+            "-O",
+            "--overrun-policy",
+            default=config.overrun_policy,
+            choices=["skip", "catchup"],
+            help="If a sample overruns next sample time, skip the missed samples or catch up by collecting them back to back",
+        )
+        parser.add_argument(
+            "-e",
+            "--tree-scan-every",
+            default=config.tree_scan_every,
+            type=int,
+            help="Rescan children and threads of PID after every TREE_SCAN_EVERY samples",
+        )
+        parser.add_argument(
+            "-E",
+            "--engine",
+            default=config.engine,
+            choices=["thread", "process", "async"],
+            help="Collect with thread pools in the tool process, shard sources and pids across worker processes pinned on the tool cpus, or run every sample as asyncio tasks with a deadline",
+        )
+        parser.add_argument(
+            "-W",
+            "--engine-workers",
+            default=config.engine_workers,
+            type=int,
+            help="Worker processes of process engine, 0 starts one per tool cpu",
+        )
+        parser.add_argument(
+            "-X",
+            "--async-concurrency",
+            default=config.async_concurrency,
+            type=int,
+            help="Max file reads in flight in async engine",
+        )
+        parser.add_argument(
+            "-D",
+            "--sample-deadline",
+            default=config.sample_deadline,
+            type=float,
+            help="Seconds after which pending reads of a sample are cancelled in async engine, 0 uses SAMPLE_PERIOD",
+        )
+        parser.add_argument(
+            "-U",
+            "--rollup",
+            action="store_true",
+            help="Roll threads up to their process and processes up to a workload total at collection time, keeping per thread rows of the TOP_THREADS busiest threads only",
+        )
+        parser.add_argument(
+            "-k",
+            "--top-threads",
+            default=config.top_threads,
+            type=int,
+            help="Threads kept with their own rows in rollup mode, ranked by cpu time",
+        )
+        parser.add_argument(
+            "-P",
+            "--top-processes",
+            default=config.top_processes,
+            type=int,
+            help="Processes kept with their own rows per sample, ranked by RANK_BY, others are folded in one other row per file, 0 keeps all",
+        )
+        parser.add_argument(
+            "-b",
+            "--rank-by",
+            default=config.rank_by,
+            choices=list(config.process_rank_keys),
+            help="Key ranking processes for TOP_PROCESSES, cpu ticks, RSS, page faults or context switches",
+        )
+        parser.add_argument(
+            "-x",
+            "--no-exit-capture",
+            action="store_true",
+            help="Don't watch tracked processes with pidfds to read their final stat/status/io rows as they exit",
+        )
+        parser.add_argument(
+            "-q",
+            "--writer-queue-size",
+            default=config.writer_queue_size,
+            type=int,
+            help="Max flushed segments waiting in memory to be written to storage",
+        )
+        parser.add_argument(
+            "-Q",
+            "--queue-full-policy",
+            default=config.queue_full_policy,
+            choices=["block", "spill"],
+            help="If writer queue is full, block collection until writer catches up or spill segment unformatted to log directory",
+        )
+        parser.add_argument(
+            "-F",
+            "--fsync-segments",
+            default=config.fsync_segments,
+            type=int,
+            help="fsync segment log after every FSYNC_SEGMENTS flushed segments, 0 leaves it to the OS",
+        )
+        parser.add_argument(
+            "-r",
+            "--results-format",
+            default=config.results_format,
+            choices=["json", "binary"],
+            help="Results file format, binary is compact columnar format readable by analyze and compare",
+        )
+        parser.add_argument(
+            "-z",
+            "--compression",
+            default=config.compression,
+            choices=["none", "zlib", "lzma"],
+            help="Compression of binary results, Default: zlib",
+        )
         # TODO
         # parser.add_argument(
         #     "--offset_metric_file",
@@ -312,6 +428,23 @@ class collector:
         self.col_h.pid_ignore_threads = self.args.ignore_threads
         self.col_h.flush_limit = self.args.flush_limit
         self.col_h.csv_result = self.args.csv_result
+        self.col_h.align_samples = self.args.align_samples
+        self.col_h.overrun_policy = self.args.overrun_policy
+        self.col_h.writer_queue_size = self.args.writer_queue_size
+        self.col_h.queue_full_policy = self.args.queue_full_policy
+        self.col_h.fsync_segments = self.args.fsync_segments
+        self.col_h.results_format = self.args.results_format
+        self.col_h.compression = self.args.compression
+        self.col_h.tree_scan_every = max(self.args.tree_scan_every, 1)
+        self.col_h.engine = self.args.engine
+        self.col_h.engine_workers = max(self.args.engine_workers, 0)
+        self.col_h.async_concurrency = max(self.args.async_concurrency, 1)
+        self.col_h.sample_deadline = max(self.args.sample_deadline, 0)
+        self.col_h.rollup = self.args.rollup
+        self.col_h.top_threads = max(self.args.top_threads, 0)
+        self.col_h.top_processes = max(self.args.top_processes, 0)
+        self.col_h.rank_by = self.args.rank_by
+        self.col_h.exit_capture = not self.args.no_exit_capture
         # get cpu no. or/and NUMA node to run syswit
         self.col_h.get_cpus_for_running_tool(
             self.args.cpu_affinity, self.args.node_affinity
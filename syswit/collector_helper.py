@@ -6,20 +6,28 @@
 
 
 import time
-import datetime
 import os
 import json
-import re
 import psutil
-import threading
 import platform
 import netifaces
 import sys
-import pickle
+import numpy as np
 from concurrent.futures import ThreadPoolExecutor
-from itertools import repeat
 from signal import SIGKILL
 from syswit.aggregate_results import AggregateResult
+from syswit.procfs_reader import procfs_reader
+from syswit.parse_plan import parse_plan, convert_declared_value, column_groups
+from syswit.metric_schema import metric_schema
+from syswit.sample_scheduler import sample_scheduler, sample_barrier
+from syswit.sample_store import sample_store, metric_block
+from syswit.segment_writer import segment_writer
+from syswit.process_tree import process_tree
+from syswit.pid_registry import pid_registry
+from syswit.pid_identity import pid_identities
+from syswit.process_engine import process_engine
+from syswit.async_engine import async_engine
+from syswit.thread_rollup import thread_rollup, top_processes
 
 try:
     from numa import info
@@ -30,12 +38,10 @@ from syswit.utils import (
     parse_yaml_metrics,
     lscpu,
     generic_yaml_parser,
-    timestamp_to_seconds,
     tag_pid_proc_file,
     path_pid_proc_file,
-    check_proc_file_tag,
-    check_path_pid_proc_file_tag,
     check_nodex_sys_source_file_tag,
+    possible_cpu_count,
 )
 
 from syswit import collector_config as config
@@ -61,9 +67,45 @@ class collector_helper:
         self.collector_input_config_path = config.collector_input_config_path
         self.output_file_name = config.output_file_name
         self.keep_workload_alive = config.keep_workload_alive
-
+        self.align_samples = config.align_samples
+        self.overrun_policy = config.overrun_policy
+        self.writer_queue_size = config.writer_queue_size
+        self.queue_full_policy = config.queue_full_policy
+        self.fsync_segments = config.fsync_segments
+        self.results_format = config.results_format
+        self.compression = config.compression
+        self.tree_scan_every = config.tree_scan_every
+        self.engine = config.engine
+        self.engine_workers = config.engine_workers
+        self.async_concurrency = config.async_concurrency
+        self.sample_deadline = config.sample_deadline
+        self.rollup = config.rollup
+        self.top_threads = config.top_threads
+        self.top_processes = config.top_processes
+        self.rank_by = config.rank_by
+        self.exit_capture = config.exit_capture
+        # reads final rows of exiting processes on the exit watcher thread
+        self.exit_reader = None
+        # exits stored with their final rows
+        self.exits_stored = 0
+        # snapshot the last sample collected pids of
+        self.sampled_snapshot = ()
+        # (pid, start time) of tracked pids, shared by stores of all segments
+        self.pid_identities = pid_identities()
+        # thread_rollup in rollup mode of process collection, else None
+        self.thread_rollup = None
+        # top_processes in top mode of process collection, else None
+        self.process_filter = None
+        # process_engine or async_engine, None for thread pools
+        self.collection_engine = None
+        # series of completion details of every sample
+        self.sample_tag = config.tool_series_prefix + "sample"
+
+        # flush counter -> sample_store of that flush segment
         self.result = {}
         self.parse_metrics = {}
+        # persistent descriptors for all procfs/sysfs files being sampled
+        self.reader = procfs_reader()
         # process data collection related definitions
         self.p_source_files = {}
         # self.filters = ["numa", "hugepages","memory consumption", "cgroups", "anonymous memory"]
@@ -76,8 +118,7 @@ class collector_helper:
             "surplus_hugepages",
             "free_hugepages",
         ]
-        self.all_pids, self.cpus_to_run_tool = [], []
-        self.all_pids_files = {}
+        self.cpus_to_run_tool = []
         # global generic as well process level data collection related definitions
         self.g_source_files_save_once, self.g_source_files = {}, {}
         self._g_source_files_nodex_sys, self._g_source_files_proc, self.p_files = (
@@ -104,9 +145,19 @@ class collector_helper:
         self.parse_proc_functions = {"stat": self.parse_proc_stat}
         self.parse_sys_functions = {}
         self.parse_pid_functions = {
-            "stat": self.parse_p_proc_stat,
-            "statm": self.parse_p_proc_statm,
+            "stat": self.special_parser_p_proc_stat_statm_file,
+            "statm": self.special_parser_p_proc_stat_statm_file,
+        }
+        self.special_parser_fields = {
+            "stat": self.proc_pid_stat_metrics,
+            "statm": self.proc_pid_statm_metrics,
         }
+        # declared kind and type of metrics of every source
+        self.metric_schema = metric_schema(config.metric_schema_path)
+        # source tag -> parse_plan, compiled once per source
+        self.parse_plans = {}
+        # source key -> (keys, columns, groups) shared by plans of all pids
+        self.pid_file_plans = {}
         _lscpu = lscpu()
         self.numa_nodes = _lscpu["numa_nodes"]
         self.node_cpu_info = (info.numa_hardware_info())["node_cpu_info"]
@@ -204,55 +255,20 @@ class collector_helper:
         system["cmdline"] = cmdline_proc_cmdline
         return system
 
-    def convert_proc_stat_metric_to_logical_metric(self, proc_stat_metric):
-        """
-        @params proc_stat_metric: list
-            proc stat metric list
-        @return
-            _fields for proc stat data collection
-
-        proc_stat -> metric is made in "CPU<cpuno.> metric_name"
-        """
-        _fields = []
-        for cpu in range(self._cpu_count + 1):
-            for metric in proc_stat_metric:
-                if cpu == 0:
-                    _fields.append("CPU " + metric)
-                else:
-                    _fields.append("CPU " + str(cpu - 1) + " " + metric)
-        return _fields
-
     def store_run_info(self):
         """
         store_run_info into final results
         """
         print("Logging metrics:")
         print(self.parse_metrics)
-        self.result[self.flush_counter][global_vars.file_type] = f"{self.parse_metrics}"
-        self.result[self.flush_counter][global_vars.offset] = self.ignore_offset
-        self.result[self.flush_counter][global_vars.system_configuration] = []
-        self.result[self.flush_counter][global_vars.system_configuration].append(
-            dict(self.get_system_details())
-        )
+        info = self.result[self.flush_counter].info
+        info[global_vars.file_type] = f"{self.parse_metrics}"
+        info[global_vars.offset] = self.ignore_offset
+        info[global_vars.system_configuration] = []
+        info[global_vars.system_configuration].append(dict(self.get_system_details()))
         if self.pid == None:
-            self.result[self.flush_counter][global_vars.nr_samples] = self.nr_samples
-        self.result[self.flush_counter][global_vars.sample_period] = self.sample_period
-        self.result[self.flush_counter][global_vars.timestamps] = []
-        self.global_proc_stat_field = []
-        self.global_proc_stat_field = self.convert_proc_stat_metric_to_logical_metric(
-            self.global_proc_stat_metrics
-        )
-        try:
-            if getattr(self, "proc_stat"):
-                if self.parse_metrics["proc_stat"] != [config.all_metric_tags]:
-                    self.new_global_proc_stat_field = []
-                    self.new_global_proc_stat_field = (
-                        self.convert_proc_stat_metric_to_logical_metric(
-                            self.parse_metrics["proc_stat"]
-                        )
-                    )
-        except AttributeError:
-            pass
+            info[global_vars.nr_samples] = self.nr_samples
+        info[global_vars.sample_period] = self.sample_period
 
     def collect_once(self):
         """
@@ -262,406 +278,464 @@ class collector_helper:
         res = {}
         for source in self.g_source_files_save_once:
             try:
-                with open(self.g_source_files_save_once[source], "r") as f:
-                    value = f.read().split()
+                value = self.reader.read(self.g_source_files_save_once[source]).split()
                 res[source] = value[0]
             except FileNotFoundError:
                 print(f"{source} not found")
         return res
 
-    def _get_pid_threads(self, pid):
+    def hand_off_segment(self, counter):
         """
-        @params pid: int
-            pid whose task/tid's have to be collected
+        seal segment of flush counter, once its collection tasks are done,
+        and hand it off to the writer
         """
-        try:
-            path = "/" + config.identifier_pid_proc_files + "/" + str(pid) + "/task/"
-            if os.path.exists(path):
-                self.pid_threads.append(os.listdir(path))
-        except FileNotFoundError:
-            return
-        except ProcessLookupError:
-            print(f"\nHIT PROCESS LOOKUP ERROR IN _get_pid_threads {pid}")
-
-    def get_pid_threads(self, pids):
-        """
-        @params pids: list
-            list of all pids
-
-        @return list
-            self.pid_threads
-
-            n pid's -> [m]*n pid's and tid's
-            make a combined list of all id's
-        """
-        self.pid_threads = []
-        worker_threads = []
-
-        for i in pids:
-            # pid-> pid/task/*
-            worker = threading.Thread(target=self._get_pid_threads, args=(i,))
-            worker_threads.append(worker)
-            worker.start()
-        for thread in worker_threads:
-            thread.join()
-
-        return self.pid_threads
-
-    def update_pid_tid_list(self, key):
-        """
-        update all_pids list with tid if not present
-        """
-        for _ in self._all_pids_tids[key]:
-            if int(_) not in self.all_pids:
-                self.all_pids.append(int(_))
-
-    def monitor_pid_children_threads(self):
-        """
-        This function runs till the time self.run_continue is True
-        checks for parent and children pid, tids of parent and children.
-        by checking in /proc/* and /proc/<pid>/task/*
-        """
-        while self.run_continue:
-            self.thread_check_counter = self.thread_check_counter - 1
-            if not self.pid_ignore_children:
-                try:
-                    children = self.parent.children(recursive=True)
-                except psutil.NoSuchProcess as e:
-                    if children in self.all_pids:
-                        self.all_pids.remove(children)
-                for _ in children:
-                    if _ not in self.all_pids:
-                        self.all_pids.append(_.pid)
-                if not self.pid_ignore_threads:
-                    if self.thread_check_counter == 0 or len(self.all_pids) < 3 * (
-                        self._cpu_count
-                    ):
-                        self._all_pids_tids = self.get_pid_threads(self.all_pids)
-                        worker_threads = []
-                        for key in range(len(self._all_pids_tids)):
-                            worker = threading.Thread(
-                                target=self.update_pid_tid_list, args=(key,)
-                            )
-                            worker_threads.append(worker)
-                            worker.start()
-                        self.thread_check_counter = 5
-            self.all_pids_latest = self.all_pids
-
-    def flush_out_collected_data(self, counter):
-        try:
-            time.sleep(2)
-            o = json.dumps(self.result[counter], indent=4)
-            NewFileName = config.tmpflushdatafilename + str(counter) + ".json"
-            path = os.path.join(self.logs_d, NewFileName)
-            res = open(path, "w")
-            res.write(o)
-            res.close()
-            self.result[counter] = {}
-        except Exception as e:
-            print(e)
+        store = self.result.pop(counter)
+        store.seal()
+        self.writer.submit(counter, store)
 
     def check_result_sizen_flush(self):
         """
-        check result dict size
+        check result store size, estimated incrementally on every append
         if exceeding threshold increment flush counter, flush collected data
         """
-        if (
-            int(sys.getsizeof(pickle.dumps(self.result[self.flush_counter])))
-            > self.flush_limit
-        ):
+        if self.result[self.flush_counter].nbytes > self.flush_limit:
             c = self.flush_counter
-            _thread = threading.Thread(target=self.flush_out_collected_data, args=(c,))
-            # Dont join this thread as it may lead to missing data
-            _thread.start()
             self.flush_counter = int(self.flush_counter) + 1
-            self.result[self.flush_counter] = {}
-            self.result[self.flush_counter]["timestamps"] = []
+            self.result[self.flush_counter] = self.new_store()
+            self.hand_off_segment(c)
+
+    def new_store(self):
+        """
+        @return sample_store
+            for a new flush segment, holding pid rows in rollup or top mode
+        """
+        return sample_store(
+            bool(self.pid and (self.rollup or self.top_processes)),
+            self.pid_identities if self.pid else None,
+        )
+
+    def store_held_rows(self, store, sample):
+        """
+        Store rows of /proc/<pid>/ files held for a complete sample, rolled
+        up in rollup mode and reduced to the top processes in top mode
+
+        @params store: sample_store
+        @params sample: int
+        """
+        rows, totals = store.release(sample), []
+        if self.thread_rollup is not None:
+            rows, totals = self.thread_rollup.roll_up(rows)
+        if self.process_filter is not None:
+            rows, others = self.process_filter.select(rows)
+            totals.extend(others)
+        for tag, pid, res in rows:
+            store.append(tag, sample, res, pid, hold=False)
+        for tag, res in totals:
+            store.append(tag, sample, res)
+
+    def read_exited_process(self, pid):
+        """
+        Read /proc/<pid>/ files of a process which just exited, before its
+        parent reaps it. Runs on the exit watcher thread of the tracker
+        with a reader of its own.
+
+        @params pid: int
 
-    def get_values(self, value):
+        @return list
+            (source key, pid, result) of every file read, empty if the
+            process was already reaped
+        """
+        rows = []
+        for plan in self.compile_pid_plans(pid):
+            if plan.parser is None:
+                continue
+            plan.reader = self.exit_reader
+            res = plan.parser(plan)
+            if res is not None:
+                rows.append((plan.file, pid, res))
+        self.exit_reader.close_pid(pid)
+        return rows
+
+    def store_exits(self, store, sample, collected=()):
+        """
+        Store final rows of processes exited since the previous sample in
+        sample, and [pid, start time, exit ns, captured] in pid_exits of info
+
+        @params store: sample_store
+        @params sample: int
+            None to store pid_exits entries only
+        @params collected: set
+            pids sample already has rows of, their final rows are dropped
+        """
+        exits = store.info.setdefault(global_vars.pid_exits, [])
+        while self.tracker.exits:
+            pid, exit_ns, rows = self.tracker.exits.popleft()
+            if sample is None or pid in collected:
+                rows = []
+            for tag, _, res in rows:
+                store.append(tag, sample, res, pid)
+            start = self.pid_identities.starts.get(pid)
+            exits.append([pid, start, exit_ns, bool(rows)])
+            self.exits_stored += bool(rows)
+
+    def store_final_exits(self, store):
+        """
+        Store exits seen after the last sample, once the tracker is closed.
+        Final rows go to the last sample of store, unless that sample
+        collected the pid or was already rolled up (rollup or top mode).
+
+        @params store: sample_store
+            store of the last flush segment
+        """
+        sample = len(store.timestamps) - 1
+        if sample < 0 or store.held is not None:
+            sample = None
+        self.store_exits(store, sample, set(self.sampled_snapshot))
+
+    def collect_segment_task(self, store, barrier, sources, function, *args):
+        """
+        run a collection task of sources writing into store, store can't
+        be sealed and sample isn't complete until this returns
+        """
         try:
-            return int(re.sub("[^\d\.]", "", value.strip()))
-        except:
-            return value.strip()
+            function(*args)
+        finally:
+            barrier.task_done(sources)
+            store.task_done()
 
-    def generic_parser(self, file, delimiter, source, pid):
+    def compile_parse_plan(self, source, hint, path=None):
         """
-        @params file: str
-            Path of file to be collected
-        @params delimiter: str
-            separator for metric and value pair
         @params source: str
-            metric_tag -> "<proc/sys/p_proc><_><filename>
-        @params pid
-            for global collection acts like a hint is equal to -1
-            for  process collection pid is provided
+            source tag of file to be collected
+        @params hint: int
+            global : -1
+            process collection : 1
+        @params path: str
+            path of /proc/<pid>/ file for process collection
+
+        @return parse_plan
+            plan.parser is None if source is not supported
+
+        Everything derivable from the source tag (parser, separator,
+        selected metrics, metric name prefix) is resolved here once,
+        so that the per sample parsing only runs the plan.
+        """
+        tmp = source.split("_")
+        if hint == -1:
+            path = self.g_source_files[source]
+            pid = None
+            if check_nodex_sys_source_file_tag(source):
+                config_key = tmp[1] + "_" + tmp[2]
+                parse_functions = self.parse_sys_functions
+            else:
+                config_key = source
+                parse_functions = self.parse_proc_functions
+        else:
+            pid = int(tmp[0])
+            config_key = "p_" + tmp[1] + "_" + tmp[2]
+            parse_functions = self.parse_pid_functions
+
+        tail = path.split("/")[-1]
+        selected = self.parse_metrics[config_key]
+        if selected == [config.all_metric_tags]:
+            selected = None
+        else:
+            selected = set(selected)
+
+        if tail in parse_functions:
+            plan = parse_plan(source, path, parse_functions[tail], pid)
+        elif config_key in self.generic_parser_separators:
+            plan = parse_plan(source, path, self.generic_parser, pid)
+            plan.separator = self.generic_parser_separators[config_key].encode()
+        else:
+            print("Doesn't support", path)
+            return parse_plan(source, path, None, pid)
+
+        plan.metrics = selected
+        plan.schema = self.metric_schema.source(config_key)
+        if pid is not None:
+            # rows of all pids are stored under the source key with the
+            # same metric names, so names and columns are made once per file
+            plan.file = config_key
+            shared = self.pid_file_plans.get(config_key)
+            if shared is None:
+                columns = []
+                if tail in self.special_parser_fields:
+                    columns = [
+                        (index, sys.intern(metric), plan.schema.type(metric))
+                        for index, metric in enumerate(self.special_parser_fields[tail])
+                        if plan.selects(metric)
+                    ]
+                shared = self.pid_file_plans[config_key] = (
+                    plan.keys,
+                    columns,
+                    column_groups(columns) if columns else None,
+                )
+            plan.keys, plan.columns, plan.groups = shared
+        elif check_nodex_sys_source_file_tag(source):
+            # special cases making metrics to be named like
+            # Node <numa node number> <metric>
+            if "numastat" in source or "vmstat" in source:
+                plan.prefix = "Node " + tmp[0][4:] + " "
+            else:
+                plan.metric_field = 2
+        elif source == "proc_stat":
+            plan.columns = [
+                (index, metric)
+                for index, metric in enumerate(self.global_proc_stat_metrics)
+                if plan.selects(metric)
+            ]
+            # rows of every possible cpu id, offline cpus may have the
+            # highest ids
+            plan.labels = (
+                ("CPU",)
+                + tuple(f"CPU {cpu}" for cpu in range(possible_cpu_count())),
+                tuple(metric for _, metric in plan.columns),
+            )
+        return plan
+
+    def compile_parse_plans(self):
+        for source in self.g_source_files:
+            self.parse_plans[source] = self.compile_parse_plan(source, -1)
+
+    def generic_parser(self, plan):
+        """
+        @params plan: parse_plan
+            plan of "<metric><separator><value>" per line file
 
         @return res: dict
             return with a {metric: value,metric: value, ... }
+
+        File is parsed as bytes, int values are converted straight from
+        bytes and metric names are looked up in plan.keys, so no str is
+        made per line once metric names are known. Values are converted
+        to the type declared in metric_schema.yaml.
         """
         res = {}
-        FlagforNode = False
-        if check_nodex_sys_source_file_tag(source):
-            parts = source.split("_")
-            _source = "_".join(parts[1:])
-            NodeNo = parts[0][4:]
-            FlagforNode = True
-        elif pid != -1:
-            _source = "_".join(source.split("_")[1:])
-            _source = "p_" + _source
-        else:
-            _source = source
+        separator, keys = plan.separator, plan.keys
         try:
-            with open(file, "r") as f:
-                for line in f.readlines():
-                    if delimiter in line:
-                        metric, value = line.split(delimiter, 1)
-                        metric = metric.strip()
-                        if pid != -1:
-                            metric = pid + " " + metric
-                        elif FlagforNode:
-                            # special cases making metrics to be named like
-                            # Node <numa node number> <metric>
-                            if "numastat" in source or "vmstat" in source:
-                                metric = "Node " + NodeNo + " " + metric
-
-                        if self.parse_metrics[_source] == [config.all_metric_tags]:
-                            res[metric] = self.get_values(value)
-                        else:
-                            if pid == -1:
-                                if FlagforNode:
-                                    _metric = (metric.split(" "))[2]
-                                    if _metric in self.parse_metrics[_source]:
-                                        res[metric] = self.get_values(value)
-                                else:
-                                    if metric in self.parse_metrics[_source]:
-                                        res[metric] = self.get_values(value)
-                            elif pid != -1:
-                                _metric = (metric.split(" ", 1))[1]
-                                if _metric in self.parse_metrics[_source]:
-                                    res[metric] = self.get_values(value)
-
-        except ValueError:
-            print(
-                "\nValue Error occurred in Fetching data\n",
-                "file=",
-                file,
-                "delimiter=",
-                delimiter,
-                "source=",
-                source,
-                "Line=",
-                line,
-            )
-        except FileNotFoundError:
-            return self.default_not_found_value
-        except ProcessLookupError:
-            print(f"\nHIT PROCESS LOOKUP ERROR IN {source}")
-            return self.default_not_found_value
+            reader = plan.reader or self.reader
+            data = reader.readinto(plan.path, plan.pid).tobytes()
+            for line in data.splitlines():
+                metric, found, value = line.partition(separator)
+                if not found:
+                    continue
+                key = keys.get(metric, False)
+                if key is False:
+                    key = plan.key(metric)
+                if key is None:
+                    continue
+                key, kind = key
+                if kind is int or kind is None:
+                    # "<int>" and "<int> <unit>" without raising on the unit
+                    if value.isdigit():
+                        res[key] = int(value)
+                        continue
+                    number, _, unit = value.strip().partition(b" ")
+                    if number.isdigit() and (not unit or unit.isalpha()):
+                        res[key] = int(number)
+                        continue
+                res[key] = convert_declared_value(value, kind)
+        except (FileNotFoundError, ProcessLookupError):
+            if plan.pid is None:
+                print(f"\n{plan.path} not found")
+            elif plan.reader is None:
+                # exit reads (own reader) run on the exit watcher thread,
+                # the registry belongs to collection
+                self.registry.retire(plan.pid)
+            return None
         return res
 
-    def parse_proc_stat(self, source):
-        lines_count, start_index, end_index = 0, 0, 0
-        words = []
-        res = {}
+    def parse_proc_stat(self, plan):
+        """
+        @params plan: parse_plan
+            plan.columns has (position, metric name) of selected fields
+
+        @return metric_block
+            (possible cpus + 1) x selected fields, row 0 is the "cpu" line
+            and row n + 1 is cpu n, rows of cpus not listed (offline) and
+            fields not given by the kernel are -1
+
+        cpu lines are converted to int64 in one go by numpy, with the
+        "cpu<n>" label of every line replaced by n (-1 for "cpu").
+        """
         try:
-            with open("/proc/stat", "r") as f:
-                for line in f.readlines():
-                    if lines_count <= self._cpu_count:
-                        words = line.split()
-                        start_index = end_index
-                        end_index = end_index + len(words) - 1
-                        small_proc_stat = self.global_proc_stat_field[
-                            start_index:end_index
-                        ]
-                        for word, index in zip(words[1:], small_proc_stat):
-                            try:
-                                word = int(word)
-                            except Exception as e:
-                                word = str(word)
-                            res[index] = word
-                        lines_count = lines_count + 1
-            if self.parse_metrics[source] != [config.all_metric_tags]:
-                _res = {}
-                for key in res.keys():
-                    if key in self.new_global_proc_stat_field:
-                        _res[key] = res[key]
-                res = _res
-            return res
-        except ProcessLookupError:
-            print(f"\nHIT PROCESS LOOKUP ERROR IN {source}")
-            return self.default_not_found_value
+            data = self.reader.readinto(plan.path).tobytes()
+        except (FileNotFoundError, ProcessLookupError):
+            print(f"\n{plan.path} not found")
+            return None
+        end = data.find(b"\n", data.rfind(b"\ncpu") + 1)
+        width = len(data[: data.find(b"\n")].split())
+        block = data[:end].replace(b"cpu ", b"-1 ").replace(b"cpu", b"")
+        try:
+            values = np.fromstring(block, dtype=np.int64, sep=" ")
+            values = values.reshape(-1, width)
+        except ValueError as e:
+            print(f"\n{plan.path}: {e}")
+            return None
+        rows = values[:, 0] + 1
+        rows_kept = rows < len(plan.labels[0])
+        fields = np.array([index for index, _ in plan.columns], dtype=np.int64)
+        fields_kept = fields < width - 1
+        matrix = np.full(
+            (len(plan.labels[0]), len(plan.labels[1])), -1, dtype=np.int64
+        )
+        matrix[np.ix_(rows[rows_kept], fields_kept.nonzero()[0])] = values[
+            np.ix_(rows_kept.nonzero()[0], fields[fields_kept] + 1)
+        ]
+        return metric_block(matrix, plan.labels)
 
-    def special_parser_p_proc_stat_statm_file(self, source, metrics):
+    def special_parser_p_proc_stat_statm_file(self, plan):
         """
-        @params source: str
-            "<p_proc><_><filename>
-        @params metrics: list
-            list of metric name for values
+        @params plan: parse_plan
+            plan.columns has (position, metric name, declared type) of
+            selected metrics
         @return res: dict
         parse /proc/pid/stat and /proc/pid/statm data
+
+        exe name of stat is taken between the first "(" and the last ")",
+        so names holding spaces or ")" don't shift the other fields.
         """
         res = {}
-        pid = source.split("_")[0]
-        _source = "p_" + "_".join(source.split("_")[1:])
+        pid = plan.pid
+        try:
+            reader = plan.reader or self.reader
+            data = reader.readinto(plan.path, pid).tobytes()
+            line = data.split(b"\n", 1)[0]
+        except (FileNotFoundError, ProcessLookupError):
+            if plan.reader is None:
+                self.registry.retire(pid)
+            return None
+        if b"(" in line:
+            head, _, tail = line.partition(b" (")
+            name, _, tail = tail.rpartition(b")")
+            words = [head, b"(" + name + b")"] + tail.split()
+        else:
+            words = line.split()
+        names, groups = plan.groups
+        res = dict.fromkeys(names)
         try:
-            with open(self.all_pids_files[source], "r") as f:
-                data = f.readline().split()
-                for i, j in zip(metrics, data):
-                    i = pid + " " + i
-                    res[i] = j
-                if self.parse_metrics[_source] != [config.all_metric_tags]:
-                    metrics = self.parse_metrics[_source]
-                    _res = {}
-                    for key, value in res.items():
-                        _key = key.split(" ", 1)[1]
-                        if _key in metrics:
-                            _res[key] = value
-                    res = _res
-        except FileNotFoundError:
-            if pid in self.all_pids:
-                self.all_pids.remove(pid)
-            return self.default_not_found_value
-        except ProcessLookupError:
-            print(f"HIT PROCESS LOOKUP ERROR IN {source}")
-            if pid in self.all_pids:
-                self.all_pids.remove(pid)
-            return self.default_not_found_value
+            for getter, metrics, kind in groups:
+                if kind is int or kind is float:
+                    res.update(zip(metrics, map(kind, getter(words))))
+                elif kind is str:
+                    res.update(zip(metrics, map(bytes.decode, getter(words))))
+                else:
+                    for metric, word in zip(metrics, getter(words)):
+                        res[metric] = convert_declared_value(word, kind)
+            return res
+        except (IndexError, ValueError):
+            # missing fields (older kernels) or values not of declared type
+            pass
+        res = {}
+        for index, metric, kind in plan.columns:
+            if index < len(words):
+                res[metric] = convert_declared_value(words[index], kind)
         return res
 
-    def parse_p_proc_stat(self, source):
-        metrics = self.proc_pid_stat_metrics
-        return self.special_parser_p_proc_stat_statm_file(source, metrics)
-
-    def parse_p_proc_statm(self, source):
-        metrics = self.proc_pid_statm_metrics
-        return self.special_parser_p_proc_stat_statm_file(source, metrics)
-
-    def call_generic_parser(self, source):
-        tmp = source.split("_")
-        if check_proc_file_tag(source):
-            return self.generic_parser(
-                self.g_source_files[source],
-                self.generic_parser_separators[source],
-                source,
-                -1,
-            )
-        elif check_nodex_sys_source_file_tag(source):
-            filename = tmp[1] + "_" + tmp[2]
-            return self.generic_parser(
-                self.g_source_files[source],
-                self.generic_parser_separators[filename],
-                source,
-                -1,
-            )
-        elif check_path_pid_proc_file_tag(source):
-            pid = tmp[0]
-            filename = "p_" + tmp[1] + "_" + tmp[2]
-            return self.generic_parser(
-                self.all_pids_files[source],
-                self.generic_parser_separators[filename],
-                source,
-                pid,
-            )
-
-    def proc_sys_collect(self, source, str_current_datetime, hint):
+    def proc_sys_collect(self, source, store, sample, hint):
         """
         @params source: str
             source tag of file to be collected
-        @params str_current_datetime: str
-            timestamp for collection identification
+        @params store: sample_store
+            store of flush segment the sample belongs to
+        @params sample: int
+            index of sample in store
         @params hint: str
             global : -1
             process collection : 1
         @return
-            update result = {timestamp:{res}}
-        This function takes decision on which parser to call a/c to the
-        source and hint, checking if a special parser available for them
-        then calling that or if not checking if a separator is available
-        else prompt not supported and continue.
-        """
-        res = []
-        counter = self.flush_counter
-        if int(hint) == -1:
-            _path = self.g_source_files[source].split("/")
-            tail = _path[len(_path) - 1]
-            if _path[1] in config.identifier_proc_files:  # proc_->
-                if tail in self.parse_proc_functions:
-                    res.append(self.parse_proc_functions[tail](source))
-                else:
-                    try:
-                        res.append(self.call_generic_parser(source))
-                    except:
-                        print("Doesn't support", self.g_source_files[source])
-            if (
-                _path[1] in config.identifier_sys_numanode_files
-            ):  # /sys/*/numa(i)/file sys_ sys_shed -> /sys/
-                if tail in self.parse_sys_functions:
-                    res.append(self.parse_sys_functions[tail](source))
-                else:
-                    try:
-                        res.append(self.call_generic_parser(source))
-                    except:
-                        print("Doesn't support", self.g_source_files[source])
-        elif int(hint) == 1:
-            _path = self.all_pids_files[source].split("/")
-            tail = _path[len(_path) - 1]
-            if _path[1] in config.identifier_pid_proc_files:  # /proc/pid/file
-                if tail in self.parse_pid_functions:
-                    res.append(self.parse_pid_functions[tail](source))
-                else:
-                    try:
-                        res.append(self.call_generic_parser(source))
-                    except:
-                        print("Doesn't support", self.g_source_files[source])
-        tempd = {}
-        tempd[str_current_datetime] = res
-        self.result[counter][source][0].update(tempd)
+            append parsed {metric: value} as a row of source in store
+        This function runs the parse plan compiled for the source,
+        unsupported sources are skipped.
+        """
+        plan = self.parse_plans[source]
+        if plan.parser is None:
+            return
+        res = plan.parser(plan)
+        if res is not None:
+            store.append(source, sample, res)
 
-    def collect_global_data(self, str_current_datetime):
+    def collect_global_data(self, store, sample, barrier):
         """
         collect global files data from g_source_files list
-        at a current timestamp.
+        for a sample.
         """
         for source in self.g_source_files:
-            if source not in self.result[self.flush_counter]:
-                self.result[self.flush_counter][source] = []
-                self.result[self.flush_counter][source].append({})
+            store.task_started()
+            barrier.task_started()
             self.global_executor.submit(
-                self.proc_sys_collect, source, str_current_datetime, -1
+                self.collect_segment_task,
+                store,
+                barrier,
+                1,
+                self.proc_sys_collect,
+                source,
+                store,
+                sample,
+                -1,
             )
 
-    def pid_path_to_procfs(self, pid):
+    def compile_pid_plans(self, pid):
+        """
+        @params pid: int
+
+        @return list
+            parse_plan of every process file of pid
+        """
+        plans = []
         for _file in self.p_files:
             tag = tag_pid_proc_file("proc", pid, _file)
-            self.all_pids_files[tag] = path_pid_proc_file(
-                config.identifier_pid_proc_files, pid, _file
-            )
+            path = path_pid_proc_file(config.identifier_pid_proc_files, pid, _file)
+            plans.append(self.compile_parse_plan(tag, 1, path))
+        return plans
 
-    def p_proc_sys_collect_caller(self, start, str_current_datetime):
-        for source in list(self.all_pids_files.keys())[start : start + self.batch_size]:
-            self.proc_sys_collect(source, str_current_datetime, 1)
+    def p_proc_sys_collect_caller(self, plans, store, sample):
+        for plan in plans:
+            res = plan.parser(plan)
+            if res is not None:
+                store.append(plan.file, sample, res, plan.pid)
 
-    def collect_process_data(self, str_current_datetime):
+    def collect_process_data(self, store, sample, barrier, snapshot):
         """
         collect process related data from files for all pids under monitoring
-        at a current timestamp.
+        for a sample.
         """
         # utilization=check_tool_cpus_util(self.cpus_to_run_tool)
 
-        for _ in list(set(self.all_pids_latest)):
-            self.pid_path_to_procfs(_)
-        for source in self.all_pids_files:
-            if source not in self.result[self.flush_counter]:
-                self.result[self.flush_counter][source] = []
-                self.result[self.flush_counter][source].append({})
-
-        pidListBatchSplit = []
-        for i in range(0, len(self.all_pids_files), self.batch_size):
-            pidListBatchSplit.append(i)
-        self.pid_executor.map(
-            self.p_proc_sys_collect_caller,
-            pidListBatchSplit,
-            repeat(str_current_datetime),
+        self.registry.sync(snapshot)
+        for plans in self.registry.batches:
+            store.task_started()
+            barrier.task_started()
+            self.pid_executor.submit(
+                self.collect_segment_task,
+                store,
+                barrier,
+                len(plans),
+                self.p_proc_sys_collect_caller,
+                plans,
+                store,
+                sample,
+            )
+
+    def store_sample_completion(
+        self, store, sample, intended_ns, start_ns, done_ns, barrier
+    ):
+        """
+        append completion details of a sample as a row of sample_tag, times
+        in seconds
+        """
+        store.append(
+            self.sample_tag,
+            sample,
+            {
+                "tick delay": (start_ns - intended_ns) / 1e9,
+                "completion time": (done_ns - self.scheduler.start_ns) / 1e9,
+                "sources": barrier.sources,
+                "late sources": barrier.late_sources,
+                "next tick delayed": int(self.scheduler.delayed),
+                "skipped ticks": self.scheduler.missed,
+            },
         )
 
     def check_pid_status(self, pid):
@@ -676,41 +750,48 @@ class collector_helper:
         This function is for collection of data until self.run_continue is enabled
         in sampling period time gaps
         checks for flushing requirement every iteration
-        takes care of sampling time gap for accuracy in collection gaps
+        sample ticks are scheduled on monotonic deadlines by sample_scheduler,
+        every sample is awaited with a sample_barrier before the next tick,
+        scheduled, start and completion time of each sample is stored in
+        sample_times, and its completion details in sample_tag series
         It has two modes
         1. Collect global data
         2. Collect process level data
         stores results in result
         """
-        str_last_current_datetime = "0"
+        self.scheduler = sample_scheduler(
+            self.sample_period, self.align_samples, self.overrun_policy
+        )
+        samples = 0
         try:
             while self.run_continue:
                 self.check_result_sizen_flush()
                 print("*", end=" ", flush=True)
-                current_datetime = datetime.datetime.now().strftime(
-                    config.timestamps_style
-                )
-                str_current_datetime = str(current_datetime)
-                current_time = timestamp_to_seconds(str_current_datetime)
-                if str_last_current_datetime != "0":
-                    last_time = timestamp_to_seconds(str_last_current_datetime)
-                    time_difference = (self.sample_period + last_time) - current_time
-                else:
-                    time_difference = 0
-                    last_time = 0
-
-                if time_difference <= 0:
-                    time.sleep(self.sample_period)
+                intended_ns, start_ns = self.scheduler.wait_next_tick()
+                store = self.result[self.flush_counter]
+                sample = store.add_sample(intended_ns, start_ns)
+                barrier = sample_barrier(self.scheduler.next_deadline())
+                if self.pid and self.tracker.exits:
+                    # exited pids are out of the snapshot read below
+                    self.store_exits(store, sample)
+                snapshot = self.tracker.snapshot if self.pid else ()
+                self.sampled_snapshot = snapshot
+                if self.collection_engine is not None:
+                    self.collection_engine.submit(store, sample, barrier, snapshot)
                 else:
-                    time.sleep(time_difference)
-                    str_last_current_datetime = str_current_datetime
-
-                self.result[self.flush_counter][global_vars.timestamps].append(
-                    str_current_datetime
+                    self.collect_global_data(store, sample, barrier)
+                    if self.pid:
+                        self.collect_process_data(store, sample, barrier, snapshot)
+                done_ns = barrier.wait()
+                store.end_sample(sample, self.scheduler.sample_done())
+                if store.held is not None:
+                    self.store_held_rows(store, sample)
+                self.store_sample_completion(
+                    store, sample, intended_ns, start_ns, done_ns, barrier
                 )
-                self.collect_global_data(str_current_datetime)
-                if self.pid:
-                    self.collect_process_data(str_current_datetime)
+                samples += 1
+                if self.pid and samples % self.tree_scan_every == 0:
+                    self.tracker.request_scan()
                 if self.nr_samples != None:
                     if self.nr_samples <= 1 or not self.check_pid_status(self.pid):
                         self.run_continue = False
@@ -720,9 +801,9 @@ class collector_helper:
                 if self.pid:
                     if not self.run_continue:
                         # flush remaining data
-                        self.result[self.flush_counter][global_vars.all_pids] = []
-                        self.result[self.flush_counter][global_vars.all_pids].append(
-                            self.all_pids_latest
+                        info = self.result[self.flush_counter].info
+                        info[global_vars.all_pids] = self.pid_identities.all_pids(
+                            self.tracker.seen
                         )
         except Exception as e:
             print(e)
@@ -738,26 +819,30 @@ class collector_helper:
 
     def aggregate_results(self):
         """
-        Aggregate flushed results in multiple files to single result set,
-        offset enabled in default, remove flushed multiple files after merger.
+        Aggregate flushed segments to single result set, offset enabled
+        in default, remove segment log after merger.
+        Aggregation holds about FLUSH_LIMIT bytes of results at a time.
         """
         AggResObj = AggregateResult()
         AggResObj.path = self.logs_d
         AggResObj.global_varslist = self.global_varslist
+        AggResObj.memory_limit = self.flush_limit
+        AggResObj.merged_data_raw[global_vars.writer_stats] = [self.writer.stats()]
+        print("Writer:", self.writer.stats())
+        final_path = os.path.join(self.logs_d, self.output_file_name)
 
         try:
-            AggResObj.read_data()
+            results_file = AggResObj.aggregate(
+                final_path,
+                self.results_format,
+                self.compression,
+                offset=not self.ignore_offset,
+                csv_result=self.csv_result,
+            )
+            print(f"Results at: {results_file}")
         except Exception as e:
             print(e)
-
-        if not self.ignore_offset:
-            AggResObj.offset_data()
-        final_path = os.path.join(self.logs_d, self.output_file_name)
-        AggResObj.write_merged_data_to_file(final_path)
-        if self.csv_result:
-            AggResObj.write_csv_data(data=AggResObj.merged_data, file_name=final_path)
         AggResObj.remove_all_temp_result_files()
-        print(f"Results at: {final_path}.json")
 
     def store_results(self):
         """
@@ -770,15 +855,41 @@ class collector_helper:
         time.sleep(1)
 
         try:
-            self.global_executor.shutdown()
+            if self.collection_engine is not None:
+                self.collection_engine.close()
+                engine_stats = self.collection_engine.stats()
+                self.result[self.flush_counter].info[
+                    global_vars.engine_stats
+                ] = engine_stats
+                print("Engine:", engine_stats)
+            else:
+                self.global_executor.shutdown()
+                if self.pid is not None:
+                    self.pid_executor.shutdown()
             if self.pid is not None:
-                self.pid_executor.shutdown()
-                self.result[self.flush_counter][global_vars.all_pids] = []
-                self.result[self.flush_counter][
-                    global_vars.all_pids
-                ] = self.all_pids_latest
-                self.MonitoringThread.shutdown(wait=False)
-            self.flush_out_collected_data(self.flush_counter)
+                self.tracker.close()
+                self.store_final_exits(self.result[self.flush_counter])
+                info = self.result[self.flush_counter].info
+                info[global_vars.all_pids] = self.pid_identities.all_pids(
+                    self.tracker.seen
+                )
+                tracker_stats = self.tracker.stats()
+                tracker_stats["exits captured"] = self.exits_stored
+                tracker_stats["pids reused"] = self.pid_identities.reused
+                info[global_vars.tracker_stats] = [tracker_stats]
+                reducers = [
+                    i
+                    for i in (self.thread_rollup, self.process_filter)
+                    if i is not None
+                ]
+                if reducers:
+                    info[global_vars.rollup_stats] = [i.stats() for i in reducers]
+                print("Process tree:", self.tracker.stats(history=False))
+            self.reader.close_all()
+            if self.exit_reader is not None:
+                self.exit_reader.close_all()
+            self.hand_off_segment(self.flush_counter)
+            self.writer.close()
             self.aggregate_results()
             if self.workload_given:
                 if not self.ignore_workload_logs:
@@ -797,21 +908,46 @@ class collector_helper:
         store run info
         collect and store results of files for single time sampling
         hold for delay_time if any
+        fork collection workers if engine is "process"
+        or set up event loop if engine is "async"
         start pid monitoring alive and pid,tid list on separate thread
         start collection
         store results, stop separate threads, aggregate results
         return
         """
-        self.result[self.flush_counter] = {}
+        self.result[self.flush_counter] = self.new_store()
         os.sched_setaffinity(0, self.cpus_to_run_tool)  # tool_cpu_affinity
         self.store_run_info()
+        self.compile_parse_plans()
         # collect global elements to be parsed once
         self.res_g_source_files_save_once = self.collect_once()
-        self.result[self.flush_counter].update(self.res_g_source_files_save_once)
+        self.result[self.flush_counter].info.update(self.res_g_source_files_save_once)
         self.global_varslist = config.global_varslist
         self.global_varslist = self.global_varslist + list(
             self.res_g_source_files_save_once.keys()
         )
+        # raises for a pid gone, before workers, rings and the writer exist
+        self.parent = psutil.Process(self.pid)
+        # workers are forked before any other thread of the tool is started
+        if self.engine == "process":
+            self.collection_engine = process_engine(
+                self,
+                self.engine_workers or len(self.cpus_to_run_tool),
+                self.cpus_to_run_tool,
+            )
+            self.collection_engine.start()
+        elif self.engine == "async":
+            self.collection_engine = async_engine(
+                self,
+                self.async_concurrency,
+                self.sample_deadline or self.sample_period,
+            )
+        self.writer = segment_writer(
+            self.logs_d,
+            self.writer_queue_size,
+            self.queue_full_policy,
+            self.fsync_segments,
+        )
         # below if block is for threads synchronization purpose
         if self.delay_time > 0:
             wait_time = self.delay_time
@@ -822,19 +958,38 @@ class collector_helper:
         self.run_continue = True
         # 0=global parsing only ; 1=pid related parsing
         if self.pid:
-            self.result[self.flush_counter][global_vars.offset] = []
+            self.result[self.flush_counter].info[global_vars.offset] = []
 
         print("Collecting...")
-        self.parent = psutil.Process(self.pid)
-        self.all_pids.append(self.parent.pid)
-        self.all_pids_latest = self.all_pids
-        self.thread_check_counter = 1
-        self.global_executor = ThreadPoolExecutor(max_workers=self._cpu_count)
+        if self.collection_engine is None:
+            self.global_executor = ThreadPoolExecutor(max_workers=self._cpu_count)
         if self.pid:
-            self.pid_executor = ThreadPoolExecutor(max_workers=self._cpu_count)
-            self.Counter_CheckingPidsList = 0
-            self.MonitoringThread = ThreadPoolExecutor(max_workers=1)
-            self.MonitoringThread.submit(self.monitor_pid_children_threads)
+            if self.collection_engine is None:
+                self.pid_executor = ThreadPoolExecutor(max_workers=self._cpu_count)
+            if self.exit_capture:
+                self.exit_reader = procfs_reader()
+            self.registry = pid_registry(
+                self.reader, self.compile_pid_plans, self.batch_size
+            )
+            self.tracker = process_tree(
+                self.parent.pid,
+                not self.pid_ignore_children,
+                not self.pid_ignore_threads,
+                on_exit=self.read_exited_process if self.exit_capture else None,
+            )
+            self.tracker.start()
+            if self.rollup:
+                self.thread_rollup = thread_rollup(
+                    self.metric_schema, self.tracker, self.top_threads
+                )
+            if self.top_processes:
+                self.process_filter = top_processes(
+                    self.thread_rollup
+                    or thread_rollup(self.metric_schema, self.tracker, 0),
+                    self.top_processes,
+                    self.rank_by,
+                    self.thread_rollup is not None,
+                )
         self.collect()
         print("Saving logs...")
         self.store_results()
@@ -54,7 +54,7 @@ class comparator:
             "-f",
             "--files",
             type=str,
-            help="Path to results(json) of runs for comparison separated by `,`",
+            help="Path to results(json/binary) of runs for comparison separated by `,`",
         )
         return parser
 
@@ -110,7 +110,7 @@ class comparator:
             except:
                 getattr(self, "r" + str(i) + "_tool_details_print")[
                     "Parent PID"
-                ] = getattr(self, "r" + str(i) + "_data").df[global_vars.all_pids][0][0]
+                ] = getattr(self, "r" + str(i) + "_data").parent_pid
             for _key, _value in getattr(
                 self, "r" + str(i) + "_tool_details_print"
             ).items():
@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+from fnmatch import fnmatchcase
+from syswit.utils import (
+    generic_yaml_parser,
+    check_nodex_sys_source_file_tag,
+    check_path_pid_proc_file_tag,
+    check_total_proc_file_tag,
+)
+
+
+class source_schema:
+    """
+    Declared metrics of one source, ex: "proc_meminfo", "p_proc_stat".
+
+    declaration(metric) is (kind, type) of the metric as named in the
+    file, without prefix, or None if it is not declared.
+
+    For /proc/<pid>/ sources, per_thread(metric) tells if the metric is of
+    the thread the file is read for, other metrics are the same for all
+    threads of a process. additive(metric) tells if a gauge adds up over
+    processes, ex: memory.
+    """
+
+    def __init__(
+        self, default=None, metrics=None, patterns=None, per_thread=(), additive=()
+    ):
+        """
+        @params default: tuple
+            (kind, type) of metrics not listed, None if not declared
+        @params metrics: dict
+            metric name -> (kind, type)
+        @params patterns: list
+            [(fnmatch pattern, (kind, type))] in order
+        @params per_thread, additive: list
+            metric names or fnmatch patterns
+        """
+        self.default = default
+        self.metrics = metrics or {}
+        self.patterns = patterns or []
+        self.per_thread_patterns = list(per_thread)
+        self.additive_patterns = list(additive)
+        self.cache = {}
+
+    def declaration(self, metric):
+        declaration = self.cache.get(metric, False)
+        if declaration is False:
+            declaration = self.metrics.get(metric)
+            if declaration is None:
+                for pattern, pattern_declaration in self.patterns:
+                    if fnmatchcase(metric, pattern):
+                        declaration = pattern_declaration
+                        break
+                else:
+                    declaration = self.default
+            self.cache[metric] = declaration
+        return declaration
+
+    def kind(self, metric):
+        declaration = self.declaration(metric)
+        return None if declaration is None else declaration[0]
+
+    def type(self, metric):
+        declaration = self.declaration(metric)
+        return None if declaration is None else declaration[1]
+
+    def per_thread(self, metric):
+        return any(fnmatchcase(metric, i) for i in self.per_thread_patterns)
+
+    def additive(self, metric):
+        return any(fnmatchcase(metric, i) for i in self.additive_patterns)
+
+
+class metric_schema:
+    """
+    Registry of declared kind (counter, gauge, enum, text) and type (int,
+    float, str) of metrics of every supported source, loaded from
+    metric_schema.yaml.
+
+    Parsers convert values to the declared type and aggregation offsets
+    counters only, metrics not declared keep the type inferred from their
+    value and are offset if they look like counters.
+    """
+
+    kinds = {"counter": int, "gauge": int, "enum": str, "text": str}
+    types = {"int": int, "float": float, "str": str}
+    # kinds offset to the first sample
+    offset_kinds = {"counter"}
+
+    def __init__(self, path):
+        """
+        @params path: str
+            path of metric_schema.yaml
+        """
+        self.sources = {}
+        for key, declarations in (generic_yaml_parser(path) or {}).items():
+            declarations = declarations or {}
+            metrics, patterns = {}, []
+            for metric, value in (declarations.get("metrics") or {}).items():
+                if any(i in metric for i in "*?["):
+                    patterns.append((metric, self.parse_declaration(key, value)))
+                else:
+                    metrics[metric] = self.parse_declaration(key, value)
+            default = declarations.get("default")
+            if default is not None:
+                default = self.parse_declaration(key, default)
+            self.sources[key] = source_schema(
+                default,
+                metrics,
+                patterns,
+                declarations.get("per_thread") or (),
+                declarations.get("additive") or (),
+            )
+        self.empty = source_schema()
+
+    def parse_declaration(self, key, value):
+        """
+        @params value: str
+            "<kind>" or "<kind> <type>"
+
+        @return (kind, type)
+        """
+        words = str(value).split()
+        if not words or words[0] not in self.kinds or len(words) > 2:
+            raise ValueError(f"Incorrect metric declaration {value} of {key}")
+        kind = words[0]
+        if len(words) == 1:
+            return kind, self.kinds[kind]
+        if words[1] not in self.types:
+            raise ValueError(f"Incorrect metric type {words[1]} of {key}")
+        return kind, self.types[words[1]]
+
+    def source(self, key):
+        """
+        @params key: str
+            key of source in collector configs, ex: "p_proc_stat"
+
+        @return source_schema
+        """
+        return self.sources.get(key, self.empty)
+
+    def source_of_tag(self, tag):
+        """
+        @params tag: str
+            source tag, ex: "12_proc_stat", "node0_sys_vmstat"
+
+        @return (source_schema, prefix)
+            prefix is prepended to metric names of the source in results,
+            "12 " for pid sources, "workload " or "other " for totals of
+            pid sources, "Node " for numa node sources
+        """
+        words = tag.split("_")
+        if check_path_pid_proc_file_tag(tag) or check_total_proc_file_tag(tag):
+            return self.source("p_" + "_".join(words[1:])), words[0] + " "
+        if check_nodex_sys_source_file_tag(tag):
+            return self.source("_".join(words[1:])), "Node "
+        return self.source(tag), ""
+
+    def declarations(self, tag, metrics):
+        """
+        @params tag: str
+            source tag
+        @params metrics: list
+            metric names as in results
+
+        @return list
+            (kind, type) of every metric, None if not declared
+        """
+        schema, prefix = self.source_of_tag(tag)
+        res = []
+        for metric in metrics:
+            if prefix == "Node " and metric.startswith(prefix):
+                # "Node <n> <metric>"
+                metric = metric.split(" ", 2)[-1]
+            elif prefix and metric.startswith(prefix):
+                metric = metric[len(prefix) :]
+            res.append(schema.declaration(metric))
+        return res
@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import sys
+from operator import itemgetter
+from syswit.metric_schema import source_schema
+
+
+class parse_plan:
+    """
+    Parsing details of a single source tag, compiled once when the source
+    is added to collection and reused for every sample.
+
+    source       : source tag, ex: "proc_meminfo", "node0_sys_vmstat", "12_proc_status"
+    file         : tag rows are stored under, source for global sources,
+                   source key for /proc/<pid>/ sources (ex: "p_proc_status")
+                   whose rows are stored per pid under it
+    path         : procfs/sysfs path of the source
+    parser       : collector_helper parser called with this plan
+    pid          : pid(int) for /proc/<pid>/ sources, None for global sources
+    separator    : metric/value separator from metric_separator.yaml, bytes
+    metrics      : set of selected metrics, None when all metrics are selected
+    prefix       : prepended to metric names, ex: "Node 0 ", metrics of
+                   /proc/<pid>/ sources aren't prefixed
+    metric_field : index of word in metric name matched against metrics,
+                   None to match the whole metric name
+    columns      : [(index, metric name)] for whitespace separated files,
+                   [(index, metric name, declared type)] for pid stat/statm
+    groups       : columns grouped by declared type, see column_groups
+    labels       : (row labels, column labels) of sources parsed into a
+                   metric_block
+    schema       : metric_schema.source_schema of the source
+    keys         : metric name as read from the file (bytes) ->
+                   (result metric name, declared type), None if not
+                   selected, filled on first use, shared by plans of the
+                   same file of all pids
+    reader       : procfs_reader the file is read with, None for the
+                   reader of the collector
+    """
+
+    def __init__(self, source, path, parser, pid=None):
+        self.source = source
+        self.file = source
+        self.path = path
+        self.parser = parser
+        self.pid = pid
+        self.separator = None
+        self.metrics = None
+        self.prefix = ""
+        self.metric_field = None
+        self.columns = []
+        self.labels = None
+        self.groups = None
+        self.schema = source_schema()
+        self.keys = {}
+        self.reader = None
+
+    def key(self, raw):
+        """
+        @params raw: bytes
+            metric name as read from the file, unstripped
+
+        @return (str, type)
+            result metric name and declared type (None if not declared),
+            None if metric is not selected
+        """
+        key = self.keys.get(raw, False)
+        if key is False:
+            metric = str(raw, "utf-8", "replace").strip()
+            if self.selects(metric):
+                key = (
+                    sys.intern(self.prefix + metric),
+                    self.schema.type(self.name(metric)),
+                )
+            else:
+                key = None
+            self.keys[raw] = key
+        return key
+
+    def name(self, metric):
+        """
+        @params metric: str
+            metric name as read from the file, without prefix
+        @return str
+            name of metric as declared in metric_schema.yaml
+        """
+        if self.metric_field is None:
+            return metric
+        fields = metric.split(" ")
+        if len(fields) <= self.metric_field:
+            return metric
+        return fields[self.metric_field]
+
+    def selects(self, metric):
+        """
+        @params metric: str
+            metric name as read from the file, without prefix
+        @return bool
+        """
+        if self.metrics is None:
+            return True
+        if self.metric_field is None:
+            return metric in self.metrics
+        fields = metric.split(" ")
+        if len(fields) <= self.metric_field:
+            return False
+        return fields[self.metric_field] in self.metrics
+
+
+def convert_bytes_value(value):
+    """
+    @params value: bytes
+        ex: b" 6158152 kB", b"0022", b"S (sleeping)"
+
+    @return int for b"<int>" and b"<int> <unit>" values, else the
+        stripped value decoded to str
+    """
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    value = value.strip()
+    number, _, unit = value.partition(b" ")
+    if unit.isalpha():
+        try:
+            return int(number)
+        except ValueError:
+            pass
+    return str(value, "utf-8", "replace")
+
+
+def convert_declared_value(value, kind):
+    """
+    @params value: bytes
+        value as read from the file, ex: b" 4200.00", b"0022"
+    @params kind: type
+        declared type of the metric: int, float or str, None if not
+        declared
+
+    @return value of declared type, a trailing unit is dropped from
+        numbers, int values not parsing as int are kept as float if they
+        parse as float, anything else falls back to convert_bytes_value
+    """
+    if kind is str:
+        return str(value, "utf-8", "replace").strip()
+    number, _, unit = value.strip().partition(b" ")
+    if not unit or unit.isalpha():
+        if kind is not float:
+            try:
+                return int(number)
+            except ValueError:
+                pass
+        if kind is not None:
+            try:
+                return float(number)
+            except ValueError:
+                pass
+    return convert_bytes_value(value)
+
+
+def column_groups(columns):
+    """
+    @params columns: list
+        [(index, metric name, declared type)]
+
+    @return (metric names, [(getter, metric names, declared type)])
+        metric names in column order and a group per declared type,
+        getter(words) is the tuple of words of the group, so words of a
+        type are converted with one map() call
+    """
+    groups = {}
+    for index, metric, kind in columns:
+        groups.setdefault(kind, ([], []))
+        groups[kind][0].append(index)
+        groups[kind][1].append(metric)
+    res = []
+    for kind, (indexes, metrics) in groups.items():
+        if len(indexes) == 1:
+            getter = lambda words, index=indexes[0]: (words[index],)
+        else:
+            getter = itemgetter(*indexes)
+        res.append((getter, tuple(metrics), kind))
+    return tuple(metric for _, metric, _ in columns), res
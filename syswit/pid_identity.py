@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import threading
+from syswit import collector_config as config
+
+
+class pid_identities:
+    """
+    (pid, start time) identity of tracked pids and tids.
+
+    The kernel reuses the pid of an exited process (pid wraparound, fast
+    fork/exit), start time (field 22 of /proc/<pid>/stat, clock ticks
+    since boot) tells apart processes holding the same pid. It is taken
+    from the rows of the stat file as they are stored every sample, so
+    detecting reuse costs a lookup per row, no read.
+
+    A pid seen with a new start time begins a new incarnation, returned
+    by observe() as [pid, start time, scheduled ns of its first sample].
+    Stores record these in pid_starts of their segment info, aggregation
+    keeps the series of every incarnation apart. Pids are not told apart
+    if start time of the stat file isn't collected. observe() is called
+    by collection threads at once, it holds lock.
+    """
+
+    def __init__(self, start_metric=config.pid_start_metric):
+        """
+        @params start_metric: tuple
+            (source key, metric) of start time
+        """
+        self.source, self.metric = start_metric
+        # pid -> start time of its current incarnation
+        self.starts = {}
+        # pid -> [start time, ...] of all its incarnations, in order
+        self.history = {}
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def observe(self, pid, res, sample_ns):
+        """
+        @params pid: int
+        @params res: dict
+            row of the stat file of pid
+        @params sample_ns: int
+            scheduled ns of the sample of the row
+
+        @return list
+            [pid, start time, sample_ns] if the row is of a new incarnation
+            of pid, else None
+        """
+        start = res.get(self.metric)
+        if start is None:
+            return None
+        with self.lock:
+            if self.starts.get(pid) == start:
+                return None
+            if pid in self.starts:
+                self.reused += 1
+            self.starts[pid] = start
+            self.history.setdefault(pid, []).append(start)
+        return [pid, start, sample_ns]
+
+    def all_pids(self, seen):
+        """
+        @params seen: list
+            ids seen by process_tree, root first
+
+        @return list
+            [pid, start time] of every incarnation of seen ids, start time
+            is None for ids without a stat row
+        """
+        return [
+            [pid, start] for pid in seen for start in self.history.get(pid, (None,))
+        ]
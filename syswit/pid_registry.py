@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import threading
+
+
+class pid_registry:
+    """
+    Live pids under collection with their parse plans (paths, source tags
+    and parsing details compiled once per pid).
+
+    sync() is called with the process tree snapshot before every sample,
+    pids are added or retired only when the snapshot changes. Retired
+    pids get their reader descriptors closed and leave batches, so work
+    per sample follows live pids only. batches holds the plans of all
+    live pids split in batch_size chunks, it is rebuilt on change and
+    replaced as a whole.
+
+    Collection threads report pids found exited with retire(), those are
+    dropped on next sync even if still in the snapshot. They are compiled
+    again with new descriptors on the next snapshot still listing them,
+    process_tree publishes one when a listed pid got reused by a new
+    process: descriptors of a pid stay bound to the process they were
+    opened for.
+
+    Pids passed as busy to sync() still have reads running on their
+    descriptors (ex: reads of async engine past their deadline). Their
+    descriptors are closed, and they may be compiled again, only on a
+    sync after the reads finished, so a running read never sees its
+    descriptor closed or reused.
+    """
+
+    def __init__(self, reader, compile_plans, batch_size):
+        """
+        @params reader: procfs_reader
+            reader holding descriptors of pid files
+        @params compile_plans: function
+            pid(int) -> [parse_plan] of all files of pid
+        @params batch_size: int
+            plans per collection task
+        """
+        self.reader = reader
+        self.compile_plans = compile_plans
+        self.batch_size = max(batch_size, 1)
+        # pid -> [parse_plan]
+        self.entries = {}
+        self.batches = []
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.dead = set()
+        self.dead_pending = False
+        # retired pids whose descriptors wait for busy reads to finish
+        self.deferred = set()
+        self.pids_added = 0
+        self.pids_retired = 0
+
+    def retire(self, pid):
+        """
+        @params pid: int
+            pid found exited while collecting
+        """
+        with self.lock:
+            self.dead.add(pid)
+            self.dead_pending = True
+
+    def sync(self, snapshot, busy=()):
+        """
+        @params snapshot: tuple
+            live pids and tids from process_tree
+        @params busy: set
+            pids with reads still running
+        """
+        with self.lock:
+            released = {pid for pid in self.deferred if pid not in busy}
+            self.deferred -= released
+            dead_pending, self.dead_pending = self.dead_pending, False
+            if snapshot is self.snapshot and not dead_pending and not released:
+                return
+            current = set(snapshot)
+            dead = self.dead & current
+            # retried with the next snapshot
+            self.dead = dead if snapshot is self.snapshot else set()
+            skipped = set(self.dead)
+
+        for pid in released:
+            self.reader.close_pid(pid)
+        for pid in list(self.entries):
+            if pid not in current or pid in dead:
+                if pid in busy:
+                    self.deferred.add(pid)
+                else:
+                    self.reader.close_pid(pid)
+                del self.entries[pid]
+                self.pids_retired += 1
+        for pid in snapshot:
+            if (
+                pid not in self.entries
+                and pid not in skipped
+                and pid not in self.deferred
+            ):
+                self.entries[pid] = self.compile_plans(pid)
+                self.pids_added += 1
+
+        plans = [
+            plan
+            for pid_plans in self.entries.values()
+            for plan in pid_plans
+            if plan.parser is not None
+        ]
+        self.batches = [
+            tuple(plans[start : start + self.batch_size])
+            for start in range(0, len(plans), self.batch_size)
+        ]
+        self.snapshot = snapshot
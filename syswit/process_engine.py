@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import os
+import time
+import signal
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from syswit.procfs_reader import procfs_reader
+from syswit.pid_registry import pid_registry
+from syswit.shm_ring import shm_ring, row_encoder, row_decoder
+from syswit import collector_config as config
+
+
+def worker_main(helper, index, workers, cpu, ring, conn):
+    """
+    Collection loop of a worker process, forked from the collector so it
+    inherits the compiled parse plans.
+
+    Worker index owns global sources at positions index, index + workers,
+    ... and pids with pid % workers == index. For every tick it parses its
+    shard serially and writes the rows in its shared memory ring, there
+    is no GIL shared with the other workers.
+
+    @params helper: collector_helper
+    @params cpu: int
+        cpu the worker is pinned on
+    @params ring: shm_ring
+        ring of the worker, rows of a sample are written here
+    @params conn: Connection
+        receives (tick, snapshot or None), None to stop
+        sends ("sample", tick, new schemas, ring seqs, spilled rows) and
+        ("stats", {...}) before exiting, spilled rows are the ones not
+        fitting in the ring (and metric_block rows) as
+        [(source tag, pid, {metric: value} or metric_block), ...]
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.sched_setaffinity(0, [cpu])
+    # descriptors are per process, fds inherited from the collector are
+    # left alone
+    helper.reader = procfs_reader()
+    helper.registry = registry = pid_registry(
+        helper.reader, helper.compile_pid_plans, helper.batch_size
+    )
+    plans = [
+        plan
+        for position, plan in enumerate(helper.parse_plans.values())
+        if position % workers == index and plan.parser is not None
+    ]
+    encoder = row_encoder(ring)
+    snapshot = ()
+    samples, files, busy = 0, 0, 0.0
+    start_cpu = time.process_time()
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        tick, new_snapshot = msg
+        start = time.monotonic()
+        if new_snapshot is not None:
+            snapshot = tuple(i for i in new_snapshot if i % workers == index)
+        registry.sync(snapshot)
+        rows = []
+        for batch in [plans] + registry.batches:
+            for plan in batch:
+                res = plan.parser(plan)
+                files += 1
+                if res is not None:
+                    rows.append((plan.file, plan.pid, res))
+        new_schemas, seqs, spilled = encoder.encode(rows)
+        busy += time.monotonic() - start
+        samples += 1
+        conn.send(("sample", tick, new_schemas, seqs, spilled))
+
+    helper.reader.close_all()
+    ring.close()
+    conn.send(
+        (
+            "stats",
+            {
+                "worker": index,
+                "cpu": cpu,
+                "samples": samples,
+                "files": files,
+                "busy time": busy,
+                "cpu time": time.process_time() - start_cpu,
+                "files/sec": files / busy if busy else 0.0,
+                "pids": registry.pids_added,
+                "ring rows": encoder.rows,
+                "spilled rows": encoder.spilled,
+            },
+        )
+    )
+    conn.close()
+
+
+class process_engine:
+    """
+    Collection engine sharding global sources and pids across worker
+    processes pinned on the tool cpus, so parsing is not serialized on
+    one GIL.
+
+    The collector thread sends a tick to every worker per sample, with
+    the process tree snapshot only when it changed, and counts a task in
+    the store per worker. Workers write the rows of a sample in their
+    shm_ring and answer with the slots to read. A receiver thread decodes
+    the rows from shared memory into the store of their sample and marks
+    the task done, so seal() of a segment still waits for all rows of its
+    samples. Workers answer ticks in order, the store and sample of
+    outstanding ticks are kept per worker in a deque.
+    """
+
+    def __init__(
+        self,
+        helper,
+        workers,
+        cpus,
+        ring_slots=config.ring_slots,
+        ring_slot_size=config.ring_slot_size,
+    ):
+        """
+        @params helper: collector_helper
+            with parse plans compiled, forked into every worker
+        @params workers: int
+            number of worker processes
+        @params cpus: list
+            cpus to pin workers on, round robin
+        @params ring_slots, ring_slot_size: int
+            shared memory preallocated per worker
+        """
+        self.helper = helper
+        self.workers = max(workers, 1)
+        self.cpus = list(cpus) or list(os.sched_getaffinity(0))
+        self.conns = []
+        self.processes = []
+        self.ring_slots = ring_slots
+        self.ring_slot_size = ring_slot_size
+        # conn -> row_decoder of the worker ring
+        self.decoders = {}
+        # conn -> deque of (store, sample, barrier) sent and not answered yet
+        self.outstanding = {}
+        self.closed = set()
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.ticks = 0
+        self.worker_stats = []
+        self.receiver = None
+
+    def start(self):
+        """
+        fork the workers, call before starting any other thread
+        """
+        ctx = multiprocessing.get_context("fork")
+        for index in range(self.workers):
+            conn, child_conn = ctx.Pipe()
+            ring = shm_ring(self.ring_slots, self.ring_slot_size)
+            process = ctx.Process(
+                target=worker_main,
+                args=(
+                    self.helper,
+                    index,
+                    self.workers,
+                    self.cpus[index % len(self.cpus)],
+                    ring,
+                    child_conn,
+                ),
+                name=f"syswit-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+            self.outstanding[conn] = deque()
+            self.decoders[conn] = row_decoder(ring)
+        self.receiver = threading.Thread(
+            target=self.receive, name="syswit-engine-receiver", daemon=True
+        )
+        self.receiver.start()
+
+    def submit(self, store, sample, barrier, snapshot=()):
+        """
+        @params store: sample_store
+            store of flush segment the sample belongs to
+        @params sample: int
+            index of sample in store
+        @params barrier: sample_barrier
+            a task per worker is counted, done when its rows are stored
+        @params snapshot: tuple
+            live pids and tids to collect
+        """
+        if snapshot is self.snapshot:
+            snapshot = None
+        else:
+            self.snapshot = snapshot
+        tick = self.ticks
+        self.ticks += 1
+        for conn in self.conns:
+            with self.lock:
+                if conn in self.closed:
+                    continue
+                store.task_started()
+                barrier.task_started()
+                self.outstanding[conn].append((store, sample, barrier))
+            try:
+                conn.send((tick, snapshot))
+            except OSError:
+                # worker is gone, its ticks are released on EOF
+                pass
+
+    def receive(self):
+        conns = list(self.conns)
+        while conns:
+            for conn in wait(conns):
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    conns.remove(conn)
+                    self.release(conn)
+                    continue
+                if msg[0] == "stats":
+                    decoder = self.decoders[conn]
+                    msg[1]["seq errors"] = decoder.seq_errors
+                    self.worker_stats.append(msg[1])
+                    continue
+                _, _, new_schemas, seqs, spilled = msg
+                store, sample, barrier = self.outstanding[conn].popleft()
+                decoder = self.decoders[conn]
+                decoded = decoder.rows
+                try:
+                    decoder.add_schemas(new_schemas)
+                    decoder.decode(seqs, store, sample)
+                    for tag, pid, res in spilled:
+                        store.append(tag, sample, res, pid)
+                finally:
+                    barrier.task_done(decoder.rows - decoded + len(spilled))
+                    store.task_done()
+
+    def release(self, conn):
+        """
+        mark ticks of a closed worker done, no rows will come for them
+        """
+        with self.lock:
+            self.closed.add(conn)
+            outstanding = self.outstanding[conn]
+            while outstanding:
+                store, _, barrier = outstanding.popleft()
+                barrier.task_done(0)
+                store.task_done()
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        if self.receiver is not None:
+            self.receiver.join()
+        for process in self.processes:
+            process.join()
+        for conn in self.conns:
+            conn.close()
+            self.decoders[conn].ring.close(unlink=True)
+
+    def stats(self):
+        """
+        @return list
+            per worker stats, sorted by worker index
+        """
+        return sorted(self.worker_stats, key=lambda i: i["worker"])
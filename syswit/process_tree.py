@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import os
+import time
+import signal
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from syswit import collector_config as config
+
+
+class process_tree:
+    """
+    Tracks pids and tids of the process tree of a root pid.
+
+    A rescan lists /proc once to build a ppid -> children index, walks
+    the tree of root from it and lists /proc/<pid>/task of every process
+    in the tree. Task directories are listed with scandir by a small fixed
+    pool of workers, each taking a chunk of the processes, and merged in
+    a set. Rescans run on a separate thread only when requested
+    (request_scan, called by the collector every few samples), never in
+    a busy loop.
+
+    snapshot is an immutable tuple of live pids and tids (first seen
+    order), replaced as a whole by a rescan only if ids were added or
+    retired, or a process pid got reused (start time of its stat
+    changed), so collection threads can read it without locking and tell
+    a change by identity. seen holds every id ever tracked. tgids
+    maps the tids found in /proc/<pid>/task to their process pid, it is
+    replaced as a whole before snapshot.
+
+    With on_exit, a pidfd (os.pidfd_open) is held for every tracked
+    process and polled by a watcher thread. A pidfd turns readable as its
+    process exits, before its parent reaps it, on_exit(pid) is called
+    right away to read its final rows, dropped if the process got reaped
+    meanwhile. Then pid and its threads are dropped from snapshot and
+    (pid, exit ns, rows) is queued in exits for the collector. Exited processes still listed in /proc as zombies are
+    skipped by rescans. Threads have no pidfd, they are retired by the
+    next rescan as before.
+    """
+
+    def __init__(
+        self,
+        root,
+        include_children=True,
+        include_threads=True,
+        workers=config.tree_scan_workers,
+        on_exit=None,
+    ):
+        """
+        @params root: int
+            pid of the workload
+        @params include_children: bool
+            track children of root recursively
+        @params include_threads: bool
+            track threads of root and its children
+        @params workers: int
+            threads listing task directories in a rescan
+        @params on_exit: function
+            on_exit(pid) reads final rows of an exiting process, None to
+            not watch exits
+        """
+        self.root = root
+        self.include_children = include_children
+        self.include_threads = include_threads and include_children
+        self.proc = "/" + config.identifier_pid_proc_files
+        self.snapshot = (root,)
+        self.tgids = {}
+        self.seen = [root]
+        self.seen_set = {root}
+        # pid -> start time of the processes in the tree at last rescan
+        self.starts = {}
+        self.ids_added = 0
+        self.ids_retired = 0
+        self.scans = 0
+        self.cpu_time = 0.0
+        self.scan_time_total = 0.0
+        self.scan_time_max = 0.0
+        # [seconds since start, duration, live ids] of the last rescans
+        self.scan_times = deque(maxlen=config.tree_scan_history)
+        self.workers = max(workers, 1)
+        self.pool = None
+        if self.include_threads and self.workers > 1:
+            self.pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="syswit-tasks"
+            )
+        self.start_time = time.monotonic()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = None
+        # publish and exits of the watcher thread change snapshot too
+        self.lock = threading.Lock()
+        self.on_exit = on_exit
+        self.selector = None
+        self.exit_watch = False
+        self.watcher = None
+        self.wake_fds = None
+        # pid -> pidfd of watched processes
+        self.pidfds = {}
+        # pids which exited, until they leave /proc or the pid is reused
+        self.exited = set()
+        # (pid, exit ns, rows) of exited processes, popped by the collector
+        self.exits = deque()
+        self.exits_seen = 0
+
+    def read_children(self):
+        """
+        @return (dict, dict)
+            ppid -> [pid, ...] of all processes in the system, exited
+            processes not yet reaped are left out, and pid -> start time
+        """
+        children, starts = {}, {}
+        exited = set(self.exited)
+        zombies = set()
+        with os.scandir(self.proc) as entries:
+            for entry in entries:
+                if not entry.name.isdigit():
+                    continue
+                try:
+                    with open(f"{self.proc}/{entry.name}/stat", "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                # pid (comm) state ppid ..., comm may have spaces or ")"
+                fields = data.rpartition(b")")[2].split()
+                pid = int(entry.name)
+                if pid in exited and fields[0] == b"Z":
+                    zombies.add(pid)
+                    continue
+                children.setdefault(int(fields[1]), []).append(pid)
+                starts[pid] = fields[19]
+        if exited:
+            # reaped or reused pids may exit again
+            with self.lock:
+                self.exited -= exited - zombies
+        return children, starts
+
+    def read_tids(self, pids):
+        """
+        @params pids: list
+            processes to list threads of
+
+        @return dict
+            tid -> pid of threads of all pids, exited pids are skipped
+        """
+        tids = {}
+        for pid in pids:
+            try:
+                with os.scandir(f"{self.proc}/{pid}/task") as entries:
+                    tids.update((int(entry.name), pid) for entry in entries)
+            except OSError:
+                continue
+        return tids
+
+    def read_all_tids(self, pids):
+        """
+        @params pids: list
+            processes to list threads of, split among the workers
+
+        @return dict
+        """
+        if self.pool is None or len(pids) < 2 * self.workers:
+            return self.read_tids(pids)
+        step = -(-len(pids) // self.workers)
+        chunks = [pids[start : start + step] for start in range(0, len(pids), step)]
+        tids = {}
+        for res in self.pool.map(self.read_tids, chunks):
+            tids.update(res)
+        return tids
+
+    def scan(self):
+        """
+        rescan process tree of root and publish a new snapshot
+        """
+        start, cpu_start = time.monotonic(), time.thread_time()
+        pids, starts = [self.root], None
+        if self.include_children:
+            children, all_starts = self.read_children()
+            for pid in pids:
+                pids.extend(children.get(pid, ()))
+            starts = {pid: all_starts.get(pid) for pid in pids}
+        ids = set(pids)
+        if self.include_threads:
+            tgids = self.read_all_tids(pids)
+            ids.update(tgids)
+            self.tgids = tgids
+        self.publish(ids, starts)
+        elapsed = time.monotonic() - start
+        self.scans += 1
+        self.cpu_time += time.thread_time() - cpu_start
+        self.scan_time_total += elapsed
+        self.scan_time_max = max(self.scan_time_max, elapsed)
+        self.scan_times.append([start - self.start_time, elapsed, len(ids)])
+
+    def publish(self, ids, starts=None):
+        """
+        @params ids: set
+            live pids and tids found by a rescan
+        @params starts: dict
+            pid -> start time of the processes found, None if not read
+        """
+        with self.lock:
+            # a rescan started before an exit may still list the process
+            ids = ids - self.exited
+            current = self.snapshot
+            added = sorted(ids.difference(current))
+            kept = tuple(i for i in current if i in ids)
+            reused = starts is not None and any(
+                self.starts.get(pid, start) != start for pid, start in starts.items()
+            )
+            if starts is not None:
+                self.starts = starts
+            self.ids_retired += len(current) - len(kept)
+            self.ids_added += len(added)
+            for i in added:
+                if i not in self.seen_set:
+                    self.seen_set.add(i)
+                    self.seen.append(i)
+            if added or len(kept) != len(current) or reused:
+                self.snapshot = kept + tuple(added)
+            if self.selector is not None:
+                for pid in [i for i in self.pidfds if i not in ids]:
+                    self.unwatch(pid)
+                self.watch(i for i in added if self.tgids.get(i, i) == i)
+
+    def watch(self, pids):
+        """
+        @params pids: iterable
+            processes to hold a pidfd of, called with lock held
+        """
+        for pid in pids:
+            try:
+                pidfd = os.pidfd_open(pid)
+            except OSError:
+                continue
+            self.pidfds[pid] = pidfd
+            self.selector.register(pidfd, selectors.EVENT_READ, pid)
+
+    def unwatch(self, pid):
+        """
+        close pidfd of pid, called with lock held
+        """
+        pidfd = self.pidfds.pop(pid)
+        self.selector.unregister(pidfd)
+        os.close(pidfd)
+
+    def process_exited(self, pid, pidfd):
+        """
+        @params pid: int
+            process whose pidfd turned readable
+        @params pidfd: int
+        """
+        exit_ns = time.time_ns()
+        if self.pidfds.get(pid) != pidfd:
+            return
+        self.exits_seen += 1
+        try:
+            rows = self.on_exit(pid)
+            # signals reach zombies, a reaped process may have left its
+            # pid to a new process while it was read
+            signal.pidfd_send_signal(pidfd, 0)
+        except ProcessLookupError:
+            rows = []
+        except Exception as e:
+            print(f"Final sample of exited pid {pid} failed: {e}")
+            rows = []
+        with self.lock:
+            if self.pidfds.get(pid) != pidfd:
+                return
+            self.unwatch(pid)
+            self.exited.add(pid)
+            current = self.snapshot
+            kept = tuple(
+                i for i in current if i != pid and self.tgids.get(i) != pid
+            )
+            if len(kept) != len(current):
+                self.ids_retired += len(current) - len(kept)
+                self.snapshot = kept
+            # queued after snapshot, rows are never collected twice
+            self.exits.append((pid, exit_ns, rows))
+
+    def run_watcher(self):
+        while not self.stopped:
+            for key, _ in self.selector.select():
+                if key.fd == self.wake_fds[0]:
+                    os.read(key.fd, 64)
+                    continue
+                try:
+                    self.process_exited(key.data, key.fd)
+                except Exception as e:
+                    print(f"Process exit watch failed: {e}")
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            if self.stopped:
+                break
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Process tree scan failed: {e}")
+
+    def start(self):
+        """
+        scan once and start the tracker thread, and the exit watcher
+        thread with on_exit if pidfds are supported
+        """
+        if self.on_exit is not None and hasattr(os, "pidfd_open"):
+            self.selector = selectors.DefaultSelector()
+            self.exit_watch = True
+            self.wake_fds = os.pipe()
+            self.selector.register(self.wake_fds[0], selectors.EVENT_READ)
+            with self.lock:
+                self.watch(self.snapshot)
+        self.scan()
+        if self.selector is not None:
+            self.watcher = threading.Thread(
+                target=self.run_watcher, name="syswit-exits", daemon=True
+            )
+            self.watcher.start()
+        self.thread = threading.Thread(
+            target=self.run, name="syswit-process-tree", daemon=True
+        )
+        self.thread.start()
+
+    def request_scan(self):
+        self.wake.set()
+
+    def close(self):
+        self.stopped = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.selector is not None:
+            os.write(self.wake_fds[1], b"x")
+            if self.watcher is not None:
+                self.watcher.join()
+            with self.lock:
+                for pid in list(self.pidfds):
+                    self.unwatch(pid)
+            self.selector.close()
+            for fd in self.wake_fds:
+                os.close(fd)
+            self.selector = None
+
+    def stats(self, history=True):
+        """
+        @params history: bool
+            include "scan times", [start, duration, live ids] of the last
+            tree_scan_history rescans
+
+        @return dict
+            tracker metrics, times in seconds
+        """
+        scans = max(self.scans, 1)
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        stats = {
+            "scans": self.scans,
+            "live ids": len(self.snapshot),
+            "ids seen": len(self.seen),
+            "ids added": self.ids_added,
+            "ids retired": self.ids_retired,
+            "avg scan time": self.scan_time_total / scans,
+            "max scan time": self.scan_time_max,
+            "last scan time": self.scan_times[-1][1] if self.scan_times else 0.0,
+            "cpu time": self.cpu_time,
+            "cpu utilization": self.cpu_time / elapsed,
+            "exit watch": self.exit_watch,
+            "exits seen": self.exits_seen,
+        }
+        if history:
+            stats["scan times"] = list(self.scan_times)
+        return stats
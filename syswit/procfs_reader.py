@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import os
+import resource
+import threading
+
+
+class procfs_reader:
+    """
+    Pool of persistent file descriptors for procfs/sysfs files.
+
+    Every file is opened once and re-read on each sample with preads from
+    offset 0 into a per-thread reusable buffer, instead of
+    open/fstat/read/read/close per file per sample. Descriptors belonging
+    to a pid are kept until that pid disappears.
+    """
+
+    def __init__(self, buffer_size=65536, reserved_fds=256):
+        self.buffer_size = buffer_size
+        self.fds = {}
+        self.pid_paths = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.max_fds = self.raise_nofile_limit() - reserved_fds
+
+    def raise_nofile_limit(self):
+        """
+        Raise soft RLIMIT_NOFILE up to the hard limit, every tracked
+        pid file holds a descriptor.
+
+        @return int
+            soft limit in effect
+        """
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY:
+            hard = 1048576
+        if soft == resource.RLIM_INFINITY or soft >= hard:
+            return hard
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            return hard
+        except (ValueError, OSError):
+            return soft
+
+    def get_buffer(self):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = bytearray(self.buffer_size)
+            self.local.buffer = buffer
+        return buffer
+
+    def get_fd(self, path, pid=None):
+        """
+        @params path: str
+            path of procfs/sysfs file
+        @params pid: int
+            owner pid of path if it is a /proc/<pid>/ file
+
+        @return int
+            cached descriptor, None if descriptor budget is exhausted
+        """
+        fd = self.fds.get(path)
+        if fd is not None:
+            return fd
+        with self.lock:
+            fd = self.fds.get(path)
+            if fd is None:
+                if len(self.fds) >= self.max_fds:
+                    return None
+                fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+                self.fds[path] = fd
+                if pid is not None:
+                    self.pid_paths.setdefault(pid, []).append(path)
+        return fd
+
+    def pread_file(self, fd):
+        """
+        Read whole file from offset 0 into the thread buffer, growing it as
+        needed. seq_files of many records return about a page per read, a
+        short read isn't end of file, reads go on until one returns 0.
+        """
+        buffer = self.get_buffer()
+        offset = 0
+        while True:
+            if offset == len(buffer):
+                grown = bytearray(len(buffer) * 2)
+                grown[:offset] = buffer
+                buffer = self.local.buffer = grown
+            nbytes = os.preadv(fd, [memoryview(buffer)[offset:]], offset)
+            if nbytes == 0:
+                return memoryview(buffer)[:offset]
+            offset += nbytes
+
+    def readinto(self, path, pid=None):
+        """
+        @params path: str
+            path of procfs/sysfs file
+        @params pid: int
+            owner pid of path if it is a /proc/<pid>/ file
+
+        @return memoryview
+            file content, valid until the next read on the same thread
+
+        raises FileNotFoundError/ProcessLookupError if file or pid is gone
+        """
+        fd = self.get_fd(path, pid)
+        if fd is not None:
+            return self.pread_file(fd)
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            return self.pread_file(fd)
+        finally:
+            os.close(fd)
+
+    def read(self, path, pid=None):
+        return str(self.readinto(path, pid), "utf-8", "replace")
+
+    def close(self, path):
+        with self.lock:
+            fd = self.fds.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def close_pid(self, pid):
+        """
+        close all descriptors of a pid which is no more alive
+        """
+        with self.lock:
+            paths = self.pid_paths.pop(pid, [])
+        for path in paths:
+            self.close(path)
+
+    def close_all(self):
+        with self.lock:
+            fds = list(self.fds.values())
+            self.fds, self.pid_paths = {}, {}
+        for fd in fds:
+            os.close(fd)
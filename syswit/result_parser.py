@@ -6,12 +6,13 @@
 
 
 import pandas as pd
-import json
 import datetime
+from syswit.results_format import load_results
 from syswit.utils import (
     check_proc_file_tag,
     check_path_pid_proc_file_tag,
     check_nodex_sys_source_file_tag,
+    pid_series_id,
 )
 from syswit import collector_config as config, global_vars
 
@@ -27,6 +28,9 @@ class result_parser_helper:
         ) = ([], [], [], [], [])
 
         self.pids_enable = False
+        # "<pid>" or "<pid>-<start time>" of tags -> (pid, start time)
+        self.pid_identities = {}
+        self.parent_pid = None
         self.hugepages = dict()
         self.hugepages["size"] = ["1048576kB", "2048kB"]
         self.hugepages["files"] = [
@@ -79,6 +83,25 @@ class result_parser_helper:
             for i in self.df[key][0]:
                 self.read_results_json_tags[key].append(i)
 
+    def get_pid_identities(self):
+        """
+        all_pids has [pid, start time] of every process, processes of a pid
+        reused during the run are told apart by start time in tags
+        """
+        identities = [
+            tuple(i) if type(i) is list else (i, None) for i in self.all_pids
+        ]
+        incarnations = {}
+        for pid, _ in identities:
+            incarnations[pid] = incarnations.get(pid, 0) + 1
+        for pid, start_time in identities:
+            series = pid_series_id(
+                pid, start_time if incarnations[pid] > 1 else None
+            )
+            self.pid_identities[series] = (pid, start_time)
+        if identities:
+            self.parent_pid = identities[0][0]
+
     def get_results_json_tags_metrics(self):
         for tag in self.result_tags_g_source_files_proc.keys():
             for key in self._g_source_files_proc:
@@ -110,14 +133,14 @@ class result_parser_helper:
 
     def read_json(self, file_name):
         try:
-            with open(file_name, "r") as f:
-                self.df = pd.json_normalize(json.loads(f.read()))
+            self.df = pd.json_normalize(load_results(file_name))
         except FileNotFoundError:
             print(f"File Not Found {file_name}")
             exit()
 
         self.get_system_configuration_data()
         self.get_results_json_tags()
+        self.get_pid_identities()
         self.result_tags, self.result_tags_hugepages = [], []
         (
             self.result_tags_g_source_files_proc,
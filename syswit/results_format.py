@@ -0,0 +1,387 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+"""
+Binary results format, holds the same data as results.json.
+
+file  : magic, chunk, chunk, ...
+chunk : <kind: u8><compression: u8><stored length: u32><raw length: u32><body>
+body  : <header length: u32><json header><payload>
+
+A column chunk holds all metrics of one result tag (a source, timestamps or
+sample_times), its header has "key" (result tag) and "columns", payload is
+the typed columns back to back. Every column has "metric", "n", "size" and
+"type":
+    q : int64, delta encoded "enc" times (0: raw, 1: delta,
+        2: delta of delta) and stored in narrowest "width" typecode
+    t : timestamps str, stored as "q" microseconds parsed with "style"
+    d : float64, columns of floats only
+    s : dictionary encoded str, "dict" in header and "q" codes as payload
+    o : anything else (ex: ints mixed with floats, ints out of int64),
+        json payload
+The last chunk is meta, it holds the rest of the results in its header.
+"""
+
+import sys
+import json
+import zlib
+import lzma
+import struct
+import datetime
+from array import array
+from itertools import accumulate
+from syswit import collector_config as config
+from syswit import global_vars
+
+magic = b"SYSWITB1"
+chunk_header = struct.Struct("<BBII")
+chunk_column, chunk_meta = 1, 2
+compressions = ["none", "zlib", "lzma"]
+widths = [("b", 2**7), ("h", 2**15), ("i", 2**31), ("q", 2**63)]
+epoch = datetime.datetime(1970, 1, 1)
+usec = datetime.timedelta(microseconds=1)
+
+
+def compress(raw, compression):
+    if compression == "zlib":
+        stored = zlib.compress(raw, 6)
+    elif compression == "lzma":
+        stored = lzma.compress(raw)
+    else:
+        return 0, raw
+    if len(stored) >= len(raw):
+        return 0, raw
+    return compressions.index(compression), stored
+
+
+def decompress(stored, compression):
+    if compression == 1:
+        return zlib.decompress(stored)
+    elif compression == 2:
+        return lzma.decompress(stored)
+    return stored
+
+
+def to_bytes(values, typecode):
+    values = array(typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_bytes(payload, typecode):
+    values = array(typecode)
+    values.frombytes(payload)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+def delta(values):
+    return values[:1] + [b - a for a, b in zip(values, values[1:])]
+
+
+def encode_ints(values):
+    """
+    @params values: list
+        int64 values
+
+    @return (header, payload)
+        encoding (raw, delta or delta of delta) needing narrowest width
+    """
+    best = None
+    encoded = values
+    for enc in range(3):
+        if enc:
+            encoded = delta(encoded)
+        if encoded and not -(2**63) <= min(encoded) <= max(encoded) < 2**63:
+            continue
+        limit = max((max(encoded, default=0), -min(encoded, default=0) - 1))
+        width = next(i for i, (_, bound) in enumerate(widths) if limit < bound)
+        if best is None or width < best[1]:
+            best = (enc, width, encoded)
+    enc, width, encoded = best
+    typecode = widths[width][0]
+    return {"enc": enc, "width": typecode}, to_bytes(encoded, typecode)
+
+
+def decode_ints(header, payload):
+    values = from_bytes(payload, header["width"])
+    for _ in range(header["enc"]):
+        values = list(accumulate(values))
+    return values
+
+
+def encode_timestamps(values, style):
+    try:
+        times = [datetime.datetime.strptime(i, style) for i in values]
+    except (ValueError, TypeError):
+        return None
+    if any(t.strftime(style) != i for t, i in zip(times, values)):
+        return None
+    header, payload = encode_ints([(t - epoch) // usec for t in times])
+    header["style"] = style
+    return header, payload
+
+
+def decode_timestamps(header, payload):
+    style = header["style"]
+    return [
+        (epoch + i * usec).strftime(style) for i in decode_ints(header, payload)
+    ]
+
+
+def encode_column(values):
+    """
+    @params values: list
+
+    @return (header, payload)
+    """
+    kinds = set(type(i) for i in values)
+    if kinds == {int} and all(-(2**63) <= i < 2**63 for i in values):
+        header, payload = encode_ints(values)
+        header["type"] = "q"
+    elif kinds == {float}:
+        header, payload = {"type": "d"}, to_bytes(values, "d")
+    elif kinds == {str}:
+        codes = {}
+        for i in values:
+            codes.setdefault(i, len(codes))
+        header, payload = encode_ints([codes[i] for i in values])
+        header["type"] = "s"
+        header["dict"] = list(codes)
+    else:
+        header, payload = {"type": "o"}, json.dumps(values).encode()
+    return header, payload
+
+
+def decode_column(header, payload):
+    kind = header["type"]
+    if kind == "q":
+        return decode_ints(header, payload)
+    elif kind == "t":
+        return decode_timestamps(header, payload)
+    elif kind == "d":
+        return from_bytes(payload, "d")
+    elif kind == "s":
+        strings = header["dict"]
+        return [strings[i] for i in decode_ints(header, payload)]
+    return json.loads(payload)
+
+
+def write_chunk(f, kind, header, payload, compression):
+    header = json.dumps(header, separators=(",", ":")).encode()
+    raw = struct.pack("<I", len(header)) + header + payload
+    compression, stored = compress(raw, compression)
+    f.write(chunk_header.pack(kind, compression, len(stored), len(raw)))
+    f.write(stored)
+
+
+def write_columns(f, key, columns, compression):
+    """
+    @params columns: list
+        [(metric, values, (header, payload) or None to encode values)]
+    """
+    headers, payloads = [], []
+    for metric, values, encoded in columns:
+        header, payload = encoded or encode_column(values)
+        header["metric"] = metric
+        header["n"] = len(values)
+        header["size"] = len(payload)
+        headers.append(header)
+        payloads.append(payload)
+    header = {"key": key, "columns": headers}
+    write_chunk(f, chunk_column, header, b"".join(payloads), compression)
+
+
+def is_source(value):
+    return (
+        isinstance(value, list)
+        and value
+        and isinstance(value[0], dict)
+        and all(isinstance(i, list) for i in value[0].values())
+    )
+
+
+def dumps_indented(value, level=0):
+    """
+    Same as json.dumps(value, indent=4) nested at level, lists of scalars
+    are encoded by the C encoder using the indent as item separator.
+    """
+    outer = "\n" + "    " * level
+    inner = outer + "    "
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        items = (
+            json.dumps(str(k) if not isinstance(k, str) else k)
+            + ": "
+            + dumps_indented(v, level + 1)
+            for k, v in value.items()
+        )
+        return "{" + inner + ("," + inner).join(items) + outer + "}"
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        if not {dict, list, tuple}.isdisjoint(map(type, value)):
+            items = (dumps_indented(i, level + 1) for i in value)
+            return "[" + inner + ("," + inner).join(items) + outer + "]"
+        res = json.dumps(value, separators=("," + inner, ": "))
+        return "[" + inner + res[1:-1] + outer + "]"
+    return json.dumps(value)
+
+
+class results_writer:
+    """
+    Writes results one key at a time, so the whole results need not be in
+    memory. Output is same as json.dump(results, f, indent=4) for "json"
+    format, and as described above for "binary" format.
+    """
+
+    results_formats = ["json", "binary"]
+
+    def __init__(self, file_name, results_format="json", compression="zlib"):
+        """
+        @params file_name: str
+            path of results file without extension
+        @params compression: str
+            "none", "zlib" or "lzma", applied per chunk of binary format
+        """
+        if results_format not in self.results_formats:
+            raise ValueError(f"Unknown results format {results_format}")
+        if compression not in compressions:
+            raise ValueError(f"Unknown compression {compression}")
+        self.results_format = results_format
+        self.compression = compression
+        if results_format == "binary":
+            self.path = f"{file_name}.bin"
+            self.f = open(self.path, "wb")
+            self.f.write(magic)
+            self.meta = {"order": [], "values": {}, "extras": {}}
+        else:
+            self.path = f"{file_name}.json"
+            self.f = open(self.path, "w")
+            self.f.write("{")
+        self.empty = True
+
+    def write(self, key, value):
+        if self.results_format == "binary":
+            self.write_binary(key, value)
+        else:
+            self.f.write(",\n    " if not self.empty else "\n    ")
+            self.f.write(json.dumps(key) + ": ")
+            self.f.write(dumps_indented(value, 1))
+        self.empty = False
+
+    def write_binary(self, key, value):
+        f, compression, meta = self.f, self.compression, self.meta
+        meta["order"].append(key)
+        if key == global_vars.timestamps:
+            encoded = encode_timestamps(value, config.timestamps_style)
+            if encoded is not None:
+                encoded[0]["type"] = "t"
+            write_columns(f, key, [(None, value, encoded)], compression)
+        elif (
+            key == global_vars.sample_times
+            and value
+            and all(isinstance(i, list) and len(i) == 3 for i in value)
+        ):
+            columns = [(field, [i[field] for i in value], None) for field in range(3)]
+            write_columns(f, key, columns, compression)
+        elif key not in config.global_varslist and is_source(value):
+            columns = [(metric, values, None) for metric, values in value[0].items()]
+            write_columns(f, key, columns, compression)
+            meta["extras"][key] = value[1:]
+        else:
+            meta["values"][key] = value
+
+    def close(self):
+        """
+        @return str
+            path of results file
+        """
+        if self.results_format == "binary":
+            write_chunk(self.f, chunk_meta, self.meta, b"", self.compression)
+        else:
+            self.f.write("\n}" if not self.empty else "}")
+        self.f.close()
+        return self.path
+
+
+def write_binary_results(data, file_name, compression="zlib"):
+    """
+    @params data: dict
+        results as written in results.json
+    @params file_name: str
+        path of results file without extension
+    """
+    writer = results_writer(file_name, "binary", compression)
+    for key, value in data.items():
+        writer.write(key, value)
+    return writer.close()
+
+
+def read_binary_results(file_name):
+    """
+    @params file_name: str
+        path of binary results file
+
+    @return dict
+        results as written in results.json
+    """
+    columns = {}
+    meta = {"order": [], "values": {}, "extras": {}}
+    with open(file_name, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{file_name} is not a syswit binary results file")
+        while True:
+            head = f.read(chunk_header.size)
+            if len(head) < chunk_header.size:
+                break
+            kind, compression, stored_length, _ = chunk_header.unpack(head)
+            raw = decompress(f.read(stored_length), compression)
+            (header_length,) = struct.unpack_from("<I", raw)
+            header = json.loads(raw[4 : 4 + header_length])
+            payload = raw[4 + header_length :]
+            if kind == chunk_meta:
+                meta = header
+            elif kind == chunk_column:
+                values, start = {}, 0
+                for column in header["columns"]:
+                    end = start + column["size"]
+                    values[column["metric"]] = decode_column(
+                        column, payload[start:end]
+                    )
+                    start = end
+                columns[header["key"]] = values
+
+    res = {}
+    for key in meta["order"] or list(columns):
+        if key in meta["values"]:
+            res[key] = meta["values"][key]
+        elif key == global_vars.timestamps:
+            res[key] = columns[key][None]
+        elif key == global_vars.sample_times:
+            res[key] = [list(i) for i in zip(*columns[key].values())]
+        elif key in columns or key in meta["extras"]:
+            res[key] = [columns.get(key, {})] + meta["extras"].get(key, [])
+    return res
+
+
+def load_results(file_name):
+    """
+    @params file_name: str
+        path of results file, json or binary
+
+    @return dict
+    """
+    with open(file_name, "rb") as f:
+        binary = f.read(len(magic)) == magic
+    if binary:
+        return read_binary_results(file_name)
+    with open(file_name, "r") as f:
+        return json.loads(f.read())
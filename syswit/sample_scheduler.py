@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import time
+import threading
+
+
+class sample_scheduler:
+    """
+    Sampling clock based on time.monotonic_ns deadlines.
+
+    Deadline of every tick is computed from the start of collection
+    (start + n * period) and not from the end of the previous sample, so
+    time spent in collection never accumulates as drift. Monotonic times
+    are mapped to epoch nanoseconds once at start, all reported times are
+    integers in epoch nanoseconds.
+
+    Overrun policies, when a sample ends after the next deadline:
+        skip    : drop the missed ticks, continue at next deadline in future
+        catchup : run missed ticks back to back until back on schedule
+    """
+
+    overrun_policies = ["skip", "catchup"]
+
+    def __init__(self, sample_period, align=False, overrun_policy="skip"):
+        """
+        @params sample_period: float
+            time between successive samples in seconds
+        @params align: bool
+            align ticks to wall clock multiples of sample_period
+        @params overrun_policy: str
+            "skip" or "catchup"
+        """
+        if overrun_policy not in self.overrun_policies:
+            raise ValueError(f"Unknown overrun policy {overrun_policy}")
+        self.period_ns = max(int(sample_period * 1e9), 1)
+        self.align = align
+        self.overrun_policy = overrun_policy
+        self.overruns = 0
+        self.skipped_ticks = 0
+        # of the last sample: next tick started late, ticks skipped
+        self.delayed = False
+        self.missed = 0
+        self.tick = 0
+        self.mono_origin = time.monotonic_ns()
+        self.wall_origin = time.time_ns()
+        self.first_deadline = self.mono_origin
+        if self.align:
+            self.first_deadline += -self.wall_origin % self.period_ns
+        self.deadline = self.first_deadline
+        self.start_ns = None
+
+    def to_epoch_ns(self, mono_ns):
+        return self.wall_origin + (mono_ns - self.mono_origin)
+
+    def wait_next_tick(self):
+        """
+        Sleep till deadline of the next tick.
+
+        @return (intended_ns, start_ns): int, int
+            epoch ns of scheduled and actual start of the sample
+        """
+        now = time.monotonic_ns()
+        while now < self.deadline:
+            time.sleep((self.deadline - now) / 1e9)
+            now = time.monotonic_ns()
+        self.start_ns = now
+        return self.to_epoch_ns(self.deadline), self.to_epoch_ns(now)
+
+    def next_deadline(self):
+        """
+        @return int
+            monotonic ns of the tick after the current one
+        """
+        return self.first_deadline + (self.tick + 1) * self.period_ns
+
+    def sample_done(self):
+        """
+        Mark end of the current sample and compute deadline of next tick
+        as per overrun policy.
+
+        @return end_ns: int
+            epoch ns of end of the sample
+        """
+        end = time.monotonic_ns()
+        self.tick += 1
+        next_deadline = self.first_deadline + self.tick * self.period_ns
+        self.delayed = end > next_deadline
+        self.missed = 0
+        if self.delayed:
+            self.overruns += 1
+            if self.overrun_policy == "skip":
+                self.missed = (end - next_deadline) // self.period_ns + 1
+                self.skipped_ticks += self.missed
+                self.tick += self.missed
+                next_deadline = self.first_deadline + self.tick * self.period_ns
+        self.deadline = next_deadline
+        return self.to_epoch_ns(end)
+
+
+class sample_barrier:
+    """
+    Completion of one sample as a unit of work.
+
+    Every collection task of the sample is counted with task_started()
+    and reports with task_done() how many sources it collected. Sources
+    done after the deadline of the next tick are counted late. wait()
+    returns when all tasks of the sample are done, the collector waits on
+    it before the next tick, so rows of a sample never land under a later
+    sample or segment.
+    """
+
+    def __init__(self, next_deadline):
+        """
+        @params next_deadline: int
+            monotonic ns of the next tick
+        """
+        self.next_deadline = next_deadline
+        self.pending = 0
+        self.sources = 0
+        self.late_sources = 0
+        self.done_ns = None
+        self.lock = threading.Lock()
+        self.all_done = threading.Condition(self.lock)
+
+    def task_started(self):
+        with self.lock:
+            self.pending += 1
+
+    def task_done(self, sources=1):
+        now = time.monotonic_ns()
+        with self.lock:
+            self.sources += sources
+            if now > self.next_deadline:
+                self.late_sources += sources
+            self.pending -= 1
+            if self.pending == 0:
+                self.done_ns = now
+                self.all_done.notify_all()
+
+    def wait(self):
+        """
+        @return int
+            monotonic ns when the last task of the sample was done
+        """
+        with self.lock:
+            while self.pending:
+                self.all_done.wait()
+            if self.done_ns is None:
+                self.done_ns = time.monotonic_ns()
+            return self.done_ns
@@ -0,0 +1,515 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import math
+import sys
+import threading
+from array import array
+import numpy as np
+from syswit.utils import ns_to_timestamp
+from syswit import global_vars
+
+
+class column:
+    """
+    Values of a single metric of a source in a typed contiguous array.
+
+    kind:
+        "q" : int64 array, missing value stored as missing_int
+        "d" : float64 array, missing value stored as NaN
+        "s" : dictionary encoded str, int32 codes into self.strings,
+              missing value stored as -1
+        "o" : list of python objects, used when a metric has mixed types
+              or does not fit in int64
+    """
+
+    missing_int = -(2**63)
+
+    def __init__(self, value, nrows=0):
+        """
+        @params value:
+            first value of metric, decides kind of column
+        @params nrows: int
+            rows already present in source, filled as missing
+        """
+        if type(value) is int and self.missing_int < value < 2**63:
+            self.kind = "q"
+            self.values = array("q", [self.missing_int]) * nrows
+        elif type(value) is float:
+            self.kind = "d"
+            self.values = array("d", [math.nan]) * nrows
+        elif type(value) is str:
+            self.kind = "s"
+            self.values = array("i", [-1]) * nrows
+            self.strings = []
+            self.codes = {}
+        else:
+            self.kind = "o"
+            self.values = [None] * nrows
+
+    def __len__(self):
+        return len(self.values)
+
+    def nbytes(self):
+        """
+        @return int
+            estimated memory used by values of the column
+        """
+        if self.kind == "s":
+            return self.values.itemsize * len(self.values) + sum(
+                sys.getsizeof(i) + 16 for i in self.strings
+            )
+        elif self.kind == "o":
+            return sum(sys.getsizeof(i) + 8 for i in self.values)
+        return self.values.itemsize * len(self.values)
+
+    def get(self, index):
+        value = self.values[index]
+        if self.kind == "q":
+            return None if value == self.missing_int else value
+        elif self.kind == "d":
+            return None if math.isnan(value) else value
+        elif self.kind == "s":
+            return None if value < 0 else self.strings[value]
+        return value
+
+    def to_list(self):
+        if self.kind == "o":
+            return list(self.values)
+        return [self.get(i) for i in range(len(self.values))]
+
+    def promote(self, kind):
+        """
+        change kind of column to "d" or "o" keeping values already stored
+        """
+        values = self.to_list()
+        self.kind = kind
+        if kind == "d":
+            self.values = array(
+                "d", [math.nan if i is None else float(i) for i in values]
+            )
+        else:
+            self.values = values
+            self.strings, self.codes = None, None
+
+    def append_missing(self):
+        """
+        @return int
+            bytes added to the column
+        """
+        if self.kind == "q":
+            self.values.append(self.missing_int)
+        elif self.kind == "d":
+            self.values.append(math.nan)
+        elif self.kind == "s":
+            self.values.append(-1)
+        else:
+            self.values.append(None)
+            return 8
+        return self.values.itemsize
+
+    def append(self, value):
+        """
+        @return int
+            bytes added to the column, kept O(1) unless column is promoted
+        """
+        kind = self.kind
+        if kind == "q":
+            if type(value) is int and self.missing_int < value < 2**63:
+                self.values.append(value)
+                return 8
+        elif kind == "d":
+            if type(value) is float or type(value) is int:
+                self.values.append(value)
+                return 8
+        elif kind == "s":
+            if type(value) is str:
+                code = self.codes.get(value)
+                if code is not None:
+                    self.values.append(code)
+                    return 4
+                code = len(self.strings)
+                self.codes[value] = code
+                self.strings.append(value)
+                self.values.append(code)
+                return 4 + sys.getsizeof(value) + 16
+        else:
+            self.values.append(value)
+            return 8 + sys.getsizeof(value)
+        before = self.nbytes()
+        if kind == "q" and type(value) is float:
+            self.promote("d")
+        else:
+            self.promote("o")
+        self.values.append(value)
+        return self.nbytes() - before
+
+
+class source_store:
+    """
+    Samples of a single source tag, one row per collected sample.
+    rows[i] is index of the sample (in sample_store) of row i and
+    schema maps metric name to its column.
+
+    Stores of /proc/<pid>/ files hold the rows of all pids of the file,
+    one row per collected sample per pid, and pids[i] is the pid of row
+    i. Columns are shared by all pids, so the values of a metric of every
+    pid are one column.
+    """
+
+    def __init__(self, pids=False):
+        """
+        @params pids: bool
+            rows are per pid
+        """
+        self.lock = threading.Lock()
+        self.rows = array("l")
+        self.pids = array("l") if pids else None
+        self.schema = {}
+        self.nbytes = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def append(self, sample, res, pid=None):
+        """
+        @params sample: int
+            index of sample in sample_store
+        @params res: dict
+            {metric: value, ...} parsed from source for this sample
+        @params pid: int
+            pid of the row, for stores of /proc/<pid>/ files
+
+        @return int
+            estimated bytes added to the store
+        """
+        with self.lock:
+            nrows = len(self.rows)
+            schema = self.schema
+            new_columns = False
+            added = 8
+            if self.pids is not None:
+                self.pids.append(pid)
+                added += 8
+            for metric, value in res.items():
+                col = schema.get(metric)
+                if col is None:
+                    schema[metric] = col = column(value, nrows)
+                    new_columns = True
+                    added += col.nbytes() + sys.getsizeof(metric) + 16
+                added += col.append(value)
+            self.rows.append(sample)
+            if new_columns or len(res) != len(schema):
+                for col in schema.values():
+                    if len(col) == nrows:
+                        added += col.append_missing()
+            self.nbytes += added
+        return added
+
+    def to_dict(self, labels):
+        """
+        @params labels: list
+            timestamp str of every sample index
+
+        @return dict
+            {"timestamps": [str, ...], "metrics": {metric: [value, ...]}},
+            with "pids": [int, ...] for stores of /proc/<pid>/ files
+        """
+        with self.lock:
+            res = {
+                global_vars.timestamps: [labels[i] for i in self.rows],
+                "metrics": {
+                    metric: col.to_list() for metric, col in self.schema.items()
+                },
+            }
+            if self.pids is not None:
+                res["pids"] = self.pids.tolist()
+            return res
+
+
+class metric_block:
+    """
+    int64 matrix parsed from a single file, ex: per cpu fields of
+    /proc/stat, appended to the store as is instead of a {metric: value}.
+
+    values : np.ndarray of rows x columns
+    labels : (row labels, column labels), same tuples for every sample of
+             a source, metric of values[i, j] is "<row label> <column label>"
+    """
+
+    __slots__ = ("values", "labels")
+
+    def __init__(self, values, labels):
+        self.values = values
+        self.labels = labels
+
+
+class block_store:
+    """
+    Samples of a source parsed into metric_block, kept as one samples x
+    rows x columns int64 array grown by doubling. rows[i] is index of the
+    sample (in sample_store) of block i.
+    """
+
+    def __init__(self, labels):
+        self.lock = threading.Lock()
+        self.labels = labels
+        self.rows = array("l")
+        shape = (len(labels[0]), len(labels[1]))
+        self.values = np.empty((4,) + shape, dtype=np.int64)
+        self.nbytes = self.values.nbytes
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["lock"]
+        state["values"] = self.block()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def append(self, sample, block):
+        """
+        @params sample: int
+            index of sample in sample_store
+        @params block: metric_block
+
+        @return int
+            bytes added to the store
+        """
+        if block.labels != self.labels:
+            raise ValueError(f"Labels of block changed from {self.labels}")
+        with self.lock:
+            added = 8
+            count = len(self.rows)
+            if count == len(self.values):
+                values = np.empty(
+                    (2 * count,) + self.values.shape[1:], dtype=np.int64
+                )
+                values[:count] = self.values
+                added += values.nbytes - self.values.nbytes
+                self.values = values
+            self.values[count] = block.values
+            self.rows.append(sample)
+            self.nbytes += added
+        return added
+
+    def block(self):
+        """
+        @return np.ndarray
+            samples x rows x columns values collected so far
+        """
+        return self.values[: len(self.rows)]
+
+    def to_dict(self, labels):
+        """
+        @params labels: list
+            timestamp str of every sample index
+
+        @return dict
+            same as source_store.to_dict, one metric per row and column
+        """
+        with self.lock:
+            values = self.block()
+            metrics = {}
+            for i, row in enumerate(self.labels[0]):
+                for j, column in enumerate(self.labels[1]):
+                    metrics[f"{row} {column}"] = values[:, i, j].tolist()
+            return {
+                global_vars.timestamps: [labels[i] for i in self.rows],
+                "metrics": metrics,
+            }
+
+
+class sample_store:
+    """
+    Columnar in-memory store of one flush segment.
+
+    info holds run details (global_vars) which are not time-series data.
+    Every sample gets an index into the shared timestamp columns
+    (scheduled, start and end time in epoch ns), sources keep only that
+    index per row. Sources parsed into metric_block are kept apart in
+    blocks, /proc/<pid>/ files are kept in pid_sources, one store per file
+    for all pids. In rollup and top processes modes rows of /proc/<pid>/
+    files are held per sample in held until the collector stores them
+    rolled up or reduced to the top processes. Stored rows of the stat
+    file go through identities, new incarnations of reused pids are
+    recorded in pid_starts of info.
+
+    nbytes is an estimate of memory held by the segment, maintained
+    incrementally on every append so checking it for flush is O(1).
+
+    Collection tasks writing into the segment are counted in in_flight,
+    seal() waits for them, after that the segment is read only.
+    """
+
+    def __init__(self, rollup=False, identities=None):
+        """
+        @params rollup: bool
+            hold rows of /proc/<pid>/ files for thread_rollup, top_processes
+        @params identities: pid_identities
+            shared by stores of all segments, None if no pid is collected
+        """
+        self.info = {}
+        self.timestamps = array("q")
+        self.start_times = array("q")
+        self.end_times = array("q")
+        self.sources = {}
+        self.blocks = {}
+        self.pid_sources = {}
+        # sample -> [(source key, pid, {metric: value})]
+        self.held = {} if rollup else None
+        self.identities = identities
+        self.lock = threading.Lock()
+        self.nbytes = 0
+        self.in_flight = 0
+        self.sealed = False
+        self.tasks_done = threading.Condition(self.lock)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["lock"], state["tasks_done"]
+        # of the collector, not of the segment
+        state["identities"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.tasks_done = threading.Condition(self.lock)
+
+    def task_started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def task_done(self):
+        with self.lock:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.tasks_done.notify_all()
+
+    def seal(self):
+        """
+        wait for collection tasks in flight, no rows are added after this
+        """
+        with self.lock:
+            while self.in_flight:
+                self.tasks_done.wait()
+            self.sealed = True
+
+    def add_sample(self, intended_ns, start_ns):
+        """
+        @return int
+            index of the new sample
+        """
+        with self.lock:
+            self.timestamps.append(intended_ns)
+            self.start_times.append(start_ns)
+            self.end_times.append(0)
+            self.nbytes += 24
+            return len(self.timestamps) - 1
+
+    def end_sample(self, sample, end_ns):
+        self.end_times[sample] = end_ns
+
+    def source(self, tag, pids=False):
+        """
+        @params pids: bool
+            tag is the source key of a /proc/<pid>/ file, ex: "p_proc_stat"
+
+        @return source_store
+            store of source tag, created on first use
+        """
+        sources = self.pid_sources if pids else self.sources
+        store = sources.get(tag)
+        if store is None:
+            with self.lock:
+                store = sources.get(tag)
+                if store is None:
+                    store = sources[tag] = source_store(pids)
+                    self.nbytes += sys.getsizeof(tag) + 64
+        return store
+
+    def block_source(self, tag, labels):
+        """
+        @return block_store
+            store of source tag, created on first use
+        """
+        store = self.blocks.get(tag)
+        if store is None:
+            with self.lock:
+                store = self.blocks.get(tag)
+                if store is None:
+                    store = self.blocks[tag] = block_store(labels)
+                    self.nbytes += sys.getsizeof(tag) + 64 + store.nbytes
+        return store
+
+    def append(self, tag, sample, res, pid=None, hold=True):
+        """
+        @params tag: str
+            source tag, source key of the file for /proc/<pid>/ files
+        @params res: dict or metric_block
+            {metric: value, ...} or block parsed from source for this sample
+        @params pid: int
+            pid of /proc/<pid>/ files, None for global sources
+        @params hold: bool
+            hold rows of /proc/<pid>/ files if the store holds them
+        """
+        if pid is not None:
+            if hold and self.held is not None:
+                with self.lock:
+                    self.held.setdefault(sample, []).append((tag, pid, res))
+                return
+            identities = self.identities
+            if identities is not None and tag == identities.source:
+                start = identities.observe(pid, res, self.timestamps[sample])
+                if start is not None:
+                    with self.lock:
+                        self.info.setdefault(global_vars.pid_starts, []).append(
+                            start
+                        )
+            added = self.source(tag, True).append(sample, res, pid)
+        elif type(res) is metric_block:
+            added = self.block_source(tag, res.labels).append(sample, res)
+        else:
+            added = self.source(tag).append(sample, res)
+        with self.lock:
+            self.nbytes += added
+
+    def release(self, sample):
+        """
+        @return list
+            [(source key, pid, {metric: value})] held for sample
+        """
+        with self.lock:
+            return self.held.pop(sample, [])
+
+    def to_dict(self):
+        """
+        @return dict
+            json serializable view of the segment
+        """
+        res = dict(self.info)
+        labels = [ns_to_timestamp(i) for i in self.timestamps]
+        res[global_vars.timestamps] = labels
+        res[global_vars.sample_times] = [
+            list(i) for i in zip(self.timestamps, self.start_times, self.end_times)
+        ]
+        for tag, store in (
+            list(self.sources.items())
+            + list(self.blocks.items())
+            + list(self.pid_sources.items())
+        ):
+            res[tag] = store.to_dict(labels)
+        return res
@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import os
+import json
+import struct
+import numpy as np
+
+# <payload length: u32><record type: u8><json payload>
+record_header = struct.Struct("<IB")
+# <source id: u32><samples: u32><rows: u32><columns: u32> of M records
+block_header = struct.Struct("<IIII")
+
+
+class segment_log_writer:
+    """
+    Append-only, length-prefixed log of flushed segments.
+
+    Records:
+        B : {"segment": counter} begin of a segment
+        I : run info (global_vars) stored in the segment
+        S : [source id, source tag, [metric, ...]] schema of a source,
+            written again with new metrics appended whenever it grows
+        T : [scheduled ns, start ns, end ns] a sample, the R records
+            following it belong to this sample
+        R : [source id, [value, ...]] one sample of a source, values in
+            schema order
+        P : [source id, source key, [metric, ...]] schema of a /proc/<pid>/
+            file shared by all pids, ex: source key "p_proc_stat", written
+            again whenever it grows like S
+        Q : [source id, pid, [value, ...]] one sample of a pid of a P
+            source, follows its T record like R
+        K : [source id, source tag, [row label, ...], [column label, ...]]
+            schema of a source collected as metric_block
+        M : all samples of a block source in the segment, binary payload
+            of block_header, scheduled ns of every sample (int64) and the
+            samples x rows x columns values (int64), little endian
+        E : {"segment": counter, "samples": n} end of a segment
+
+    Samples are written in time order within a segment, so the log can be
+    consumed in a single sequential pass. A truncated record at the tail
+    (ex: tool killed while writing) is ignored by the reader.
+    """
+
+    def __init__(self, path, fsync_segments=0, buffer_size=1 << 20):
+        """
+        @params path: str
+            path of the log file
+        @params fsync_segments: int
+            fsync after every fsync_segments segments, 0 leaves it to the OS
+        """
+        self.path = path
+        self.fsync_segments = fsync_segments
+        self.f = open(path, "ab", buffering=buffer_size)
+        self.schemas = {}
+        self.segments = 0
+        self.bytes_written = 0
+
+    def write_record(self, record_type, payload):
+        if type(payload) is bytes:
+            data = payload
+        else:
+            data = json.dumps(payload, separators=(",", ":")).encode()
+        self.f.write(record_header.pack(len(data), ord(record_type)))
+        self.f.write(data)
+        self.bytes_written += record_header.size + len(data)
+
+    def source_schema(self, tag, source, record_type="S"):
+        """
+        @params tag: str
+            source tag
+        @params source: source_store
+            columns of the source in segment
+        @params record_type: str
+            "S", "P" for sources of /proc/<pid>/ files
+
+        @return (source id, positions)
+            positions[i] is index of i'th column of source in log schema
+        """
+        if tag not in self.schemas:
+            self.schemas[tag] = (len(self.schemas), [], {})
+        source_id, metrics, index = self.schemas[tag]
+        grown = False
+        for metric in source.schema:
+            if metric not in index:
+                index[metric] = len(metrics)
+                metrics.append(metric)
+                grown = True
+        if grown:
+            self.write_record(record_type, [source_id, tag, metrics])
+        return source_id, [index[metric] for metric in source.schema]
+
+    def block_schema(self, tag, block):
+        """
+        @params block: block_store
+
+        @return int
+            source id of block source tag
+        """
+        if tag not in self.schemas:
+            self.schemas[tag] = (len(self.schemas), None, None)
+            self.write_record(
+                "K", [self.schemas[tag][0], tag, *map(list, block.labels)]
+            )
+        return self.schemas[tag][0]
+
+    def write_block(self, tag, block, timestamps):
+        """
+        @params timestamps: np.ndarray
+            scheduled ns of every sample index of the segment
+        """
+        values = block.block()
+        header = block_header.pack(self.block_schema(tag, block), *values.shape)
+        self.write_record(
+            "M",
+            header
+            + timestamps[np.frombuffer(block.rows, dtype="l")]
+            .astype("<i8")
+            .tobytes()
+            + values.astype("<i8").tobytes(),
+        )
+
+    def write_segment(self, counter, store):
+        """
+        @params counter: int
+            flush counter of the segment
+        @params store: sample_store
+            sealed segment
+
+        @return int
+            bytes written for the segment
+        """
+        start_bytes = self.bytes_written
+        self.write_record("B", {"segment": counter})
+        if store.info:
+            self.write_record("I", store.info)
+
+        rows_of_sample = [[] for _ in store.timestamps]
+        sources = [(tag, source, "S") for tag, source in store.sources.items()]
+        sources += [(tag, source, "P") for tag, source in store.pid_sources.items()]
+        for tag, source, record_type in sources:
+            source_id, positions = self.source_schema(tag, source, record_type)
+            width = len(self.schemas[tag][1])
+            columns = list(zip(positions, source.schema.values()))
+            pids = source.pids or [None] * len(source.rows)
+            for row, (sample, pid) in enumerate(zip(source.rows, pids)):
+                rows_of_sample[sample].append((source_id, pid, width, columns, row))
+
+        for sample, rows in enumerate(rows_of_sample):
+            self.write_record(
+                "T",
+                [
+                    store.timestamps[sample],
+                    store.start_times[sample],
+                    store.end_times[sample],
+                ],
+            )
+            for source_id, pid, width, columns, row in rows:
+                values = [None] * width
+                for position, col in columns:
+                    values[position] = col.get(row)
+                if pid is None:
+                    self.write_record("R", [source_id, values])
+                else:
+                    self.write_record("Q", [source_id, pid, values])
+
+        if store.blocks:
+            timestamps = np.frombuffer(store.timestamps, dtype=np.int64)
+            for tag, block in store.blocks.items():
+                self.write_block(tag, block, timestamps)
+
+        self.write_record("E", {"segment": counter, "samples": len(store.timestamps)})
+        self.segments += 1
+        if self.fsync_segments and self.segments % self.fsync_segments == 0:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        return self.bytes_written - start_bytes
+
+    def close(self):
+        self.f.flush()
+        if self.fsync_segments:
+            os.fsync(self.f.fileno())
+        self.f.close()
+
+
+def read_records(fd, start=0, end=None, buffer_size=1 << 16):
+    """
+    @params fd: int
+        file descriptor of segment log, read with pread so many readers
+        can share it
+    @params start, end: int
+        byte range of the log to read, end None reads till end of file
+
+    @return generator
+        (offset, record type, payload bytes) in the order written
+    """
+    if end is None:
+        end = os.fstat(fd).st_size
+    # buf holds bytes of the log from offset base, pos is next record in buf
+    buf, base, pos = b"", start, 0
+    while True:
+        need = record_header.size
+        if len(buf) - pos >= need:
+            length, record_type = record_header.unpack_from(buf, pos)
+            need += length
+        if len(buf) - pos < need:
+            buf, base, pos = buf[pos:], base + pos, 0
+            read_at = base + len(buf)
+            size = min(max(buffer_size, need - len(buf)), end - read_at)
+            if size <= 0:
+                return
+            data = os.pread(fd, size, read_at)
+            if not data:
+                return
+            buf += data
+            continue
+        yield base + pos, chr(record_type), buf[pos + record_header.size : pos + need]
+        pos += need
+
+
+def record_source_id(payload):
+    """
+    @return int
+        source id of R record payload, without parsing the values
+    """
+    return int(payload[1 : payload.index(b",")])
+
+
+def record_pid_key(payload):
+    """
+    @return bytes
+        b"<source id>,<pid>" of Q record payload, without parsing the values
+    """
+    return payload[1 : payload.index(b",[")]
+
+
+def record_pid_source(payload):
+    """
+    @return (int, int)
+        source id and pid of Q record payload, without parsing the values
+    """
+    source_id, pid = record_pid_key(payload).split(b",")
+    return int(source_id), int(pid)
+
+
+def read_block(payload):
+    """
+    @params payload: bytes
+        payload of M record
+
+    @return (source id, np.ndarray, np.ndarray)
+        scheduled ns of every sample and samples x rows x columns values
+    """
+    source_id, samples, rows, columns = block_header.unpack_from(payload)
+    timestamps = np.frombuffer(payload, "<i8", samples, block_header.size)
+    values = np.frombuffer(
+        payload, "<i8", samples * rows * columns, block_header.size + 8 * samples
+    )
+    return source_id, timestamps, values.reshape(samples, rows, columns)
+
+
+def read_segment_log(path):
+    """
+    @params path: str
+        path of segment log
+
+    @return generator
+        (record type, payload) in the order written, M payloads as
+        returned by read_block
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for _, record_type, payload in read_records(fd, buffer_size=1 << 20):
+            if record_type == "M":
+                yield record_type, read_block(payload)
+            else:
+                yield record_type, json.loads(payload)
+    finally:
+        os.close(fd)
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import os
+import time
+import queue
+import pickle
+import threading
+from collections import deque
+from syswit import collector_config as config
+from syswit.segment_log import segment_log_writer
+
+
+class segment_writer:
+    """
+    Single long lived thread which appends sealed flush segments to the
+    segment log (see segment_log) in the log directory.
+
+    Segments are handed off through a bounded queue, so at most
+    queue_size segments wait in memory for the writer. When the queue is
+    full, queue_full_policy decides what the collector does:
+        block : wait for the writer (backpressure on collection)
+        spill : dump the segment as is (pickle, no formatting) to the log
+                directory and let the writer format it once it catches up
+    """
+
+    queue_full_policies = ["block", "spill"]
+
+    def __init__(
+        self, logs_d, queue_size=2, queue_full_policy="block", fsync_segments=0
+    ):
+        if queue_full_policy not in self.queue_full_policies:
+            raise ValueError(f"Unknown queue full policy {queue_full_policy}")
+        self.logs_d = logs_d
+        self.log = segment_log_writer(
+            os.path.join(logs_d, config.segmentlogfilename), fsync_segments
+        )
+        self.queue_full_policy = queue_full_policy
+        self.queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.spilled = deque()
+        self.segments_written = 0
+        self.segments_spilled = 0
+        self.bytes_written = 0
+        self.max_queue_depth = 0
+        self.write_latency_total = 0.0
+        self.write_latency_max = 0.0
+        self.blocked_time = 0.0
+        self.thread = threading.Thread(
+            target=self.run, name="syswit-writer", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, counter, store):
+        """
+        @params counter: int
+            flush counter of the segment
+        @params store: sample_store
+            sealed segment, must not be modified after this call
+        """
+        if not store.sealed:
+            raise ValueError(f"Segment {counter} handed off before being sealed")
+        item = (counter, store)
+        if self.queue_full_policy == "spill":
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.spill(counter, store)
+                return
+        else:
+            start = time.monotonic()
+            self.queue.put(item)
+            self.blocked_time += time.monotonic() - start
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def spill(self, counter, store):
+        path = os.path.join(self.logs_d, f"{config.spillfilename}{counter}.pkl")
+        with open(path, "wb") as f:
+            pickle.dump(store, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled.append((counter, path))
+        self.segments_spilled += 1
+
+    def write(self, counter, store):
+        start = time.monotonic()
+        self.bytes_written += self.log.write_segment(counter, store)
+        latency = time.monotonic() - start
+        self.segments_written += 1
+        self.write_latency_total += latency
+        self.write_latency_max = max(self.write_latency_max, latency)
+
+    def write_spilled(self):
+        while self.spilled:
+            counter, path = self.spilled.popleft()
+            with open(path, "rb") as f:
+                store = pickle.load(f)
+            self.write(counter, store)
+            os.remove(path)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self.write(*item)
+                if self.queue.empty():
+                    self.write_spilled()
+            except Exception as e:
+                print(f"Writer failed for segment {item[0]}: {e}")
+        try:
+            self.write_spilled()
+        except Exception as e:
+            print(f"Writer failed for spilled segments: {e}")
+        self.log.close()
+
+    def close(self):
+        """
+        write all pending segments and stop the writer thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        """
+        @return dict
+            writer metrics, latencies in seconds
+        """
+        written = max(self.segments_written, 1)
+        return {
+            "queue depth": self.queue.qsize(),
+            "max queue depth": self.max_queue_depth,
+            "segments written": self.segments_written,
+            "segments spilled": self.segments_spilled,
+            "bytes written": self.bytes_written,
+            "avg write latency": self.write_latency_total / written,
+            "max write latency": self.write_latency_max,
+            "blocked time": self.blocked_time,
+        }
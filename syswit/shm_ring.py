@@ -0,0 +1,362 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import struct
+from operator import itemgetter
+from multiprocessing import shared_memory
+
+# <consumed seq: u64>, updated by the consumer only
+ring_header = struct.Struct("<Q")
+# <seq: u64><payload length: u32><rows: u32>
+slot_header = struct.Struct("<QII")
+# schema id and pid (-1 for global sources) at start of every row
+row_header = struct.Struct("<Ii")
+
+
+class shm_ring:
+    """
+    Single producer, single consumer ring of preallocated fixed size slots
+    in shared memory, one ring per collection worker.
+
+    The producer fills the next slot and stamps it with its sequence
+    number, then tells the consumer (over a pipe) which sequence numbers
+    to read. The consumer checks the stamp of every slot it reads, a
+    mismatch means the slot was overwritten or never written, and
+    publishes the last consumed sequence in the ring header so the
+    producer never reuses a slot still being read. Memory is bounded by
+    slots * slot_size whatever the run length.
+    """
+
+    def __init__(self, slots, slot_size):
+        """
+        @params slots: int
+            number of slots
+        @params slot_size: int
+            bytes per slot, including slot header
+        """
+        self.slots = max(slots, 1)
+        self.slot_size = max(slot_size, slot_header.size + 64)
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=ring_header.size + self.slots * self.slot_size
+        )
+        self.buf = self.shm.buf
+        ring_header.pack_into(self.buf, 0, 0)
+        # next seq to write, producer side
+        self.write_seq = 0
+        # next seq to read, consumer side
+        self.read_seq = 0
+
+    def slot_offset(self, seq):
+        return ring_header.size + (seq % self.slots) * self.slot_size
+
+    def reserve(self):
+        """
+        producer: next slot if the consumer released it
+
+        @return (payload offset, payload capacity) or None if ring is full
+        """
+        (consumed,) = ring_header.unpack_from(self.buf, 0)
+        if self.write_seq - consumed >= self.slots:
+            return None
+        offset = self.slot_offset(self.write_seq) + slot_header.size
+        return offset, self.slot_size - slot_header.size
+
+    def commit(self, length, rows):
+        """
+        producer: stamp the reserved slot
+
+        @return int
+            seq of the slot
+        """
+        seq = self.write_seq
+        slot_header.pack_into(self.buf, self.slot_offset(seq), seq, length, rows)
+        self.write_seq += 1
+        return seq
+
+    def read(self, seq):
+        """
+        consumer: payload of slot seq, valid until release(seq)
+
+        @return (memoryview, rows) or None if slot isn't stamped with seq
+        """
+        offset = self.slot_offset(seq)
+        stamp, length, rows = slot_header.unpack_from(self.buf, offset)
+        if stamp != seq:
+            return None
+        start = offset + slot_header.size
+        return self.buf[start : start + length], rows
+
+    def release(self, seq):
+        """
+        consumer: slots up to seq can be reused by the producer
+        """
+        self.read_seq = seq + 1
+        ring_header.pack_into(self.buf, 0, self.read_seq)
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class row_schema:
+    """
+    Layout of rows of a source with given metrics and value types.
+
+    fixed : struct of <schema id: u32><pid: i32><int64 (uint64 for ints
+            >= 2**63) and float64 values in metric order><length of str
+            values: u32>
+    str values follow the fixed part, utf-8 encoded and "\\0" joined, so a
+    row is decoded with one unpack and one split.
+    """
+
+    def __init__(self, schema_id, tag, metrics, kinds):
+        """
+        @params kinds: str
+            "q", "Q", "d" or "s" per metric
+        """
+        self.id = schema_id
+        self.tag = tag
+        self.metrics = metrics
+        self.kinds = kinds
+        numbers = [i for i, kind in enumerate(kinds) if kind != "s"]
+        strings = [i for i, kind in enumerate(kinds) if kind == "s"]
+        self.fixed = struct.Struct(
+            "<Ii" + "".join(kind for kind in kinds if kind != "s") + "I"
+        )
+        self.numbers = self.getter(numbers)
+        self.strings = self.getter(strings) if strings else None
+        # positions in numbers + strings back to metric order
+        order = numbers + strings
+        if order == list(range(len(kinds))):
+            self.order = None
+        else:
+            self.order = self.getter(sorted(range(len(order)), key=order.__getitem__))
+
+    @staticmethod
+    def getter(positions):
+        """
+        @return function
+            values -> tuple of values at positions
+        """
+        if len(positions) == 1:
+            position = positions[0]
+            return lambda values: (values[position],)
+        if not positions:
+            return lambda values: ()
+        return itemgetter(*positions)
+
+
+class row_encoder:
+    """
+    Producer side of sample rows through a shm_ring.
+
+    A row is (source tag, pid, {metric: value}), pid is None for global
+    sources. Rows of a source keep the same metrics and value types from
+    sample to sample, so a row_schema is sent to the consumer once and
+    rows carry only its id, the pid and the values. Schemas of /proc/<pid>/
+    files are shared by all pids with the same metrics. Rows with values
+    other than int64, float and str, rows which are not a dict
+    (metric_block) or not fitting in a slot are returned to be sent
+    otherwise.
+    """
+
+    kind_codes = {int: "q", float: "d", str: "s"}
+
+    def __init__(self, ring):
+        self.ring = ring
+        # (tag, kinds, metrics) -> row_schema
+        self.schemas = {}
+        # (tag, pid) -> (types, metrics, row_schema) of last row of tag
+        self.last = {}
+        self.rows = 0
+        self.spilled = 0
+
+    def schema(self, tag, pid, res, types, new_schemas, values=None):
+        """
+        @params values: list
+            values of the row, given when its ints don't all fit in int64,
+            ints >= 2**63 (ex: RLIM_INFINITY) are then sent as uint64
+
+        @return row_schema
+            None if a value type is not supported
+        """
+        metrics = list(res)
+        last = self.last.get((tag, pid))
+        if (
+            values is None
+            and last is not None
+            and last[0] == types
+            and last[1] == metrics
+        ):
+            return last[2]
+        try:
+            if values is None:
+                kinds = "".join(self.kind_codes[i] for i in types)
+            else:
+                kinds = "".join(
+                    "Q" if type(i) is int and i >= 2**63 else self.kind_codes[type(i)]
+                    for i in values
+                )
+        except KeyError:
+            return None
+        key = (tag, kinds, tuple(metrics))
+        schema = self.schemas.get(key)
+        if schema is None:
+            schema = row_schema(len(self.schemas), tag, metrics, kinds)
+            self.schemas[key] = schema
+            new_schemas.append((schema.id, tag, metrics, kinds))
+        self.last[(tag, pid)] = (types, metrics, schema)
+        return schema
+
+    def pack(self, tag, pid, res, new_schemas, wide=False):
+        """
+        @params wide: bool
+            ints >= 2**63 are packed as uint64
+
+        @return (row_schema, numbers, str bytes) or None if not supported
+        """
+        if type(res) is not dict:
+            return None
+        values = list(res.values())
+        schema = self.schema(
+            tag,
+            pid,
+            res,
+            tuple(map(type, values)),
+            new_schemas,
+            values if wide else None,
+        )
+        if schema is None:
+            return None
+        data = b""
+        if schema.strings is not None:
+            strings = schema.strings(values)
+            joined = "\0".join(strings)
+            if joined.count("\0") != len(strings) - 1:
+                return None
+            data = joined.encode("utf-8", "surrogatepass")
+        return schema, schema.numbers(values), data
+
+    def encode(self, rows):
+        """
+        @params rows: list
+            [(source tag, pid, {metric: value}), ...] of a sample
+
+        @return (new schemas, seqs, spilled rows)
+            schemas to send before reading slots seqs, rows not in ring
+        """
+        new_schemas, seqs, spilled = [], [], []
+        ring, buf = self.ring, self.ring.buf
+        slot = ring.reserve()
+        used, count = 0, 0
+        for tag, pid, res in rows:
+            packed = None if slot is None else self.pack(tag, pid, res, new_schemas)
+            if packed is None:
+                spilled.append((tag, pid, res))
+                continue
+            row_pid = -1 if pid is None else pid
+            schema, numbers, data = packed
+            size = schema.fixed.size + len(data)
+            if used + size > slot[1] and count:
+                seqs.append(ring.commit(used, count))
+                slot = ring.reserve()
+                used, count = 0, 0
+                if slot is None:
+                    spilled.append((tag, pid, res))
+                    continue
+            if used + size > slot[1]:
+                spilled.append((tag, pid, res))
+                continue
+            position = slot[0] + used
+            try:
+                schema.fixed.pack_into(
+                    buf, position, schema.id, row_pid, *numbers, len(data)
+                )
+            except struct.error:
+                # int not in int64 range, same size once packed as uint64
+                schema, numbers, _ = self.pack(tag, pid, res, new_schemas, wide=True)
+                try:
+                    schema.fixed.pack_into(
+                        buf, position, schema.id, row_pid, *numbers, len(data)
+                    )
+                except struct.error:
+                    spilled.append((tag, pid, res))
+                    continue
+            position += schema.fixed.size
+            buf[position : position + len(data)] = data
+            used += size
+            count += 1
+        if count:
+            seqs.append(ring.commit(used, count))
+        self.rows += len(rows) - len(spilled)
+        self.spilled += len(spilled)
+        return new_schemas, seqs, spilled
+
+
+class row_decoder:
+    """
+    Consumer side of sample rows through a shm_ring, appends rows straight
+    from shared memory into the sample store.
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        # schema id -> row_schema
+        self.schemas = {}
+        self.rows = 0
+        self.seq_errors = 0
+
+    def add_schemas(self, new_schemas):
+        for schema_id, tag, metrics, kinds in new_schemas:
+            self.schemas[schema_id] = row_schema(schema_id, tag, metrics, kinds)
+
+    def decode(self, seqs, store, sample):
+        """
+        @params seqs: list
+            slots holding rows of the sample
+        @params store: sample_store
+            store of flush segment the sample belongs to
+        @params sample: int
+            index of sample in store
+        """
+        ring, schemas = self.ring, self.schemas
+        for seq in seqs:
+            slot = ring.read(seq)
+            if slot is None:
+                # overwritten or never written, the rows are lost
+                self.seq_errors += 1
+                ring.release(seq)
+                continue
+            payload, rows = slot
+            position = 0
+            try:
+                for _ in range(rows):
+                    schema_id, pid = row_header.unpack_from(payload, position)
+                    schema = schemas[schema_id]
+                    values = schema.fixed.unpack_from(payload, position)
+                    position += schema.fixed.size
+                    if schema.strings is not None:
+                        end = position + values[-1]
+                        strings = str(payload[position:end], "utf-8", "surrogatepass")
+                        values = values[2:-1] + tuple(strings.split("\0"))
+                        position = end
+                    else:
+                        values = values[2:-1]
+                    if schema.order is not None:
+                        values = schema.order(values)
+                    store.append(
+                        schema.tag,
+                        sample,
+                        dict(zip(schema.metrics, values)),
+                        None if pid < 0 else pid,
+                    )
+                self.rows += rows
+            finally:
+                payload.release()
+                ring.release(seq)
@@ -0,0 +1,444 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: MIT License
+# Copyright (C) 2024 Advanced Micro Devices, Inc.
+#
+# Author: Ayush Jain <ayush.jain3@amd.com>
+
+
+import heapq
+from syswit.utils import tag_total_proc_file
+from syswit import collector_config as config
+
+
+def is_number(value):
+    return type(value) is int or type(value) is float
+
+
+def group_rows(rows, tgids):
+    """
+    @params rows: list
+        [(source key, pid, {metric: value})] of a sample
+    @params tgids: dict
+        tid -> tgid, pids not in it are processes
+
+    @return dict
+        source key -> tgid -> [(pid, {metric: value})]
+    """
+    files = {}
+    for tag, pid, res in rows:
+        processes = files.get(tag)
+        if processes is None:
+            processes = files[tag] = {}
+        tgid = tgids.get(pid, pid)
+        threads = processes.get(tgid)
+        if threads is None:
+            processes[tgid] = [(pid, res)]
+        else:
+            threads.append((pid, res))
+    return files
+
+
+def total_tag(total, tag):
+    """
+    @params total: str
+        config.identifier_workload or config.identifier_other
+    @params tag: str
+        source key, ex: "p_proc_stat"
+
+    @return str
+        ex: "workload_proc_stat"
+    """
+    return tag_total_proc_file(
+        total, config.identifier_pid_proc_files, "_".join(tag.split("_")[2:])
+    )
+
+
+class thread_rollup:
+    """
+    Rolls the rows of /proc/<tid>/ files of a sample up to their process
+    and to the whole workload at collection time, so stored rows scale
+    with processes, not threads.
+
+    Rows of the threads of a process (same tgid, from process_tree) become
+    one row stored under the tgid. Metrics declared per_thread in
+    metric_schema.yaml are summed over the threads (counters) or take the
+    max (gauges). Other metrics are the same for all threads of a process
+    (ex: cpu times and faults of /proc/<tid>/stat, memory) and are taken
+    from the thread group leader. Process rows are then added up in a
+    "workload_proc_<file>" source: additive gauges are summed, counters
+    accumulate the increase of every process (pid, start time) since its
+    previous sample, so they keep counting up when processes exit.
+
+    Raw rows of the top_threads threads ranked highest by rank_metric
+    (cumulative cpu time by default) are kept under their tid, no thread
+    rows are kept if the rank metric isn't collected. The leader's own row
+    is part of its process row.
+    """
+
+    def __init__(
+        self,
+        schema,
+        tracker,
+        top_threads=config.top_threads,
+        rank_metric=config.thread_rank_metric,
+    ):
+        """
+        @params schema: metric_schema
+        @params tracker: process_tree
+            tgids of tracked threads
+        @params top_threads: int
+            threads kept raw per sample, 0 keeps none
+        @params rank_metric: tuple
+            (source key, metric) threads are ranked by
+        """
+        self.schema = schema
+        self.tracker = tracker
+        self.top_threads = max(top_threads, 0)
+        self.rank_metric = rank_metric
+        # source key -> {metric: "sum", "max" or None} combining threads
+        self.thread_ops = {}
+        # source key -> {metric: (name in workload total, kind) or None}
+        self.workload_names = {}
+        # source key -> {(tgid, start time): process row of previous sample}
+        self.last = {}
+        # source key -> {workload counter: increase accumulated}
+        self.counters = {}
+        # source key -> workload source tag
+        self.workload_tags = {}
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def thread_op(self, source, metric):
+        """
+        @params source: source_schema
+
+        @return str
+            "sum" or "max", None to keep the value of the leader
+        """
+        if not source.per_thread(metric):
+            return None
+        kind = source.kind(metric)
+        if kind == "counter":
+            return "sum"
+        if kind == "gauge":
+            return "max"
+        return None
+
+    def workload_name(self, source, metric):
+        kind = source.kind(metric)
+        if kind == "counter" or (kind == "gauge" and source.additive(metric)):
+            return (config.identifier_workload + " " + metric, kind)
+        return None
+
+    def workload_tag(self, tag):
+        workload_tag = self.workload_tags.get(tag)
+        if workload_tag is None:
+            workload_tag = self.workload_tags[tag] = total_tag(
+                config.identifier_workload, tag
+            )
+        return workload_tag
+
+    def combine(self, tag, tgid, threads):
+        """
+        @params tag: str
+            source key of the rows
+        @params threads: list
+            [(tid, {metric: value})] of a process
+
+        @return dict
+            row of the process
+        """
+        if len(threads) == 1:
+            return threads[0][1]
+        source = self.schema.source(tag)
+        ops = self.thread_ops.setdefault(tag, {})
+        leader = threads[0][1]
+        for tid, res in threads:
+            if tid == tgid:
+                leader = res
+                break
+        combined = dict(leader)
+        for _, res in threads:
+            if res is leader:
+                continue
+            for metric, value in res.items():
+                op = ops.get(metric, False)
+                if op is False:
+                    op = ops[metric] = self.thread_op(source, metric)
+                if op is None or not is_number(value):
+                    continue
+                current = combined.get(metric)
+                if not is_number(current):
+                    combined[metric] = value
+                elif op == "sum":
+                    combined[metric] = current + value
+                elif value > current:
+                    combined[metric] = value
+        return combined
+
+    def add_up(self, res, last, totals, counters, names, source):
+        """
+        add additive gauges of a process row to totals, and increases of
+        its counters since last to counters
+
+        @params last: dict
+            row of the process in the previous sample, None if new
+        """
+        for metric, value in res.items():
+            name = names.get(metric, False)
+            if name is False:
+                name = names[metric] = self.workload_name(source, metric)
+            if name is None or not is_number(value):
+                continue
+            name, kind = name
+            if kind == "counter":
+                previous = None if last is None else last.get(metric)
+                # whole value for new processes, or a counter restarted
+                if is_number(previous) and value >= previous:
+                    value -= previous
+                counters[name] = counters.get(name, 0) + value
+            else:
+                totals[name] = totals.get(name, 0) + value
+
+    def top(self, processes):
+        """
+        @params processes: dict
+            tgid -> [(tid, {metric: value})] of the rank source
+
+        @return set
+            tids of threads kept raw, never a leader
+        """
+        if not self.top_threads or not processes:
+            return set()
+        metric = self.rank_metric[1]
+        ranked = []
+        for tgid, threads in processes.items():
+            for tid, res in threads:
+                value = res.get(metric)
+                if tid != tgid and is_number(value):
+                    ranked.append((value, tid))
+        return {tid for _, tid in heapq.nlargest(self.top_threads, ranked)}
+
+    def starts(self, files):
+        """
+        @params files: dict
+            grouped rows of a sample, from group_rows
+
+        @return dict
+            tgid -> start time of its leader, empty if not collected
+        """
+        source, metric = config.pid_start_metric
+        starts = {}
+        for tgid, threads in files.get(source, {}).items():
+            for tid, res in threads:
+                if tid == tgid:
+                    starts[tgid] = res.get(metric)
+                    break
+        return starts
+
+    def roll_up(self, rows):
+        """
+        @params rows: list
+            [(source key, pid, {metric: value})] held for a complete sample
+
+        @return (list, list)
+            rows of processes and kept threads, in the same form, and
+            workload totals as [(source tag, {metric: value})]
+        """
+        files = group_rows(rows, self.tracker.tgids)
+        kept = self.top(files.get(self.rank_metric[0]))
+        starts = self.starts(files)
+        res, totals = [], []
+        for tag, processes in files.items():
+            source = self.schema.source(tag)
+            names = self.workload_names.setdefault(tag, {})
+            counters = self.counters.setdefault(tag, {})
+            last, current = self.last.get(tag, {}), {}
+            workload = {}
+            for tgid, threads in processes.items():
+                row = self.combine(tag, tgid, threads)
+                res.append((tag, tgid, row))
+                key = (tgid, starts.get(tgid))
+                self.add_up(row, last.get(key), workload, counters, names, source)
+                current[key] = row
+                if kept:
+                    for tid, thread in threads:
+                        if tid in kept:
+                            res.append((tag, tid, thread))
+            self.last[tag] = current
+            workload.update(counters)
+            if workload:
+                totals.append((self.workload_tag(tag), workload))
+        self.rows_in += len(rows)
+        self.rows_out += len(res) + len(totals)
+        return res, totals
+
+    def stats(self):
+        return {
+            "top threads": self.top_threads,
+            "rows collected": self.rows_in,
+            "rows stored": self.rows_out,
+        }
+
+
+class top_processes:
+    """
+    Keeps the rows of the top processes of every sample only, so rows
+    stored per sample are bounded by top whatever the workload forks.
+
+    Processes (threads go with their tgid) are ranked by rank_by, one of
+    config.process_rank_keys: the increase since the previous sample for
+    counters (ex: cpu ticks), the value for gauges (ex: RSS). Processes
+    out of the top are rolled up as thread_rollup does and folded in one
+    "other_proc_<file>" row per file: "other processes" counts them,
+    additive gauges are summed and counters accumulate the increase of
+    the folded processes, so they keep counting up as processes move in
+    and out of the top or exit.
+    """
+
+    def __init__(
+        self,
+        rollup,
+        top=config.top_processes,
+        rank_by=config.rank_by,
+        rolled_up=False,
+    ):
+        """
+        @params rollup: thread_rollup
+            combines the threads of processes folded in other
+        @params top: int
+            processes kept per sample
+        @params rank_by: str
+            key of config.process_rank_keys
+        @params rolled_up: bool
+            rows are the output of rollup.roll_up, rows of tgids are
+            process rows already
+        """
+        self.rollup = rollup
+        self.schema = rollup.schema
+        self.top = max(top, 1)
+        self.rank_by = rank_by
+        self.rank_source, self.rank_metrics = config.process_rank_keys[rank_by]
+        self.rank_counter = (
+            self.schema.source(self.rank_source).kind(self.rank_metrics[0])
+            == "counter"
+        )
+        self.rolled_up = rolled_up
+        # (source key, tgid) -> process row of previous sample
+        self.last = {}
+        # source key -> {metric: ("other <metric>", kind) or None}
+        self.other_names = {}
+        # source key -> {"other <counter>": increase accumulated}
+        self.counters = {}
+        self.other_tags = {}
+        self.samples = 0
+        self.processes_ranked = 0
+        self.processes_folded = 0
+
+    def process_row(self, tag, tgid, threads):
+        if self.rolled_up:
+            for pid, res in threads:
+                if pid == tgid:
+                    return res
+        return self.rollup.combine(tag, tgid, threads)
+
+    def increase(self, value, last):
+        """
+        @return increase of a counter since the previous sample, the whole
+            value if the process is new (or its counter restarted, pid
+            reused), 0 for processes found on the first sample
+        """
+        if is_number(last) and value >= last:
+            return value - last
+        return value if self.samples else 0
+
+    def rank(self, tgid, row):
+        value = 0
+        for metric in self.rank_metrics:
+            number = row.get(metric)
+            if not is_number(number):
+                continue
+            if self.rank_counter:
+                last = self.last.get((self.rank_source, tgid))
+                number = self.increase(
+                    number, None if last is None else last.get(metric)
+                )
+            value += number
+        return value
+
+    def fold(self, tag, tgid, row, other):
+        """
+        add a process row to the other row of its file
+        """
+        names = self.other_names.setdefault(tag, {})
+        counters = self.counters.setdefault(tag, {})
+        source = self.schema.source(tag)
+        last = self.last.get((tag, tgid))
+        for metric, value in row.items():
+            name = names.get(metric, False)
+            if name is False:
+                kind = source.kind(metric)
+                name = None
+                if kind == "counter" or (kind == "gauge" and source.additive(metric)):
+                    name = (config.identifier_other + " " + metric, kind)
+                names[metric] = name
+            if name is None or not is_number(value):
+                continue
+            if name[1] == "counter":
+                increase = self.increase(
+                    value, None if last is None else last.get(metric)
+                )
+                counters[name[0]] = counters.get(name[0], 0) + increase
+            else:
+                other[name[0]] = other.get(name[0], 0) + value
+
+    def select(self, rows):
+        """
+        @params rows: list
+            [(source key, pid, {metric: value})] of a complete sample
+
+        @return (list, list)
+            rows of the top processes in the same form, and other rows as
+            [(source tag, {metric: value})]
+        """
+        files = group_rows(rows, self.rollup.tracker.tgids)
+        processes = {}
+        for tag, groups in files.items():
+            for tgid, threads in groups.items():
+                processes[(tag, tgid)] = self.process_row(tag, tgid, threads)
+        ranked = [
+            (self.rank(tgid, row), -tgid)
+            for (tag, tgid), row in processes.items()
+            if tag == self.rank_source
+        ]
+        top = {-tgid for _, tgid in heapq.nlargest(self.top, ranked)}
+        kept, others = [], []
+        for tag, groups in files.items():
+            other, folded = {}, 0
+            for tgid, threads in groups.items():
+                if tgid in top:
+                    kept.extend((tag, pid, res) for pid, res in threads)
+                else:
+                    self.fold(tag, tgid, processes[(tag, tgid)], other)
+                    folded += 1
+            other.update(self.counters.get(tag, {}))
+            other[config.identifier_other + " processes"] = folded
+            other_tag = self.other_tags.get(tag)
+            if other_tag is None:
+                other_tag = self.other_tags[tag] = total_tag(
+                    config.identifier_other, tag
+                )
+            others.append((other_tag, other))
+            self.processes_folded += folded
+        self.last = processes
+        self.samples += 1
+        self.processes_ranked += len(ranked)
+        return kept, others
+
+    def stats(self):
+        return {
+            "top processes": self.top,
+            "rank by": self.rank_by,
+            "processes ranked": self.processes_ranked,
+            "processes folded": self.processes_folded,
+        }
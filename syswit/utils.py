@@ -26,6 +26,21 @@ def lscpu():
     return res
 
 
+def possible_cpu_count():
+    """
+    @return int
+        highest possible cpu id + 1 (/sys/devices/system/cpu/possible, ex:
+        "0-127" or "0-3,8-11"), offline cpus included, os.cpu_count() if
+        not readable
+    """
+    try:
+        with open("/sys/devices/system/cpu/possible") as f:
+            ranges = f.read().strip()
+        return max(int(i.split("-")[-1]) for i in ranges.split(",")) + 1
+    except (OSError, ValueError):
+        return os.cpu_count()
+
+
 def run_cmd_and_get_pid(cmd):
     """
     Run command and return with a valid pid
@@ -67,6 +82,12 @@ def timestamp_to_seconds(timestamp):
     return datetime.strptime(timestamp, config.timestamps_style).timestamp()
 
 
+def ns_to_timestamp(epoch_ns):
+    from syswit import collector_config as config
+
+    return ds.datetime.fromtimestamp(epoch_ns / 1e9).strftime(config.timestamps_style)
+
+
 def get_current_time():
     from syswit import collector_config as config
 
@@ -188,12 +209,48 @@ def tag_pid_proc_file(prepend, pid, file_name):
     return str(pid) + "_" + prepend + "_" + file_name
 
 
+def pid_series_id(pid, start_time=None):
+    """
+    id of a process in tags and metric names of results, "<pid>", or
+    "<pid>-<start time>" for every process of a pid reused during the run
+    """
+    if start_time is None:
+        return str(pid)
+    return f"{pid}-{start_time}"
+
+
+def check_pid_series_id(series):
+    pid, separator, start_time = series.partition("-")
+    return pid.isdigit() and (not separator or start_time.isdigit())
+
+
 def check_path_pid_proc_file_tag(key):
     from syswit import collector_config as config
 
     tmp = key.split("_")
     if len(tmp) == 3:
-        if tmp[0].isdigit() and config.identifier_pid_proc_files in tmp[1]:
+        if check_pid_series_id(tmp[0]) and config.identifier_pid_proc_files in tmp[1]:
+            return True
+    return False
+
+
+def tag_total_proc_file(total, prepend, file_name):
+    return total + "_" + prepend + "_" + file_name
+
+
+def check_total_proc_file_tag(key):
+    """
+    True for totals of /proc/<pid>/ files, ex: "workload_proc_stat",
+    "other_proc_stat"
+    """
+    from syswit import collector_config as config
+
+    tmp = key.split("_")
+    if len(tmp) == 3:
+        if (
+            tmp[0] in (config.identifier_workload, config.identifier_other)
+            and config.identifier_pid_proc_files in tmp[1]
+        ):
             return True
     return False
 